@@ -0,0 +1,63 @@
+import argparse
+import io
+import time
+import pandas as pd
+from benchmarks.common import throwaway_schema
+from etl_scripts.validate_data import clean_chunk, create_staging_table_with_indexes, staging_copy_sql, READ_DTYPES
+from etl_scripts.staging_partitions import (
+    create_partitioned_staging_table, start_staging_batch, start_bulk_staging_batch, finish_bulk_staging_batch
+)
+
+def cleaned_payload(input_path, rows):
+    """Return COPY-ready text for `rows` cleaned rows, repeating the sample feed as needed."""
+    sample = clean_chunk(pd.read_csv(input_path, delimiter='|', dtype=READ_DTYPES))
+    repeated = pd.concat([sample] * (rows // len(sample) + 1), ignore_index=True).head(rows)
+    return repeated.to_csv(sep='|', index=False, header=False).encode()
+
+def load_regular(conn, payload):
+    # Today's path: COPY into the logged staging table with its indexes in place
+    create_staging_table_with_indexes(conn)
+    conn.cursor().copy_expert(staging_copy_sql('staging'), io.BytesIO(payload))
+    conn.commit()
+
+def load_partitioned(conn, payload):
+    create_partitioned_staging_table(conn)
+    _, table_name = start_staging_batch(conn, 'bench')
+    conn.cursor().copy_expert(staging_copy_sql(table_name), io.BytesIO(payload))
+    conn.commit()
+
+def load_bulk(mode):
+    def load(conn, payload):
+        create_partitioned_staging_table(conn)
+        batch_id, table_name = start_bulk_staging_batch(conn, 'bench')
+        conn.cursor().copy_expert(staging_copy_sql(table_name), io.BytesIO(payload))
+        conn.commit()
+        finish_bulk_staging_batch(conn, batch_id, mode)
+    return load
+
+MODES = {
+    "regular": load_regular,
+    "partitioned": load_partitioned,
+    "bulk-logged": load_bulk("logged"),
+    "bulk-unlogged": load_bulk("unlogged"),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare staging load throughput with and without bulk-load mode.")
+    parser.add_argument("--input", default="data/customer_data.txt")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    payload = cleaned_payload(args.input, args.rows)
+    for name, load in MODES.items():
+        timings = []
+        for _ in range(args.repeat):
+            with throwaway_schema() as conn:
+                start = time.perf_counter()
+                load(conn, payload)
+                timings.append(time.perf_counter() - start)
+        print(f"{name}: {args.rows / min(timings):,.0f} rows/s (best of {args.repeat})")
+
+if __name__ == "__main__":
+    main()
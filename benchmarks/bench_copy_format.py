@@ -0,0 +1,61 @@
+import argparse
+import io
+import time
+import pandas as pd
+from benchmarks.common import throwaway_schema
+from etl_scripts.binary_copy import wrap_binary_copy
+from etl_scripts.validate_data import (
+    clean_chunk, create_staging_table_with_indexes, encode_staging_rows, staging_copy_sql, READ_DTYPES
+)
+
+def cleaned_frame(input_path, rows):
+    """Return `rows` cleaned rows, repeating the sample feed as needed."""
+    sample = clean_chunk(pd.read_csv(input_path, delimiter='|', dtype=READ_DTYPES))
+    return pd.concat([sample] * (rows // len(sample) + 1), ignore_index=True).head(rows)
+
+def encode(df, copy_format):
+    # Client side: the work stream_data_to_staging does per chunk
+    if copy_format == "binary":
+        return wrap_binary_copy(encode_staging_rows(df, copy_format))
+    return encode_staging_rows(df, copy_format).encode("utf-8")
+
+def load(conn, payload, copy_format):
+    # Server side: COPY parses the text, or only checks the binary fields
+    create_staging_table_with_indexes(conn)
+    conn.cursor().copy_expert(staging_copy_sql('staging', copy_format=copy_format), io.BytesIO(payload))
+    conn.commit()
+
+def best_of(repeat, run):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare text and binary COPY for staging loads.")
+    parser.add_argument("--input", default="data/customer_data.txt")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = cleaned_frame(args.input, args.rows)
+    for copy_format in ("csv", "binary"):
+        encode_seconds = best_of(args.repeat, lambda: encode(df, copy_format))
+        payload = encode(df, copy_format)
+
+        copy_timings = []
+        for _ in range(args.repeat):
+            with throwaway_schema() as conn:
+                start = time.perf_counter()
+                load(conn, payload, copy_format)
+                copy_timings.append(time.perf_counter() - start)
+        copy_seconds = min(copy_timings)
+
+        print(f"{copy_format}: encode {encode_seconds:.2f}s, COPY {copy_seconds:.2f}s, "
+              f"{len(payload) / args.rows:.1f} bytes/row, "
+              f"{args.rows / (encode_seconds + copy_seconds):,.0f} rows/s end to end (best of {args.repeat})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from etl_scripts.date_parsing import parse_fixed_width_dates, YYYYMMDD, DDMMYYYY
+
+def make_dates(rows, layout, invalid_rate, seed):
+    """Generate fixed-width date strings with a share of impossible dates and junk values."""
+    rng = np.random.default_rng(seed)
+    days = rng.integers(np.datetime64("1940-01-01").astype(int), np.datetime64("2024-12-31").astype(int), rows)
+    dates = pd.Series(days.astype("datetime64[D]"))
+    values = dates.dt.strftime("%Y%m%d" if layout == YYYYMMDD else "%d%m%Y").astype(object)
+
+    # Replace a share of the rows with impossible dates, short values and blanks
+    bad = rng.random(rows) < invalid_rate
+    junk = np.array(["20230230", "256", "", "abcdefgh", "99999999"], dtype=object)
+    values[bad] = rng.choice(junk, bad.sum())
+    return values.where(values != "", None)
+
+def legacy_parse(values, layout):
+    """The column-wise slice + DataFrame.apply parsing used before the vectorized parser."""
+    frame = pd.DataFrame({"date": values})
+    if layout == DDMMYYYY:
+        frame["date"] = frame["date"].str.slice(4, 8) + frame["date"].str.slice(2, 4) + frame["date"].str.slice(0, 2)
+    return frame[["date"]].apply(pd.to_datetime, format="%Y%m%d", errors="coerce")["date"]
+
+def best_of(repeat, func, *args):
+    """Return the best wall time of several runs, in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare legacy and vectorized date parsing.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--invalid-rate", type=float, default=0.01)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    for layout in (YYYYMMDD, DDMMYYYY):
+        values = make_dates(args.rows, layout, args.invalid_rate, args.seed)
+
+        # Both implementations must agree before their timings mean anything
+        legacy = legacy_parse(values, layout).to_numpy(dtype="datetime64[ns]")
+        vectorized, _ = parse_fixed_width_dates(values, layout)
+        if not np.array_equal(legacy, vectorized, equal_nan=True):
+            raise AssertionError(f"Parsers disagree for {layout}")
+
+        legacy_time = best_of(args.repeat, legacy_parse, values, layout)
+        vectorized_time = best_of(args.repeat, parse_fixed_width_dates, values, layout)
+        print(f"{layout}: legacy {args.rows / legacy_time:,.0f} rows/s, "
+              f"vectorized {args.rows / vectorized_time:,.0f} rows/s "
+              f"({legacy_time / vectorized_time:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+import psycopg2
+from benchmarks.common import throwaway_schema
+from benchmarks.generate_data import generate_customer_file, row_count
+from etl_scripts.copy_stream import COPY_READ_SIZE
+from etl_scripts.load_data import LOAD_ENGINES, fill_country_tables, load_customer_current_country
+from etl_scripts.validate_data import (
+    preprocess_data, copy_data_to_staging, stream_data_to_staging, create_staging_table_with_indexes,
+    prepare_load_tables
+)
+
+# Directory the JSON results are written to by default
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Places the results can be sent: a throwaway PostgreSQL schema, or a local sink
+# that only reads the cleaned file (database stages are then skipped)
+SINKS = ("postgres", "null")
+
+def reset_peak_rss():
+    """Reset the kernel's peak-RSS counter for this process, where supported (Linux)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MiB."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if platform.system() == "Darwin" else maxrss / 1024
+
+def measure(results, name, rows, func, *args):
+    """Time one stage, record rows/sec and peak RSS under results[name] and return the stage's result."""
+    resettable = reset_peak_rss()
+    start = time.perf_counter()
+    value = func(*args)
+    seconds = time.perf_counter() - start
+    rows = rows(value) if callable(rows) else rows
+    results[name] = {
+        "seconds": round(seconds, 4),
+        "rows": rows,
+        "rows_per_sec": round(rows / seconds) if seconds else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        # Without a reset the peak covers the whole process up to this stage
+        "peak_rss_scope": "stage" if resettable else "process",
+    }
+    print(f"{name}: {seconds:.2f}s, {results[name]['rows_per_sec'] or 0:,} rows/s, "
+          f"peak RSS {results[name]['peak_rss_mb']:.0f} MiB")
+    return value
+
+@contextmanager
+def working_directory(path):
+    """Run inside path, which gets a data/ folder because preprocess_data writes data/cleaned_customer_data.csv."""
+    os.makedirs(os.path.join(path, "data"), exist_ok=True)
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+def null_copy(cleaned_file_path):
+    """Stand-in for COPY: read the cleaned file the way copy_expert would and count its bytes."""
+    total = 0
+    with open(cleaned_file_path, "rb") as f:
+        while chunk := f.read(COPY_READ_SIZE):
+            total += len(chunk)
+    return total
+
+def run_database_stages(conn, input_path, rows, args, results):
+    """Run every stage against a throwaway PostgreSQL schema."""
+    create_staging_table_with_indexes(conn)
+
+    if args.chunksize:
+        _, loaded, countries = measure(results, "stream_to_staging", rows, stream_data_to_staging,
+                                       conn, input_path, args.chunksize)
+    else:
+        valid_df, cleaned_path, countries = measure(results, "preprocess", rows, preprocess_data, input_path)
+        loaded = len(valid_df)
+        del valid_df
+        measure(results, "copy_to_staging", loaded, copy_data_to_staging, conn, cleaned_path)
+
+    prepare_load_tables(conn, countries, "partitioned" if args.engine == "partitioned" else "tables")
+    conn.cursor().execute("ANALYZE staging")
+    conn.commit()
+    measure(results, "current_country", loaded, load_customer_current_country, conn)
+    measure(results, f"fill_country_tables_{args.engine}", loaded, fill_country_tables, conn, args.engine,
+            date(2024, 6, 30))
+
+def run_null_stages(input_path, rows, args, results):
+    """Run the Python-side stages and send the cleaned rows to a local sink instead of PostgreSQL."""
+    valid_df, cleaned_path, _ = measure(results, "preprocess", rows, preprocess_data, input_path)
+    loaded = len(valid_df)
+    del valid_df
+    measure(results, "copy_to_null_sink", loaded, null_copy, cleaned_path)
+    for stage in ("current_country", f"fill_country_tables_{args.engine}"):
+        results[stage] = {"skipped": "no database with --sink null"}
+
+def git_commit():
+    """Return the current commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline_path, report):
+    """Print each stage's throughput relative to a saved baseline report."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"Compared with {baseline_path} ({(baseline.get('commit') or 'unknown')[:10]}):")
+    for name, stage in report["stages"].items():
+        before = baseline["stages"].get(name, {}).get("rows_per_sec")
+        after = stage.get("rows_per_sec")
+        if before and after:
+            print(f"  {name}: {after / before:.2f}x rows/s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each ETL stage on generated data and save JSON results.")
+    parser.add_argument("--rows", type=row_count, default=100_000, help="Rows to generate, e.g. 1e4 .. 1e8")
+    parser.add_argument("--input", default=None, help="Use an existing feed instead of generating one")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--invalid-rate", type=float, default=0.01)
+    parser.add_argument("--country-skew", type=float, default=1.0)
+    parser.add_argument("--visits-per-customer", type=float, default=2.0)
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Time stream_data_to_staging instead of preprocess_data + copy_data_to_staging")
+    parser.add_argument("--engine", choices=LOAD_ENGINES, default="sql")
+    parser.add_argument("--sink", choices=SINKS, default="postgres")
+    parser.add_argument("--output", default=None, help="JSON results path (default: benchmarks/results/)")
+    parser.add_argument("--compare", default=None, help="Baseline JSON results to compare against")
+    args = parser.parse_args()
+
+    report = {
+        "benchmark": "bench_stages",
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "stages": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="etl_bench_") as tmp_dir:
+        if args.input:
+            input_path = os.path.abspath(args.input)
+            with open(input_path) as f:
+                rows = sum(1 for _ in f) - 1
+        else:
+            input_path = os.path.join(tmp_dir, "customer_data.txt")
+            summary = measure(report["stages"], "generate", args.rows, generate_customer_file, input_path, args.rows,
+                              args.seed, args.invalid_rate, args.country_skew, args.visits_per_customer)
+            report["dataset"] = {key: value for key, value in summary.items() if key != "path"}
+            rows = args.rows
+
+        with working_directory(tmp_dir):
+            if args.sink == "postgres":
+                try:
+                    with throwaway_schema() as conn:
+                        run_database_stages(conn, input_path, rows, args, report["stages"])
+                except psycopg2.OperationalError as e:
+                    parser.exit(1, f"PostgreSQL is not available ({e}); use --sink null to skip the database\n")
+            else:
+                run_null_stages(input_path, rows, args, report["stages"])
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"bench_stages_{rows}_{(report['commit'] or 'nocommit')[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        compare(args.compare, report)
+
+if __name__ == "__main__":
+    main()
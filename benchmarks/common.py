@@ -0,0 +1,22 @@
+import os
+from contextlib import contextmanager
+import psycopg2
+from etl_scripts.validate_data import db_params
+
+@contextmanager
+def throwaway_schema(name=None):
+    """Yield a connection working inside a temporary schema that is dropped afterwards."""
+    conn = psycopg2.connect(**db_params)
+    schema = name or f"etl_bench_{os.getpid()}"
+    cursor = conn.cursor()
+    cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {schema}")
+    cursor.execute(f"SET search_path TO {schema}")
+    conn.commit()
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        conn.cursor().execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        conn.commit()
+        conn.close()
@@ -0,0 +1,147 @@
+import argparse
+import numpy as np
+import pandas as pd
+from data import country_codes, country_map
+
+# Header line of the customer feed
+HEADER = "|H|Customer_Name|Customer_Id|Open_Date|Last_Consulted_Date|Vaccination_Id|Dr_Name|State|Country|DOB|Is_Active\n"
+
+# Value pools for the generated columns
+FIRST_NAMES = np.array(["Alex", "John", "Mathew", "Matt", "Jacob", "Emily", "Emma", "Noah", "Liam", "Lily",
+                        "Olivia", "Ava", "Sophia", "Mia", "Ethan", "Lucas", "Mason", "Amir", "Priya", "Chen"])
+VACCINATION_IDS = np.array(["MVD", "ABC", "XYZ", "PFZ", "MOD"])
+DOCTORS = np.array(["Paul", "Sam", "Ravi", "Anna", "Kim", "Lee"])
+STATES = np.array(["CA", "TN", "WAS", "BOS", "QLD", "FL", "NY", "MH", "VIC", "ON"])
+ACTIVE_FLAGS = np.array(["A", "I"])
+
+# Codes that are not in country_map, like the "NYC" rows of the sample feed
+UNKNOWN_COUNTRIES = np.array(["NYC", "XX"])
+
+# Share of visits made outside the customer's home country, and of visits without a date
+TRAVEL_RATE = 0.1
+MISSING_VISIT_DATE_RATE = 0.05
+UNKNOWN_COUNTRY_RATE = 0.01
+
+# Date ranges, as days since 1970-01-01
+DOB_RANGE = (np.datetime64("1940-01-01").astype(np.int64), np.datetime64("2005-12-31").astype(np.int64))
+OPEN_RANGE = (np.datetime64("2005-01-01").astype(np.int64), np.datetime64("2020-12-31").astype(np.int64))
+VISIT_RANGE = (np.datetime64("2015-01-01").astype(np.int64), np.datetime64("2024-06-30").astype(np.int64))
+
+# Rows generated per block, which bounds the generator's memory
+DEFAULT_BLOCK_ROWS = 1_000_000
+
+def country_weights(codes, skew):
+    """Return Zipf-like sampling weights: the k-th country gets weight k ** -skew (0 is uniform)."""
+    weights = np.arange(1, len(codes) + 1, dtype=np.float64) ** -skew
+    return weights / weights.sum()
+
+def format_dates(days, layout="%Y%m%d"):
+    """Format days since the epoch as fixed-width YYYYMMDD or DDMMYYYY strings."""
+    dates = days.astype("datetime64[D]")
+    years = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+    months = dates.astype("datetime64[M]").astype(np.int64) % 12 + 1
+    days_of_month = (dates - dates.astype("datetime64[M]")).astype(np.int64) + 1
+    if layout == "%Y%m%d":
+        packed = years * 10000 + months * 100 + days_of_month
+    else:
+        packed = days_of_month * 1000000 + months * 10000 + years
+    # Format with a leading 1 and drop it, which zero-pads without a per-value string call
+    text = (packed + 10 ** 8).astype("U9")
+    return text.view("U1").reshape(-1, 9)[:, 1:].copy().view("U8").ravel()
+
+def spread(customers, low, high, salt):
+    """Map customer numbers to stable pseudo-random values in [low, high)."""
+    mixed = (customers.astype(np.uint64) * np.uint64(2654435761) + np.uint64(salt)) % np.uint64(2 ** 32)
+    return low + (mixed.astype(np.int64) * (high - low)) // 2 ** 32
+
+def generate_block(rng, rows, customers, codes, weights, invalid_rate):
+    """Return one block of generated rows as a DataFrame in file column order, plus its invalid-row count."""
+    customer = rng.integers(0, customers, rows)
+
+    # Attributes that belong to the customer stay the same on every visit
+    home = np.searchsorted(np.cumsum(weights), spread(customer, 0, 2 ** 20, 1) / 2 ** 20, side="right")
+    home = np.minimum(home, len(codes) - 1)
+    country = codes[home]
+
+    # Some visits happen abroad or in a country the pipeline does not know
+    travelling = rng.random(rows) < TRAVEL_RATE
+    country[travelling] = rng.choice(codes, travelling.sum(), p=weights)
+    unknown = rng.random(rows) < UNKNOWN_COUNTRY_RATE
+    country[unknown] = rng.choice(UNKNOWN_COUNTRIES, unknown.sum())
+
+    visit_dates = format_dates(rng.integers(*VISIT_RANGE, rows))
+    visit_dates[rng.random(rows) < MISSING_VISIT_DATE_RATE] = ""
+
+    block = pd.DataFrame({
+        "": "",
+        "D": "D",
+        "Customer_Name": FIRST_NAMES[customer % len(FIRST_NAMES)],
+        "Customer_Id": (100000 + customer).astype(str),
+        "Open_Date": format_dates(spread(customer, *OPEN_RANGE, 2)),
+        "Last_Consulted_Date": visit_dates,
+        "Vaccination_Id": rng.choice(VACCINATION_IDS, rows),
+        "Dr_Name": rng.choice(DOCTORS, rows),
+        "State": STATES[spread(customer, 0, len(STATES), 3)],
+        "Country": country,
+        "DOB": format_dates(spread(customer, *DOB_RANGE, 4), "%d%m%Y"),
+        "Is_Active": rng.choice(ACTIVE_FLAGS, rows, p=[0.9, 0.1]),
+    })
+
+    # Invalid rows: a missing name, an overlong id or an impossible open date,
+    # each of which makes the validation stage drop the row
+    invalid = np.flatnonzero(rng.random(rows) < invalid_rate)
+    kind = rng.integers(0, 3, len(invalid))
+    block.loc[invalid[kind == 0], "Customer_Name"] = ""
+    block.loc[invalid[kind == 1], "Customer_Id"] = "9" * 19
+    block.loc[invalid[kind == 2], "Open_Date"] = "20230230"
+    return block, len(invalid)
+
+def generate_customer_file(path, rows, seed=0, invalid_rate=0.01, country_skew=1.0, visits_per_customer=1.0,
+                           block_rows=DEFAULT_BLOCK_ROWS):
+    """Write a customer feed of `rows` |D| rows in the real |H|/|D| format.
+
+    The same seed and parameters always produce the same file. invalid_rate is the
+    share of rows the validation stage must reject, country_skew shapes the Zipf-like
+    country distribution (0 is uniform) and visits_per_customer is the average number
+    of rows per Customer_Id. Rows are generated in blocks, so any size can be written
+    with bounded memory. Returns a dict describing the generated data.
+    """
+    rng = np.random.default_rng(seed)
+    # Countries the pipeline creates tables for, most common first
+    codes = np.array([code for code in country_map if code in country_codes], dtype=object)
+    weights = country_weights(codes, country_skew)
+    customers = max(1, int(rows / visits_per_customer))
+
+    invalid_rows = 0
+    with open(path, "w") as f:
+        f.write(HEADER)
+        for start in range(0, rows, block_rows):
+            block, block_invalid = generate_block(rng, min(block_rows, rows - start), customers, codes, weights,
+                                                  invalid_rate)
+            block.to_csv(f, sep="|", header=False, index=False)
+            invalid_rows += block_invalid
+
+    return {"path": path, "rows": rows, "invalid_rows": invalid_rows, "customers": customers, "seed": seed,
+            "invalid_rate": invalid_rate, "country_skew": country_skew, "visits_per_customer": visits_per_customer}
+
+def row_count(value):
+    """Parse row counts such as 10000, 1e6 or 100_000_000."""
+    return int(float(value))
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic |H|/|D| customer feed.")
+    parser.add_argument("--rows", type=row_count, default=10_000)
+    parser.add_argument("--output", default="customer_data_generated.txt")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--invalid-rate", type=float, default=0.01)
+    parser.add_argument("--country-skew", type=float, default=1.0)
+    parser.add_argument("--visits-per-customer", type=float, default=1.0)
+    args = parser.parse_args()
+
+    summary = generate_customer_file(args.output, args.rows, seed=args.seed, invalid_rate=args.invalid_rate,
+                                     country_skew=args.country_skew, visits_per_customer=args.visits_per_customer)
+    print(f"Wrote {summary['rows']:,} rows ({summary['invalid_rows']:,} invalid, "
+          f"{summary['customers']:,} customers) to {summary['path']}")
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,167 @@
+from .instrumentation import (
+    instrumented_run, 
+    stage, 
+    count, 
+    write_json_report, 
+    write_prometheus_textfile, 
+    InstrumentedConnection
+)
+
+from .binary_copy import (
+    COPY_FORMATS, 
+    encode_binary_rows, 
+    iter_binary_copy
+)
+
+from .validation_rules import (
+    Rule, 
+    RejectWriter, 
+    apply_rules, 
+    VALIDATION_RULES
+)
+
 from .validate_data import (
     get_connection, 
     release_connection, 
     validate_header, 
     preprocess_data, 
+    clean_chunk, 
+    iter_cleaned_chunks, 
     copy_data_to_staging, 
+    stream_data_to_staging, 
+    copy_frame_to_staging, 
     create_staging_table_with_indexes, 
     create_country_tables, 
+    create_country_map_table, 
+    create_watermark_table, 
     create_customer_current_country,
     main as validate_main
 )
 
+from .change_detection import (
+    FingerprintIndex, 
+    create_fingerprint_table, 
+    load_fingerprint_index, 
+    row_fingerprints
+)
+
+from .latest_visits import (
+    LatestVisits, 
+    latest_per_customer
+)
+
+from .staging_partitions import (
+    create_partitioned_staging_table, 
+    start_staging_batch, 
+    start_bulk_staging_batch, 
+    finish_bulk_staging_batch, 
+    rotate_staging_partitions, 
+    BULK_LOAD_MODES
+)
+
+from .customer_partitions import (
+    create_customers_table, 
+    ensure_country_partitions
+)
+
+from .parallel_ingest import (
+    resolve_input_files, 
+    split_byte_ranges, 
+    ingest_files, 
+    main as ingest_main
+)
+
 from .load_data import (
+    LOAD_ENGINES, 
     fill_country_tables, 
+    fill_country_tables_sql, 
+    fill_country_tables_python, 
+    fill_country_tables_streaming, 
+    fill_country_tables_parallel, 
+    fill_customers_table, 
     load_customer_current_country, 
     main as load_main
 )
 
+from .derived_metrics import (
+    derive_metrics, 
+    refresh_derived_metrics
+)
+
+from .country_summary import (
+    update_country_summary, 
+    check_country_summary, 
+    rebuild_country_summary
+)
+
+from .pipeline import (
+    DEFAULT_QUEUE_DEPTH, 
+    run_pipeline, 
+    run_etl_pipeline, 
+    main as pipeline_main
+)
+
 __all__ = [
+    "instrumented_run", 
+    "stage", 
+    "count", 
+    "write_json_report", 
+    "write_prometheus_textfile", 
+    "InstrumentedConnection", 
+    "COPY_FORMATS", 
+    "Rule", 
+    "RejectWriter", 
+    "apply_rules", 
+    "VALIDATION_RULES", 
+    "encode_binary_rows", 
+    "iter_binary_copy", 
     "get_connection", 
     "release_connection", 
     "validate_header", 
     "preprocess_data", 
+    "clean_chunk", 
+    "iter_cleaned_chunks", 
     "copy_data_to_staging", 
+    "stream_data_to_staging", 
+    "copy_frame_to_staging", 
     "create_staging_table_with_indexes",
     "create_country_tables", 
+    "create_country_map_table", 
+    "create_watermark_table", 
     "create_customer_current_country", 
+    "FingerprintIndex", 
+    "create_fingerprint_table", 
+    "load_fingerprint_index", 
+    "row_fingerprints", 
+    "LatestVisits", 
+    "latest_per_customer", 
+    "create_partitioned_staging_table", 
+    "start_staging_batch", 
+    "start_bulk_staging_batch", 
+    "finish_bulk_staging_batch", 
+    "rotate_staging_partitions", 
+    "BULK_LOAD_MODES", 
+    "resolve_input_files", 
+    "split_byte_ranges", 
+    "ingest_files", 
+    "ingest_main", 
+    "create_customers_table", 
+    "ensure_country_partitions", 
     "load_customer_current_country", 
-    "fill_country_tables"
+    "fill_country_tables", 
+    "fill_country_tables_sql", 
+    "fill_country_tables_python", 
+    "fill_country_tables_streaming", 
+    "fill_country_tables_parallel", 
+    "fill_customers_table", 
+    "LOAD_ENGINES", 
+    "derive_metrics", 
+    "refresh_derived_metrics", 
+    "update_country_summary", 
+    "check_country_summary", 
+    "rebuild_country_summary", 
+    "DEFAULT_QUEUE_DEPTH", 
+    "run_pipeline", 
+    "run_etl_pipeline", 
+    "pipeline_main"
 ]
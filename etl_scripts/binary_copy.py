@@ -0,0 +1,126 @@
+import struct
+
+# Formats the staging COPY can be sent in
+COPY_FORMATS = ("csv", "binary")
+
+# COPY binary framing: signature, flags and header-extension length, then the -1 trailer
+COPY_BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+COPY_BINARY_TRAILER = struct.pack("!h", -1)
+
+# Rows encoded at a time by iter_binary_copy; bounds the index arrays of the byte scatter
+DEFAULT_BLOCK_ROWS = 65_536
+
+# PostgreSQL DATE values are days since 2000-01-01, numpy's are days since 1970-01-01
+_POSTGRES_EPOCH_DAYS = 10_957
+
+# Binary types the encoder understands: text is sent for VARCHAR and CHAR columns alike
+BINARY_TYPES = ("text", "date", "int4")
+
+def wrap_binary_copy(rows):
+    """Return a complete COPY binary payload for rows encoded by encode_binary_rows."""
+    return COPY_BINARY_HEADER + rows + COPY_BINARY_TRAILER
+
+def _text_field(values, empty_as_null):
+    """Return (lengths, payload, starts) of a text column."""
+    import numpy as np
+    import pandas as pd
+    if isinstance(getattr(values, "dtype", None), pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+
+    # Each distinct value is encoded once, rows then point into the encoded values
+    encoded = [str(value).encode("utf-8") for value in uniques]
+    unique_lengths = np.array([len(value) if value or not empty_as_null else -1 for value in encoded] + [-1],
+                              dtype=np.int64)
+    unique_starts = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(unique_lengths[:-1].clip(0), out=unique_starts[1:])
+    payload = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    # Code -1 (missing) picks the trailing NULL entry
+    codes = np.where(codes < 0, len(encoded), codes)
+    return unique_lengths[codes], payload, unique_starts[codes]
+
+def _int4_field(values, null):
+    """Return (lengths, payload, starts) of a column of 4-byte big-endian values."""
+    import numpy as np
+    payload = np.ascontiguousarray(values, dtype=">i4").view(np.uint8)
+    lengths = np.where(null, -1, 4).astype(np.int64)
+    return lengths, payload, np.arange(len(values), dtype=np.int64) * 4
+
+def _date_field(values):
+    import numpy as np
+    days = np.asarray(values)
+    if days.dtype.kind != "M":
+        # Python dates and None, as read back from PostgreSQL
+        days = np.array(days, dtype="datetime64[D]")
+    days = days.astype("datetime64[D]")
+    null = np.isnat(days)
+    offsets = np.where(null, 0, days.astype(np.int64) - _POSTGRES_EPOCH_DAYS)
+    return _int4_field(offsets, null)
+
+def _integer_field(values):
+    import numpy as np
+    import pandas as pd
+    integers = pd.array(values, dtype="Int64")
+    null = np.asarray(integers.isna())
+    return _int4_field(integers.fillna(0).to_numpy(dtype=np.int64), null)
+
+# Encoders of the fixed-width types; text columns go through _text_field
+_FIXED_WIDTH_ENCODERS = {"date": _date_field, "int4": _integer_field}
+
+def encode_binary_rows(df, types, empty_as_null=True):
+    """Encode the rows of df as COPY binary tuples, without the header and trailer.
+
+    types gives the binary type of each column of df, in order. Columns are encoded
+    as whole arrays: the length words and values of every field are scattered into
+    one preallocated buffer with numpy, so no value is formatted as text or handled
+    row by row. Missing values become NULL, and so do empty strings unless
+    empty_as_null is False, matching what an unquoted empty CSV field loads as.
+    """
+    import numpy as np
+    if len(types) != len(df.columns):
+        raise ValueError(f"Expected {len(df.columns)} column types, got {len(types)}")
+    unknown = set(types) - set(BINARY_TYPES)
+    if unknown:
+        raise ValueError(f"Unsupported binary COPY types: {sorted(unknown)}")
+
+    row_count = len(df)
+    if not row_count:
+        return b""
+    fields = [
+        _text_field(df.iloc[:, position], empty_as_null) if kind == "text"
+        else _FIXED_WIDTH_ENCODERS[kind](df.iloc[:, position])
+        for position, kind in enumerate(types)
+    ]
+
+    # Every row is a 2-byte field count followed by a 4-byte length and the value of each field
+    row_sizes = np.full(row_count, 2 + 4 * len(fields), dtype=np.int64)
+    for lengths, _, _ in fields:
+        row_sizes += lengths.clip(0)
+    row_starts = np.zeros(row_count, dtype=np.int64)
+    np.cumsum(row_sizes[:-1], out=row_starts[1:])
+    out = np.zeros(int(row_starts[-1] + row_sizes[-1]), dtype=np.uint8)
+
+    # The field count fits in the low byte of its big-endian int16
+    out[row_starts + 1] = len(fields)
+    positions = row_starts + 2
+    word = np.arange(4)
+    for lengths, payload, starts in fields:
+        out[positions[:, None] + word] = lengths.astype(">i4").view(np.uint8).reshape(row_count, 4)
+        sizes = lengths.clip(0)
+        total = int(sizes.sum())
+        if total:
+            # Byte j of row r's value moves from starts[r] + j to positions[r] + 4 + j
+            before = np.cumsum(sizes) - sizes
+            step = np.arange(total, dtype=np.int64)
+            out[np.repeat(positions + 4 - before, sizes) + step] = payload[np.repeat(starts - before, sizes) + step]
+        positions = positions + 4 + sizes
+    return out.tobytes()
+
+def iter_binary_copy(df, types, block_rows=DEFAULT_BLOCK_ROWS):
+    """Yield a complete COPY binary stream for df: the header, blocks of rows and the trailer."""
+    yield COPY_BINARY_HEADER
+    for start in range(0, len(df), block_rows):
+        yield encode_binary_rows(df.iloc[start:start + block_rows], types)
+    yield COPY_BINARY_TRAILER
@@ -0,0 +1,131 @@
+import threading
+from io import BytesIO
+from etl_scripts import instrumentation
+from etl_scripts.binary_copy import COPY_BINARY_HEADER, COPY_BINARY_TRAILER, wrap_binary_copy
+
+# Business columns whose values make up the row fingerprint; a re-sent row has the
+# same fingerprint, while any changed value gives the row a new one
+FINGERPRINT_COLUMNS = ['Customer_Name', 'Customer_Id', 'Open_Date', 'Last_Consulted_Date', 'Vaccination_Id',
+                       'Dr_Name', 'State', 'Country', 'DOB', 'Is_Active']
+
+def _binary_row_dtype():
+    """One single-BIGINT row of COPY binary: field count, value length and value."""
+    import numpy as np
+    return np.dtype([("fields", ">i2"), ("length", ">i4"), ("fingerprint", ">i8")])
+
+def create_fingerprint_table(conn):
+    """Create the table holding the fingerprint of every row version loaded so far."""
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS row_fingerprints (
+        Fingerprint BIGINT PRIMARY KEY
+    )
+    ''')
+    conn.commit()
+
+def row_fingerprints(df):
+    """Return the 64-bit fingerprints of the rows of a cleaned DataFrame.
+
+    Hashes are computed from the values, not from category codes or dtypes, so the
+    same row gets the same fingerprint in every run.
+    """
+    import pandas as pd
+    # Stored as signed BIGINTs in PostgreSQL
+    return pd.util.hash_pandas_object(df[FINGERPRINT_COLUMNS], index=False).to_numpy().view('int64')
+
+class FingerprintIndex:
+    """In-memory copy of row_fingerprints used to drop rows that were already loaded unchanged.
+
+    The index is read once when the run starts and kept as a sorted numpy array, so a
+    chunk is checked with one vectorised binary search and no database round trip.
+    Rows are compared with the index as it was at the start of the run. The
+    fingerprints of forwarded rows are queued and written by save(), which must run in
+    the transaction that commits those rows. Loads that commit chunk by chunk use
+    changed_rows() and insert() instead, so every chunk carries its own fingerprints.
+    """
+
+    def __init__(self, fingerprints):
+        import numpy as np
+        self.fingerprints = np.sort(fingerprints)
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, conn):
+        """Read row_fingerprints with a single binary COPY."""
+        import numpy as np
+        buffer = BytesIO()
+        conn.cursor().copy_expert('COPY row_fingerprints (Fingerprint) TO STDOUT WITH (FORMAT binary)', buffer)
+        data = buffer.getbuffer()
+        row_dtype = _binary_row_dtype()
+        count = (len(data) - len(COPY_BINARY_HEADER) - len(COPY_BINARY_TRAILER)) // row_dtype.itemsize
+        rows = np.frombuffer(data, row_dtype, count=count, offset=len(COPY_BINARY_HEADER))
+        return cls(rows["fingerprint"].astype(np.int64))
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def changed_mask(self, fingerprints):
+        """Return True for rows whose fingerprint is not in the index."""
+        import numpy as np
+        if not len(self.fingerprints):
+            return np.ones(len(fingerprints), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.fingerprints, fingerprints), len(self.fingerprints) - 1)
+        return self.fingerprints[positions] != fingerprints
+
+    def changed_rows(self, df):
+        """Return the new or changed rows of df and their fingerprints, without queuing them."""
+        fingerprints = row_fingerprints(df)
+        changed = self.changed_mask(fingerprints)
+        return df[changed], fingerprints[changed]
+
+    def filter_changed(self, df):
+        """Return the new or changed rows of df and queue their fingerprints for save()."""
+        changed, fingerprints = self.changed_rows(df)
+        with self._lock:
+            self._pending.append(fingerprints)
+        return changed
+
+    def save(self, conn):
+        """Insert the queued fingerprints without committing; returns how many were new."""
+        import numpy as np
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        return self.insert(conn, np.concatenate(pending))
+
+    @instrumentation.stage
+    def insert(self, conn, fingerprints):
+        """Insert fingerprints into row_fingerprints without committing; returns how many were new."""
+        import numpy as np
+        if not len(fingerprints):
+            return 0
+
+        rows = np.empty(len(fingerprints), dtype=_binary_row_dtype())
+        rows["fields"], rows["length"], rows["fingerprint"] = 1, 8, fingerprints
+
+        cursor = conn.cursor()
+        cursor.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS incoming_fingerprints (
+            Fingerprint BIGINT
+        ) ON COMMIT DROP
+        ''')
+        cursor.execute('TRUNCATE incoming_fingerprints')
+        cursor.copy_expert('COPY incoming_fingerprints FROM STDIN WITH (FORMAT binary)',
+                           BytesIO(wrap_binary_copy(rows.tobytes())))
+        # A row sent twice in one run is inserted once
+        cursor.execute('''
+        INSERT INTO row_fingerprints (Fingerprint)
+        SELECT Fingerprint FROM incoming_fingerprints
+        ON CONFLICT (Fingerprint) DO NOTHING
+        ''')
+        instrumentation.count(rows_in=len(fingerprints), rows_out=cursor.rowcount)
+        return cursor.rowcount
+
+def load_fingerprint_index(conn):
+    """Create row_fingerprints if needed and load it into a FingerprintIndex."""
+    create_fingerprint_table(conn)
+    index = FingerprintIndex.load(conn)
+    conn.commit()
+    return index
@@ -0,0 +1,93 @@
+import queue
+import threading
+from etl_scripts import instrumentation
+
+# Default number of encoded batches buffered between the producer and COPY
+DEFAULT_MAX_PENDING = 4
+
+# Number of bytes psycopg2 requests from the stream per COPY message
+COPY_READ_SIZE = 1 << 16
+
+# Marker placed on the queue once the producer has no more batches
+_END = object()
+
+class CopyStream:
+    """File-like adapter that lets cursor.copy_expert read batches produced on another thread.
+
+    The batches iterable is consumed on a background thread, so parsing and encoding
+    the next batch overlaps with COPY sending the previous one. At most max_pending
+    batches are buffered, which keeps memory bounded when the database is the slower side.
+    Use it as a context manager around copy_expert; errors raised by the producer are
+    re-raised on exit so the caller can roll back instead of committing a partial load.
+    """
+
+    def __init__(self, batches, max_pending=DEFAULT_MAX_PENDING):
+        self._batches = batches
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._cancelled = threading.Event()
+        self._error = None
+        self._current = b''
+        self._offset = 0
+        self._finished = False
+        self._thread = threading.Thread(target=self._produce, name="copy-stream-producer", daemon=True)
+        # Rows counted while producing belong to the stage that opened the stream
+        self._frame = instrumentation.current_frame()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Unblock the producer if COPY stopped reading early, then wait for it
+        self._cancelled.set()
+        self._thread.join()
+        if exc_type is None and self._error is not None:
+            raise self._error
+        return False
+
+    def _produce(self):
+        """Encode every batch and hand it to the reading side."""
+        try:
+            with instrumentation.bind_frame(self._frame):
+                for batch in self._batches:
+                    if isinstance(batch, str):
+                        batch = batch.encode("utf-8")
+                    if batch and not self._put(batch):
+                        return
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._put(_END)
+
+    def _put(self, item):
+        """Block until the item is queued or the stream is cancelled."""
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read(self, size=-1):
+        """Return up to size bytes, or everything that is left when size is negative."""
+        parts = []
+        remaining = size
+        while size < 0 or remaining > 0:
+            if self._offset >= len(self._current):
+                if self._finished:
+                    break
+                item = self._queue.get()
+                if item is _END:
+                    self._finished = True
+                    break
+                self._current, self._offset = item, 0
+                continue
+
+            # Slice from the current batch without re-concatenating what is left of it
+            end = len(self._current) if size < 0 else min(len(self._current), self._offset + remaining)
+            parts.append(self._current[self._offset:end])
+            if size >= 0:
+                remaining -= end - self._offset
+            self._offset = end
+        return b''.join(parts)
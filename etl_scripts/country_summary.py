@@ -0,0 +1,164 @@
+from etl_scripts import instrumentation
+
+# Age bands of the summary as (column, lowest age, first age of the next band); None is open-ended
+AGE_BANDS = [
+    ("Age_Under_18", None, 18),
+    ("Age_18_34", 18, 35),
+    ("Age_35_49", 35, 50),
+    ("Age_50_64", 50, 65),
+    ("Age_65_Plus", 65, None),
+]
+
+def age_band_condition(low, high):
+    """Return the SQL condition selecting ages in [low, high)."""
+    bounds = ([f"Age >= {low}"] if low is not None else []) + ([f"Age < {high}"] if high is not None else [])
+    return " AND ".join(bounds)
+
+# Additive summary columns and the aggregate computing each one over a set of country rows.
+# Sums and counts only, so the aggregate of new rows can be added to the stored one.
+SUMMARY_MEASURES = [
+    ("Customer_Rows", "COUNT(*)"),
+    ("Active_Rows", "COUNT(*) FILTER (WHERE Is_Active = 'A')"),
+    *[(column, f"COUNT(*) FILTER (WHERE {age_band_condition(low, high)})") for column, low, high in AGE_BANDS],
+    ("Age_Unknown", "COUNT(*) FILTER (WHERE Age IS NULL)"),
+    ("Days_Since_Consulted_Sum", "COALESCE(SUM(Days_Since_Last_Consulted), 0)"),
+    ("Days_Since_Consulted_Count", "COUNT(Days_Since_Last_Consulted)"),
+]
+
+SUMMARY_COLUMNS = [column for column, _ in SUMMARY_MEASURES]
+
+def create_country_summary_table(conn):
+    """Create country_summary, one row of running aggregates per country table."""
+    measures = ",\n".join(f"        {column} BIGINT NOT NULL DEFAULT 0" for column in SUMMARY_COLUMNS)
+    cursor = conn.cursor()
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS country_summary (
+        Country_Name VARCHAR(255) PRIMARY KEY,
+{measures},
+        Avg_Days_Since_Last_Consulted NUMERIC GENERATED ALWAYS AS (
+            Days_Since_Consulted_Sum::NUMERIC / NULLIF(Days_Since_Consulted_Count, 0)
+        ) STORED,
+        Last_Row_Id BIGINT NOT NULL DEFAULT 0,
+        Updated_At TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    ''')
+    conn.commit()
+
+def summarized_countries(cursor):
+    """Return the names of the countries in country_map that have a country table."""
+    cursor.execute('''
+    SELECT DISTINCT Country_Name FROM country_map
+    WHERE to_regclass('table_' || Country_Name) IS NOT NULL
+    ORDER BY Country_Name
+    ''')
+    return [row[0] for row in cursor.fetchall()]
+
+def merge_country_delta(cursor, country):
+    """Add the aggregates of the rows loaded into one country table since its last merge.
+
+    Rows are found by id above the stored Last_Row_Id, so only the new rows are read,
+    through the primary key. Returns the number of new rows.
+    """
+    aggregates = ", ".join(f"{expression} AS {column}" for column, expression in SUMMARY_MEASURES)
+    columns = ", ".join(SUMMARY_COLUMNS)
+    additions = ",\n            ".join(f"{column} = country_summary.{column} + EXCLUDED.{column}"
+                                        for column in SUMMARY_COLUMNS)
+    cursor.execute(f'''
+    WITH delta AS (
+        SELECT {aggregates}, MAX(id) AS Last_Row_Id
+        FROM table_{country}
+        WHERE id > COALESCE((SELECT Last_Row_Id FROM country_summary WHERE Country_Name = %(country)s), 0)
+    ),
+    merged AS (
+        INSERT INTO country_summary (Country_Name, {columns}, Last_Row_Id)
+        SELECT %(country)s, {columns}, Last_Row_Id FROM delta
+        WHERE Last_Row_Id IS NOT NULL
+        ON CONFLICT (Country_Name) DO UPDATE SET
+            {additions},
+            Last_Row_Id = EXCLUDED.Last_Row_Id,
+            Updated_At = NOW()
+    )
+    SELECT Customer_Rows FROM delta WHERE Last_Row_Id IS NOT NULL
+    ''', {"country": country})
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def merge_country_deltas(cursor):
+    """Merge the new rows of every country table; returns {country: new rows} for those that had any."""
+    merged = {}
+    for country in summarized_countries(cursor):
+        new_rows = merge_country_delta(cursor, country)
+        if new_rows:
+            merged[country] = new_rows
+    instrumentation.count(rows_in=sum(merged.values()), rows_out=len(merged))
+    return merged
+
+@instrumentation.stage
+def update_country_summary(conn):
+    """Merge the rows loaded since the last update into country_summary.
+
+    Run it after the load stage. Country tables are append-only and written by one
+    connection at a time, so ids above Last_Row_Id are exactly the rows not merged
+    yet. Every country is merged in one transaction.
+    Returns {country: new rows} for the countries that had new rows.
+    """
+    create_country_summary_table(conn)
+    merged = merge_country_deltas(conn.cursor())
+    conn.commit()
+    return merged
+
+@instrumentation.stage
+def check_country_summary(conn):
+    """Compare country_summary with a full recompute over every country table.
+
+    Returns a list of (country, column, stored, recomputed) mismatches; empty when
+    the summary is consistent. Reads every country table, so run it as an audit
+    rather than after each load.
+    """
+    create_country_summary_table(conn)
+    cursor = conn.cursor()
+    aggregates = ", ".join(expression for _, expression in SUMMARY_MEASURES)
+    stored_columns = ", ".join(SUMMARY_COLUMNS)
+
+    mismatches = []
+    for country in summarized_countries(cursor):
+        cursor.execute(f'SELECT {aggregates} FROM table_{country}')
+        recomputed = cursor.fetchone()
+        cursor.execute(f'SELECT {stored_columns} FROM country_summary WHERE Country_Name = %s', (country,))
+        stored = cursor.fetchone() or (0,) * len(SUMMARY_COLUMNS)
+        mismatches += [(country, column, stored_value, value)
+                       for column, stored_value, value in zip(SUMMARY_COLUMNS, stored, recomputed)
+                       if stored_value != value]
+    conn.commit()
+    return mismatches
+
+@instrumentation.stage
+def rebuild_country_summary(conn):
+    """Recompute country_summary from scratch, e.g. after check_country_summary found a mismatch.
+
+    Readers see the old summary until the rebuilt one is committed.
+    """
+    create_country_summary_table(conn)
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM country_summary')
+    # With no stored rows every country table is merged from its first row
+    merged = merge_country_deltas(cursor)
+    conn.commit()
+    return merged
+
+def maintain_country_summary(conn, check=False):
+    """Update country_summary after a load and, with check=True, audit it against a full recompute.
+
+    Returns the mismatches found by the check, empty when it passed or did not run.
+    """
+    merged = update_country_summary(conn)
+    print(f"------Country summary: merged new rows of {len(merged)} countries")
+    if not check:
+        return []
+
+    mismatches = check_country_summary(conn)
+    for country, column, stored, recomputed in mismatches:
+        print(f"------Country summary mismatch: {country}.{column} is {stored}, a full recompute gives {recomputed}")
+    if not mismatches:
+        print("------Country summary matches a full recompute")
+    return mismatches
@@ -0,0 +1,75 @@
+def create_customers_table(conn):
+    """Create the customers table, LIST-partitioned by country code.
+
+    The table_<Country> tables become its partitions, so consumers that query them
+    directly keep working while loads go through a single INSERT into customers.
+    """
+    cursor = conn.cursor()
+    # Same columns, in the same order, as the per-country tables
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS customers (
+        id SERIAL,
+        Customer_Id VARCHAR(18) NOT NULL,
+        Customer_Name VARCHAR(255) NOT NULL,
+        Open_Date DATE NOT NULL,
+        Last_Consulted_Date DATE,
+        Vaccination_Id CHAR(5),
+        Dr_Name VARCHAR(255),
+        State CHAR(5),
+        Country CHAR(5),
+        DOB DATE,
+        Is_Active CHAR(1),
+        Age INTEGER,
+        Days_Since_Last_Consulted INTEGER
+    ) PARTITION BY LIST (Country)
+    ''')
+
+    # Refuse to run against a customers table that is not partitioned
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('customers')")
+    if cursor.fetchone()[0] != 'p':
+        raise ValueError("customers already exists as a regular table; partitioned storage needs a new customers table")
+
+    conn.commit()
+
+def ensure_country_partitions(conn):
+    """Give every code in the country_map table a table_<Country> partition of customers.
+
+    A single catalog query finds the countries that still need a partition, so runs
+    without new countries issue no DDL. Existing standalone country tables from the
+    per-table storage mode are attached in place instead of being recreated.
+    Returns the names of the partitions that were created or attached.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+    SELECT m.Country_Code, m.Country_Name, c.relkind IS NOT NULL AS table_exists
+    FROM country_map m
+    LEFT JOIN pg_class c ON c.oid = to_regclass('table_' || m.Country_Name)
+    WHERE NOT EXISTS (
+        SELECT 1 FROM pg_inherits i
+        WHERE i.inhparent = 'customers'::regclass AND i.inhrelid = c.oid
+    )
+    ORDER BY m.Country_Code
+    ''')
+    missing = cursor.fetchall()
+
+    added = []
+    attached = False
+    for country_code, country_name, table_exists in missing:
+        table_name = f"table_{country_name}"
+        if table_exists:
+            # Attaching validates the existing rows against the partition bound
+            cursor.execute(f"ALTER TABLE customers ATTACH PARTITION {table_name} FOR VALUES IN (%s)", (country_code,))
+            attached = True
+        else:
+            cursor.execute(f"CREATE TABLE {table_name} PARTITION OF customers FOR VALUES IN (%s)", (country_code,))
+            cursor.execute(f"ALTER TABLE {table_name} ADD PRIMARY KEY (id)")
+        added.append(table_name)
+
+    # Inserts through customers draw ids from its own sequence; move it past attached rows
+    if attached:
+        cursor.execute('''
+        SELECT setval(pg_get_serial_sequence('customers', 'id'), (SELECT COALESCE(MAX(id), 0) + 1 FROM customers), false)
+        ''')
+
+    conn.commit()
+    return added
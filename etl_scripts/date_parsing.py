@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+# Fixed-width digit layouts used by the customer feed
+YYYYMMDD = "YYYYMMDD"
+DDMMYYYY = "DDMMYYYY"
+
+# Days per month in a non-leap year, indexed by month - 1
+DAYS_IN_MONTH = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype=np.int32)
+
+# Range of dates representable as datetime64[ns], also as days since the epoch
+MIN_NS_DATE = np.datetime64("1677-09-22", "D")
+MAX_NS_DATE = np.datetime64("2262-04-11", "D")
+MIN_NS_DAYS = MIN_NS_DATE.astype(np.int64)
+MAX_NS_DAYS = MAX_NS_DATE.astype(np.int64)
+
+# Width of the byte buffer: one 64-bit word of digits plus one word to detect longer values
+_WIDTH = 16
+
+# Byte masks used to test and decode eight ASCII digits packed in a little-endian word
+_HIGH_NIBBLES = np.uint64(0xF0F0F0F0F0F0F0F0)
+_LOW_NIBBLES = np.uint64(0x0F0F0F0F0F0F0F0F)
+_ASCII_ZEROS = np.uint64(0x3030303030303030)
+_SIXES = np.uint64(0x0606060606060606)
+
+def _to_fixed_bytes(values):
+    """Return the values as a NumPy byte-string array of fixed width."""
+    text = values.to_numpy(dtype=object)
+    try:
+        return text.astype(f"S{_WIDTH}")
+    except UnicodeEncodeError:
+        # Non-ASCII values never match the fast path; replace them with a marker byte
+        return np.array([str(v).encode("ascii", "replace")[:_WIDTH] for v in text], dtype=f"S{_WIDTH}")
+
+def _days_from_civil(year, month, day):
+    """Return days since 1970-01-01 for proleptic Gregorian dates, using integer arithmetic only."""
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+def _coerce_ns(dates):
+    """Convert day-resolution dates to datetime64[ns], turning out-of-range values into NaT."""
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    in_range = (dates >= MIN_NS_DATE) & (dates <= MAX_NS_DATE)
+    return np.where(in_range, dates, np.datetime64("NaT", "D")).astype("datetime64[ns]")
+
+def _parse_with_pandas(values, layout):
+    """Parse values the way preprocess_data historically did, one pandas call for all of them."""
+    values = values.astype(str)
+    if layout == DDMMYYYY:
+        # Reorder DDMMYYYY into YYYYMMDD with the same slices the original code used
+        values = values.str.slice(4, 8) + values.str.slice(2, 4) + values.str.slice(0, 2)
+    parsed = pd.to_datetime(values, format="%Y%m%d", errors="coerce")
+    return _coerce_ns(parsed.to_numpy(dtype="datetime64[D]"))
+
+def parse_fixed_width_dates(values, layout=YYYYMMDD):
+    """Parse fixed-width digit dates in bulk.
+
+    Values that are exactly eight ASCII digits are decoded with NumPy integer
+    arithmetic on their raw bytes (eight digits per 64-bit word), and their
+    month/day ranges are checked in one vectorized pass.
+    Anything else that is not missing is handed to pandas, so the result matches
+    pd.to_datetime(format='%Y%m%d', errors='coerce'). Dates outside the datetime64[ns]
+    range are treated as invalid. Returns (dates, invalid) where dates is a
+    datetime64[ns] array with NaT for missing or invalid values, and invalid flags
+    values that were present but could not be parsed.
+    """
+    values = pd.Series(values)
+    raw = _to_fixed_bytes(values)
+    words = raw.view("<u8").reshape(len(raw), 2)
+    first, rest = words[:, 0], words[:, 1]
+
+    # Rows with exactly eight digits take the fast path: every byte of the first word
+    # is in 0x30-0x39 and the second word is empty. NaN, None and empty rows are missing.
+    fixed = ((first & _HIGH_NIBBLES) == _ASCII_ZEROS) & (((first + _SIXES) & _HIGH_NIBBLES) == _ASCII_ZEROS) & (rest == 0)
+    missing = (raw == b"") | (raw == b"nan") | (raw == b"None")
+
+    # Fold the eight digits into four two-digit numbers, one per 16-bit lane
+    pairs = ((first & _LOW_NIBBLES) * np.uint64(2561)) >> np.uint64(8)
+    lanes = [((pairs >> np.uint64(16 * k)) & np.uint64(0xFF)).astype(np.int32) for k in range(4)]
+    if layout == YYYYMMDD:
+        year, month, day = lanes[0] * 100 + lanes[1], lanes[2], lanes[3]
+    elif layout == DDMMYYYY:
+        day, month, year = lanes[0], lanes[1], lanes[2] * 100 + lanes[3]
+    else:
+        raise ValueError(f"Unknown date layout: {layout}")
+
+    # Check month and day ranges, including February 29th in leap years
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    days_in_month = DAYS_IN_MONTH[np.clip(month, 1, 12) - 1] + ((month == 2) & leap)
+    valid = fixed & (month >= 1) & (month <= 12) & (day >= 1) & (day <= days_in_month)
+
+    # Convert to days since the epoch and keep only dates datetime64[ns] can hold
+    days = _days_from_civil(year, month, day)
+    valid &= (days >= MIN_NS_DAYS) & (days <= MAX_NS_DAYS)
+    dates = np.where(valid, days, 0).astype("datetime64[D]").astype("datetime64[ns]")
+    dates[~valid] = np.datetime64("NaT")
+
+    # Hand the few irregular values to pandas so their coercion is unchanged
+    irregular = ~fixed & ~missing
+    if irregular.any():
+        dates[irregular] = _parse_with_pandas(values[irregular], layout)
+
+    invalid = np.isnat(dates) & ~missing
+    return dates, invalid
@@ -0,0 +1,150 @@
+from datetime import date
+from etl_scripts import get_connection, release_connection, instrumentation
+from etl_scripts.country_summary import SUMMARY_COLUMNS, SUMMARY_MEASURES, summarized_countries
+
+def age_sql(reference, dob):
+    """Return the SQL expression of the age in whole years on reference of someone born on dob.
+
+    The age goes up on the birthday itself; people born on February 29th age on
+    March 1st in non-leap years. derive_metrics applies the same rule in numpy.
+    """
+    return (f"(EXTRACT(YEAR FROM {reference})::INTEGER - EXTRACT(YEAR FROM {dob})::INTEGER"
+            f" - (TO_CHAR({reference}, 'MMDD') < TO_CHAR({dob}, 'MMDD'))::INTEGER)")
+
+def days_since_sql(reference, last_consulted_date):
+    """Return the SQL expression of the days from last_consulted_date to reference."""
+    return f"({reference} - {last_consulted_date})"
+
+def _civil_parts(days):
+    """Return (year, month * 100 + day) of a datetime64[D] array."""
+    import numpy as np
+    months = days.astype("datetime64[M]")
+    year = days.astype("datetime64[Y]").astype(np.int64) + 1970
+    month = months.astype(np.int64) % 12 + 1
+    day = (days - months).astype(np.int64) + 1
+    return year, month * 100 + day
+
+def _as_days(values):
+    """Return dates (datetime64 values, or Python dates and None) as a datetime64[D] array."""
+    import numpy as np
+    days = np.asarray(values)
+    if days.dtype.kind != "M":
+        days = np.array(days, dtype="datetime64[D]")
+    return days.astype("datetime64[D]")
+
+def derive_metrics(dob, last_consulted_date, reference_date):
+    """Compute Age and Days_Since_Last_Consulted for whole columns of dates.
+
+    dob and last_consulted_date are array-likes of datetime64 values or Python dates,
+    with missing values as NaT or None. Every row is measured against the same
+    reference_date. Returns two nullable Int32 pandas arrays, missing where the input
+    date is missing.
+    """
+    import numpy as np
+    import pandas as pd
+    reference = np.datetime64(reference_date, "D")
+    reference_year, reference_month_day = _civil_parts(np.array([reference]))
+
+    births = _as_days(dob)
+    missing_birth = np.isnat(births)
+    birth_year, birth_month_day = _civil_parts(np.where(missing_birth, reference, births))
+    ages = reference_year - birth_year - (reference_month_day < birth_month_day)
+
+    visits = _as_days(last_consulted_date)
+    missing_visit = np.isnat(visits)
+    days = (reference - np.where(missing_visit, reference, visits)).astype(np.int64)
+
+    return (pd.arrays.IntegerArray(ages.astype(np.int32), missing_birth),
+            pd.arrays.IntegerArray(days.astype(np.int32), missing_visit))
+
+def resolve_reference_date(reference_date=None):
+    """Return the reference date of a run: the given one, or today once and for all."""
+    return reference_date or date.today()
+
+def refresh_country_table(cursor, country, reference_date, summarized):
+    """Recompute Age and Days_Since_Last_Consulted of one country table in a single UPDATE.
+
+    Only rows whose stored values differ from the recomputed ones are written. With
+    summarized set, the changed rows already merged into country_summary move its
+    age bands and consultation sums in the same statement. Returns the rows updated.
+    """
+    age = age_sql("%(reference)s::DATE", "t.DOB")
+    days = days_since_sql("%(reference)s::DATE", "t.Last_Consulted_Date")
+    summary_update = ""
+    if summarized:
+        aggregates = ", ".join(f"{expression} AS {column}" for column, expression in SUMMARY_MEASURES)
+        differences = ", ".join(f"n.{column} - o.{column} AS {column}" for column in SUMMARY_COLUMNS)
+        additions = ", ".join(f"{column} = s.{column} + d.{column}" for column in SUMMARY_COLUMNS)
+        # The measures are evaluated over the new and the old values of the merged rows
+        summary_update = f''',
+    merged AS (
+        SELECT c.* FROM changed c
+        WHERE c.id <= (SELECT Last_Row_Id FROM country_summary WHERE Country_Name = %(country)s)
+    ),
+    summarized AS (
+        UPDATE country_summary s SET {additions}, Updated_At = NOW()
+        FROM (
+            SELECT {differences}
+            FROM (SELECT {aggregates} FROM (
+                SELECT Is_Active, Age, Days_Since_Last_Consulted FROM merged) r) n,
+                 (SELECT {aggregates} FROM (
+                SELECT Is_Active, Old_Age AS Age, Old_Days AS Days_Since_Last_Consulted FROM merged) r) o
+        ) d
+        WHERE s.Country_Name = %(country)s
+    )'''
+
+    cursor.execute(f'''
+    WITH changed AS (
+        SELECT t.id, t.Is_Active, t.Age AS Old_Age, t.Days_Since_Last_Consulted AS Old_Days,
+               {age} AS Age, {days} AS Days_Since_Last_Consulted
+        FROM table_{country} t
+        WHERE (t.Age, t.Days_Since_Last_Consulted) IS DISTINCT FROM ({age}, {days})
+    ),
+    updated AS (
+        UPDATE table_{country} t SET Age = c.Age, Days_Since_Last_Consulted = c.Days_Since_Last_Consulted
+        FROM changed c
+        WHERE t.id = c.id
+    ){summary_update}
+    SELECT COUNT(*) FROM changed
+    ''', {"reference": reference_date, "country": country})
+    return cursor.fetchone()[0]
+
+@instrumentation.stage
+def refresh_derived_metrics(conn, reference_date=None):
+    """Bring Age and Days_Since_Last_Consulted of every country table up to reference_date.
+
+    Each table is refreshed with one set-based UPDATE that skips rows whose values are
+    already right, so a second refresh on the same day writes nothing. Ages change on
+    birthdays only, while Days_Since_Last_Consulted moves every day for rows with a
+    consultation. country_summary, when it exists, is kept consistent in the same
+    transaction. Returns {country: rows updated} for the tables that changed.
+    """
+    reference_date = resolve_reference_date(reference_date)
+    cursor = conn.cursor()
+    cursor.execute("SELECT to_regclass('country_summary') IS NOT NULL")
+    summarized = cursor.fetchone()[0]
+
+    refreshed = {}
+    for country in summarized_countries(cursor):
+        updated = refresh_country_table(cursor, country, reference_date, summarized)
+        if updated:
+            refreshed[country] = updated
+    instrumentation.count(rows_out=sum(refreshed.values()))
+    conn.commit()
+    return refreshed
+
+def main(reference_date=None):
+    """Refresh the derived columns of the country tables, e.g. from a daily job."""
+    conn = get_connection()  # Get a database connection from the pool
+
+    try:
+        refreshed = refresh_derived_metrics(conn, reference_date)
+        print(f"------Refreshed derived metrics of {sum(refreshed.values())} rows in {len(refreshed)} countries")
+    except Exception as e:
+        print(f"An error occurred: {e}")  # Log any errors
+        conn.rollback()  # Rollback any changes in case of errors
+    finally:
+        release_connection(conn)  # Release the connection back to the pool
+
+if __name__ == "__main__":
+    main()
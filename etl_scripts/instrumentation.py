@@ -0,0 +1,278 @@
+import functools
+import json
+import os
+import platform
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import psycopg2.extensions
+
+# Counters every stage reports; rows and bytes are added by the stage code through count()
+STAGE_COUNTERS = ("rows_in", "rows_out", "rows_rejected", "bytes_read")
+
+# Run being recorded, or None when instrumentation is off
+_active_run = None
+
+# Per-thread stack of the stage frames being recorded
+_local = threading.local()
+
+# Guards the shared counters; counts are added per chunk or statement, never per row
+_lock = threading.Lock()
+
+# Statements sent to PostgreSQL by instrumented connections since the process started
+_round_trips = 0
+
+def _count_round_trips(n):
+    global _round_trips
+    with _lock:
+        _round_trips += n
+
+def _peak_rss_bytes():
+    """Return the process peak resident set size; ru_maxrss is KiB on Linux and bytes on macOS."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if platform.system() == "Darwin" else maxrss * 1024
+
+class _CountingCursorMixin:
+    """Counts the statements a cursor sends, for the db_round_trips of the running stage."""
+
+    def execute(self, query, vars=None):
+        _count_round_trips(1)
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        # psycopg2 sends one statement per parameter set
+        _count_round_trips(len(vars_list) if hasattr(vars_list, "__len__") else 1)
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        _count_round_trips(1)
+        return super().copy_expert(sql, file, size)
+
+    def callproc(self, procname, parameters=None):
+        _count_round_trips(1)
+        return super().callproc(procname, parameters)
+
+_counting_cursor_classes = {}
+
+def counting_cursor_class(base):
+    """Return a subclass of the cursor class base that counts round trips."""
+    cls = _counting_cursor_classes.get(base)
+    if cls is None:
+        cls = _counting_cursor_classes[base] = type(f"Counting{base.__name__}", (_CountingCursorMixin, base), {})
+    return cls
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """Connection whose cursors, whatever their cursor_factory, count the statements they send."""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = counting_cursor_class(base)
+        return super().cursor(*args, **kwargs)
+
+class RunRecorder:
+    """Aggregates the stage measurements of one ETL run."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = datetime.now(timezone.utc)
+        self.finished_at = None
+        self.error = None
+        self.stages = {}
+        self._start = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self.wall_seconds = self.cpu_seconds = 0.0
+
+    def add_stage(self, name, frame, wall_seconds, cpu_seconds, round_trips, error):
+        with _lock:
+            totals = self.stages.setdefault(name, {
+                "calls": 0, "errors": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "db_round_trips": 0,
+                **{counter: 0 for counter in STAGE_COUNTERS}, "peak_rss_bytes": 0, "last_error": None,
+            })
+            totals["calls"] += 1
+            totals["wall_seconds"] += wall_seconds
+            totals["cpu_seconds"] += cpu_seconds
+            totals["db_round_trips"] += round_trips
+            for counter in STAGE_COUNTERS:
+                totals[counter] += frame[counter]
+            totals["peak_rss_bytes"] = max(totals["peak_rss_bytes"], _peak_rss_bytes())
+            if error is not None:
+                totals["errors"] += 1
+                totals["last_error"] = f"{type(error).__name__}: {error}"
+
+    def finish(self, error=None):
+        self.finished_at = datetime.now(timezone.utc)
+        self.wall_seconds = time.perf_counter() - self._start
+        self.cpu_seconds = time.process_time() - self._start_cpu
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    @property
+    def succeeded(self):
+        # main() functions log and swallow their errors, so a failed stage fails the run too
+        return self.error is None and not any(stage["errors"] for stage in self.stages.values())
+
+    def report(self):
+        """Return the run as a JSON-serialisable dict."""
+        return {
+            "run": self.name,
+            "status": "ok" if self.succeeded else "failed",
+            "error": self.error,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "finished_at": self.finished_at.isoformat(timespec="seconds") if self.finished_at else None,
+            "wall_seconds": round(self.wall_seconds, 6),
+            "cpu_seconds": round(self.cpu_seconds, 6),
+            "peak_rss_bytes": _peak_rss_bytes(),
+            "stages": {name: {key: round(value, 6) if isinstance(value, float) else value
+                              for key, value in stage.items()}
+                       for name, stage in self.stages.items()},
+        }
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+def current_frame():
+    """Return the innermost stage frame of this thread, or None outside an instrumented stage."""
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+@contextmanager
+def bind_frame(frame):
+    """Attribute counts made on this thread to a stage frame opened on another thread."""
+    if frame is None:
+        yield
+        return
+    stack = _stack()
+    stack.append(frame)
+    try:
+        yield
+    finally:
+        stack.pop()
+
+def count(**counters):
+    """Add rows_in, rows_out, rows_rejected or bytes_read to the innermost running stage."""
+    frame = current_frame()
+    if frame is None:
+        return
+    with _lock:
+        for counter, value in counters.items():
+            frame[counter] += value
+
+def stage(func):
+    """Record wall time, CPU time, counters, DB round trips and peak RSS of every call to func.
+
+    The stage is named <module>.<function>. Times and round trips of nested stages are
+    inclusive; rows and bytes are counted by the innermost stage only, so they are never
+    counted twice. Exceptions are recorded and re-raised. With no run active the
+    wrapper only checks one global.
+    """
+    name = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        run = _active_run
+        if run is None:
+            return func(*args, **kwargs)
+
+        frame = {counter: 0 for counter in STAGE_COUNTERS}
+        stack = _stack()
+        stack.append(frame)
+        error = None
+        start, start_cpu, start_round_trips = time.perf_counter(), time.process_time(), _round_trips
+        try:
+            return func(*args, **kwargs)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            wall_seconds = time.perf_counter() - start
+            cpu_seconds = time.process_time() - start_cpu
+            stack.pop()
+            run.add_stage(name, frame, wall_seconds, cpu_seconds, _round_trips - start_round_trips, error)
+
+    return wrapper
+
+def _write_atomically(path, text):
+    """Write text to path through a temporary file, so readers never see a partial file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def write_json_report(report, path):
+    """Write a run report as JSON."""
+    _write_atomically(path, json.dumps(report, indent=2) + "\n")
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# Prometheus gauges exported per stage: (metric name, report key, help text)
+PROMETHEUS_STAGE_METRICS = (
+    ("etl_stage_wall_seconds", "wall_seconds", "Wall-clock seconds spent in the stage during the last run."),
+    ("etl_stage_cpu_seconds", "cpu_seconds", "Process CPU seconds used while the stage ran during the last run."),
+    ("etl_stage_calls", "calls", "Calls of the stage during the last run."),
+    ("etl_stage_errors", "errors", "Calls of the stage that raised during the last run."),
+    ("etl_stage_rows_in", "rows_in", "Rows the stage read during the last run."),
+    ("etl_stage_rows_out", "rows_out", "Rows the stage wrote or passed on during the last run."),
+    ("etl_stage_rows_rejected", "rows_rejected", "Rows the stage rejected during the last run."),
+    ("etl_stage_bytes_read", "bytes_read", "Input bytes the stage read during the last run."),
+    ("etl_stage_db_round_trips", "db_round_trips", "Statements sent to PostgreSQL while the stage ran."),
+    ("etl_stage_peak_rss_bytes", "peak_rss_bytes", "Process peak resident set size at the end of the stage."),
+)
+
+def format_prometheus(report):
+    """Render a run report in the Prometheus text exposition format."""
+    run = _label(report["run"])
+    lines = []
+
+    def gauge(name, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            lines.append(f"{name}{{{labels}}} {value}")
+
+    gauge("etl_run_success", "1 if the last run succeeded, 0 otherwise.",
+          [(f'run="{run}"', int(report["status"] == "ok"))])
+    gauge("etl_run_wall_seconds", "Wall-clock seconds of the last run.", [(f'run="{run}"', report["wall_seconds"])])
+    gauge("etl_run_cpu_seconds", "Process CPU seconds of the last run.", [(f'run="{run}"', report["cpu_seconds"])])
+    finished = datetime.fromisoformat(report["finished_at"]).timestamp() if report["finished_at"] else 0
+    gauge("etl_run_finished_timestamp_seconds", "Unix time the last run finished.", [(f'run="{run}"', int(finished))])
+    for name, key, help_text in PROMETHEUS_STAGE_METRICS:
+        gauge(name, help_text, [(f'run="{run}",stage="{_label(stage_name)}"', stage[key])
+                                for stage_name, stage in report["stages"].items()])
+    return "\n".join(lines) + "\n"
+
+def write_prometheus_textfile(report, path):
+    """Write a run report for the node_exporter textfile collector."""
+    _write_atomically(path, format_prometheus(report))
+
+@contextmanager
+def instrumented_run(name="etl", report_path=None, prometheus_path=None):
+    """Record every instrumented stage called inside the block and write the reports at the end.
+
+    Yields the RunRecorder. The JSON report and the Prometheus textfile are written
+    even when the block raises, so failed runs show up on dashboards too.
+    """
+    global _active_run
+    run = RunRecorder(name)
+    _active_run = run
+    error = None
+    try:
+        yield run
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _active_run = None
+        run.finish(error)
+        report = run.report()
+        if report_path:
+            write_json_report(report, report_path)
+        if prometheus_path:
+            write_prometheus_textfile(report, prometheus_path)
@@ -0,0 +1,134 @@
+from io import StringIO
+from etl_scripts import instrumentation
+
+# Columns of current_country, in COPY order
+CURRENT_COUNTRY_COLUMNS = ['Customer_Id', 'Customer_Name', 'Country', 'Last_Consulted_Date']
+
+# Winners buffered since the last compaction before they are reduced again; compaction
+# also waits until the buffer is as large as the reduced winners, so its cost is amortised
+DEFAULT_COMPACT_ROWS = 1_000_000
+
+def latest_per_customer(df):
+    """Keep the visit with the latest Last_Consulted_Date of each customer.
+
+    A hash aggregation (groupby/idxmax) rather than a sort. Rows are scanned in
+    reverse, so of two visits on the same day the later row wins.
+    """
+    reversed_rows = df.iloc[::-1].reset_index(drop=True)
+    winners = reversed_rows.groupby('Customer_Id', sort=False)['Last_Consulted_Date'].idxmax()
+    return reversed_rows.loc[winners.to_numpy()]
+
+class LatestVisits:
+    """Running latest visit per customer, fed with cleaned chunks during validation.
+
+    add() reduces each chunk to one row per customer and buffers it; buffered winners
+    are merged whenever the buffer outgrows the merged winners, so memory is bounded
+    by the number of customers rather than the number of rows. save() upserts the
+    winners into current_country in the transaction that COPYs the rows, changing
+    only rows whose visit is newer than the stored one. advance_watermark() then moves
+    the current_country watermark past this run's rows, so load_customer_current_country
+    does not rank them again.
+    """
+
+    def __init__(self, compact_rows=DEFAULT_COMPACT_ROWS):
+        self.compact_rows = compact_rows
+        self._parts = []
+        self._buffered_rows = 0
+        self._compacted_rows = 0
+        self._caught_up = False
+
+    def add(self, df):
+        """Fold the visits of a cleaned chunk into the running winners."""
+        visits = df.loc[df['Last_Consulted_Date'].notna() & df['Country'].notna(), CURRENT_COUNTRY_COLUMNS]
+        if not len(visits):
+            return
+        winners = latest_per_customer(visits)
+        self._parts.append(winners)
+        self._buffered_rows += len(winners)
+        if self._buffered_rows > max(self._compacted_rows, self.compact_rows):
+            self._compact()
+
+    def _compact(self):
+        import pandas as pd
+        if len(self._parts) > 1:
+            # Parts are kept in file order, so the tie-break still prefers later rows
+            self._parts = [latest_per_customer(pd.concat(self._parts, ignore_index=True))]
+        self._compacted_rows = len(self._parts[0]) if self._parts else 0
+        self._buffered_rows = 0
+
+    def winners(self):
+        """Return the latest visit of every customer seen so far."""
+        import pandas as pd
+        self._compact()
+        return self._parts[0] if self._parts else pd.DataFrame(columns=CURRENT_COUNTRY_COLUMNS)
+
+    def begin(self, conn):
+        """Before this run's COPY, check whether every staging row is already ranked.
+
+        Only then can the watermark skip this run's rows; otherwise the load stage
+        ranks the backlog together with them as before.
+        """
+        from etl_scripts.load_data import CURRENT_COUNTRY_STAGE
+        from etl_scripts.validate_data import create_watermark_table, create_customer_current_country
+        create_watermark_table(conn)
+        create_customer_current_country(conn)
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT NOT EXISTS (
+            SELECT 1 FROM staging
+            WHERE id > (SELECT COALESCE(MAX(Last_Staging_Id), 0) FROM etl_watermarks WHERE Stage = %s)
+            AND processed = FALSE
+        )
+        ''', (CURRENT_COUNTRY_STAGE,))
+        self._caught_up = cursor.fetchone()[0]
+        conn.commit()
+
+    @instrumentation.stage
+    def save(self, conn):
+        """Upsert the winners that beat the stored rows, without committing; returns how many changed."""
+        winners = self.winners()
+        instrumentation.count(rows_in=len(winners))
+        cursor = conn.cursor()
+
+        if len(winners):
+            cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS incoming_current_country (
+                LIKE current_country
+            ) ON COMMIT DROP
+            ''')
+            cursor.execute('TRUNCATE incoming_current_country')
+            cursor.copy_expert(
+                f"COPY incoming_current_country ({', '.join(CURRENT_COUNTRY_COLUMNS)}) "
+                "FROM STDIN WITH (FORMAT CSV, DELIMITER '|')",
+                StringIO(winners.to_csv(sep='|', index=False, header=False))
+            )
+            # A stored visit is only replaced by a visit on the same day or later, which is the later row
+            cursor.execute('''
+            INSERT INTO current_country (Customer_Id, Customer_Name, Country, Last_Consulted_Date)
+            SELECT Customer_Id, Customer_Name, Country, Last_Consulted_Date FROM incoming_current_country
+            ON CONFLICT (Customer_Id)
+            DO UPDATE SET
+                Customer_Name = EXCLUDED.Customer_Name,
+                Country = EXCLUDED.Country,
+                Last_Consulted_Date = EXCLUDED.Last_Consulted_Date
+            WHERE current_country.Last_Consulted_Date IS NULL
+            OR EXCLUDED.Last_Consulted_Date >= current_country.Last_Consulted_Date
+            ''')
+        changed = cursor.rowcount if len(winners) else 0
+        instrumentation.count(rows_out=changed)
+        return changed
+
+    def advance_watermark(self, conn):
+        """Mark this run's staging rows as ranked, once they are committed (and attached, for bulk loads).
+
+        A failure before this point only makes the load stage rank the rows again.
+        """
+        from etl_scripts.load_data import CURRENT_COUNTRY_STAGE, set_watermark
+        if not self._caught_up:
+            return
+        cursor = conn.cursor()
+        cursor.execute('SELECT MAX(id) FROM staging')
+        last_id = cursor.fetchone()[0]
+        if last_id is not None:
+            set_watermark(cursor, CURRENT_COUNTRY_STAGE, last_id)
+        conn.commit()
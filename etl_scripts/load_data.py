@@ -1,65 +1,423 @@
-from datetime import date, datetime
-import psycopg2.extras
-from etl_scripts import get_connection, release_connection
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from etl_scripts import get_connection, release_connection, instrumentation
+from etl_scripts.staging_partitions import rotate_staging_partitions
+from etl_scripts.binary_copy import encode_binary_rows, wrap_binary_copy
+from etl_scripts.country_summary import maintain_country_summary
+from etl_scripts.derived_metrics import (
+    age_sql, days_since_sql, derive_metrics, resolve_reference_date, refresh_derived_metrics
+)
 from data import get_country_name
 
-def fill_country_tables(conn):
+# Engines available for routing staging rows into the country tables
+LOAD_ENGINES = ("sql", "python", "stream", "parallel", "partitioned")
+
+# Worker threads (and pooled connections) used by the parallel engine
+DEFAULT_WORKERS = 8
+
+# Rows fetched per page by the streaming engine
+DEFAULT_ITERSIZE = 10_000
+
+# Buffered rows that trigger a flush to the country tables in the streaming engine
+DEFAULT_FLUSH_SIZE = 50_000
+
+# Columns written to every country table, in insert order
+COUNTRY_TABLE_COLUMNS = (
+    "Customer_Name, Customer_Id, Open_Date, Last_Consulted_Date, Vaccination_Id, Dr_Name, "
+    "State, Country, DOB, Is_Active, Age, Days_Since_Last_Consulted"
+)
+
+# Binary COPY type of every country-table column, in COUNTRY_TABLE_COLUMNS order
+COUNTRY_TABLE_BINARY_TYPES = ['text', 'text', 'date', 'date', 'text', 'text', 'text', 'text', 'date', 'text',
+                              'int4', 'int4']
+
+# Staging rows with a known country, shaped like the country tables; age and recency
+# are computed in SQL against the batch's reference date
+ROUTED_ROWS_SELECT = f'''
+    SELECT
+        s.Customer_Name, s.Customer_Id, s.Open_Date, s.Last_Consulted_Date, s.Vaccination_Id,
+        s.Dr_Name, s.State, s.Country, s.DOB, s.Is_Active,
+        {age_sql("%(today)s::DATE", "s.DOB")},
+        {days_since_sql("%(today)s::DATE", "s.Last_Consulted_Date")}
+    FROM staging s
+    JOIN country_map m ON m.Country_Code = TRIM(s.Country)'''
+
+# Watermark names of the load stages that consume staging incrementally
+COUNTRY_TABLES_STAGE = "country_tables"
+CURRENT_COUNTRY_STAGE = "current_country"
+
+# Incremental staging queries; both are served by the idx_staging_unprocessed partial index
+LAST_NEW_ID_SQL = 'SELECT MAX(id) FROM staging WHERE id > %s AND processed = FALSE'
+NEW_RECORDS_SQL = 'SELECT * FROM staging WHERE id > %s AND processed = FALSE'
+
+# Predicate selecting the rows of a pinned staging batch
+BATCH_FILTER = 's.id > %(last_processed_id)s AND s.id <= %(last_new_id)s AND s.processed = FALSE'
+
+def get_watermark(cursor, stage):
+    """Return the last staging id committed by a load stage."""
+    cursor.execute('SELECT Last_Staging_Id FROM etl_watermarks WHERE Stage = %s', (stage,))
+    row = cursor.fetchone()
+    if row is not None:
+        return row[0]
+
+    # First run of the stage: derive the watermark from the processed flags once
+    cursor.execute('SELECT COALESCE(MAX(id), 0) FROM staging WHERE processed = TRUE')
+    return cursor.fetchone()[0]
+
+def set_watermark(cursor, stage, last_staging_id):
+    """Record the last staging id committed by a load stage, in the caller's transaction."""
+    cursor.execute('''
+    INSERT INTO etl_watermarks (Stage, Last_Staging_Id, Updated_At)
+    VALUES (%s, %s, NOW())
+    ON CONFLICT (Stage) DO UPDATE SET
+        Last_Staging_Id = GREATEST(etl_watermarks.Last_Staging_Id, EXCLUDED.Last_Staging_Id),
+        Updated_At = EXCLUDED.Updated_At
+    ''', (stage, last_staging_id))
+
+@instrumentation.stage
+def fill_country_tables(conn, engine="sql", today=None, workers=DEFAULT_WORKERS):
+    """Fill the country tables from unprocessed staging rows using the chosen engine.
+
+    The "sql" engine routes rows inside PostgreSQL with one INSERT ... SELECT per
+    country; "python" is the original row-by-row fallback, "stream" routes in
+    Python over keyset-paginated reads with bounded memory, "parallel" runs the
+    per-country inserts on worker connections and "partitioned" inserts once into the
+    partitioned customers table. All produce the same rows.
+    """
+    if engine == "sql":
+        fill_country_tables_sql(conn, today)
+    elif engine == "python":
+        fill_country_tables_python(conn, today)
+    elif engine == "stream":
+        fill_country_tables_streaming(conn, today)
+    elif engine == "parallel":
+        fill_country_tables_parallel(conn, today, workers)
+    elif engine == "partitioned":
+        fill_customers_table(conn, today)
+    else:
+        raise ValueError(f"Unknown load engine: {engine}")
+
+def pin_staging_batch(cursor, today):
+    """Return the parameters of the unprocessed staging batch, or None when there is nothing to load."""
+    # Get the stage watermark to determine which records need processing
+    last_processed_id = get_watermark(cursor, COUNTRY_TABLES_STAGE)
+
+    # Pin the upper bound so the inserts and the processed flag cover the same rows
+    cursor.execute(LAST_NEW_ID_SQL, (last_processed_id,))
+    last_new_id = cursor.fetchone()[0]
+    if last_new_id is None:
+        return None
+    return {"last_processed_id": last_processed_id, "last_new_id": last_new_id, "today": today}
+
+def batch_countries(cursor, batch):
+    """Return the names of the countries present in a pinned staging batch."""
+    # Find the countries through the country_map lookup table
+    cursor.execute(f'''
+    SELECT DISTINCT m.Country_Name
+    FROM staging s
+    JOIN country_map m ON m.Country_Code = TRIM(s.Country)
+    WHERE {BATCH_FILTER}
+    ''', batch)
+    return [row[0] for row in cursor.fetchall()]
+
+def insert_country_rows_sql(cursor, country, batch):
+    """Copy one country's rows of a pinned batch into its table with a single INSERT ... SELECT."""
+    cursor.execute(f'''
+    INSERT INTO table_{country} ({COUNTRY_TABLE_COLUMNS})
+    {ROUTED_ROWS_SELECT}
+    WHERE m.Country_Name = %(country)s AND {BATCH_FILTER}
+    ORDER BY s.id
+    ''', {**batch, "country": country})
+    return cursor.rowcount
+
+def fill_customers_table(conn, today=None):
+    """Route unprocessed staging rows into the partitioned customers table with one INSERT ... SELECT.
+
+    PostgreSQL routes each row to its table_<Country> partition, so a single statement
+    replaces the per-country inserts.
+    """
+    cursor = conn.cursor()
+    batch = pin_staging_batch(cursor, resolve_reference_date(today))
+    if batch is None:
+        conn.commit()
+        return
+
+    cursor.execute(f'''
+    INSERT INTO customers ({COUNTRY_TABLE_COLUMNS})
+    {ROUTED_ROWS_SELECT}
+    WHERE {BATCH_FILTER}
+    ORDER BY s.id
+    ''', batch)
+    instrumentation.count(rows_out=cursor.rowcount)
+
+    mark_batch_processed(cursor, batch)
+    conn.commit()  # Commit all changes to the database
+
+def mark_country_processed(cursor, country, batch):
+    """Mark one country's rows of a pinned batch processed; returns the rows marked."""
+    cursor.execute(f'''
+    UPDATE staging s SET processed = TRUE
+    FROM country_map m
+    WHERE m.Country_Code = TRIM(s.Country) AND m.Country_Name = %(country)s AND {BATCH_FILTER}
+    ''', {**batch, "country": country})
+    return cursor.rowcount
+
+def mark_batch_processed(cursor, batch):
+    """Mark the whole pinned batch processed, including rows with unknown countries, and advance the watermark."""
+    cursor.execute(f'UPDATE staging s SET processed = TRUE WHERE {BATCH_FILTER}', batch)
+    instrumentation.count(rows_in=cursor.rowcount)
+    set_watermark(cursor, COUNTRY_TABLES_STAGE, batch["last_new_id"])
+
+def fill_country_tables_sql(conn, today=None):
+    """Route unprocessed staging rows into the country tables with set-based SQL."""
+    cursor = conn.cursor()
+    batch = pin_staging_batch(cursor, resolve_reference_date(today))
+    if batch is None:
+        conn.commit()
+        return
+
+    # One INSERT ... SELECT per country table
+    for country in batch_countries(cursor, batch):
+        instrumentation.count(rows_out=insert_country_rows_sql(cursor, country, batch))
+
+    mark_batch_processed(cursor, batch)
+    conn.commit()  # Commit all changes to the database
+
+def fill_country_tables_parallel(conn, today=None, workers=DEFAULT_WORKERS, acquire=None, release=None):
+    """Load each country table on its own worker thread and pooled connection.
+
+    Every worker marks the staging rows of its countries processed in the transaction
+    that inserts them, and keeps it open until every country has been inserted. If an
+    insert fails, all workers roll back and staging stays unmarked. The worker
+    transactions are then committed one by one, so this is not atomic across
+    countries: if a later commit fails, the countries already committed keep their
+    rows, but their staging rows are marked too, so a rerun loads only the rest. The
+    coordinating connection finally marks rows with unknown countries and advances
+    the watermark. acquire/release default to the module connection pool.
+    """
+    acquire = acquire or get_connection
+    release = release or release_connection
+    cursor = conn.cursor()
+    batch = pin_staging_batch(cursor, resolve_reference_date(today))
+    if batch is None:
+        conn.commit()
+        return
+
+    # Once some countries are marked, the processed flags no longer give the watermark,
+    # so it is stored before any worker commits
+    set_watermark(cursor, COUNTRY_TABLES_STAGE, batch["last_processed_id"])
+    conn.commit()
+
+    worker_conns = []
+    lock = threading.Lock()
+    local = threading.local()
+
+    def load_country(country):
+        # Each worker thread takes one connection and reuses it for all of its countries
+        if not hasattr(local, "conn"):
+            local.conn = acquire()
+            with lock:
+                worker_conns.append(local.conn)
+        worker_cursor = local.conn.cursor()
+        inserted = insert_country_rows_sql(worker_cursor, country, batch)
+        return inserted, mark_country_processed(worker_cursor, country, batch)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(load_country, country) for country in batch_countries(cursor, batch)]
+            # Re-raise the first worker failure
+            results = [future.result() for future in futures]
+
+        for worker_conn in worker_conns:
+            worker_conn.commit()
+        instrumentation.count(rows_in=sum(marked for _, marked in results),
+                              rows_out=sum(inserted for inserted, _ in results))
+        mark_batch_processed(cursor, batch)
+        conn.commit()
+    except Exception:
+        for worker_conn in worker_conns:
+            worker_conn.rollback()
+        conn.rollback()
+        raise
+    finally:
+        for worker_conn in worker_conns:
+            release(worker_conn)
+
+def route_record(record):
+    """Return (table_name, values) for one staging record, or None when its country is unknown.
+
+    values holds the staging columns only; with_derived_metrics adds Age and
+    Days_Since_Last_Consulted to a whole table's rows at once.
+    """
+    # Get the country code and associated country name
+    country_code = record.country
+    if country_code and country_code is not None:
+        country_code = country_code.strip()
+        country = get_country_name(country_code)
+        if country != "Unknown Country":
+            table_name = f"table_{country}"  # Use lowercase for table names
+            return table_name, (
+                record.customer_name, record.customer_id, record.open_date, record.last_consulted_date,
+                record.vaccination_id, record.dr_name, record.state, record.country, record.dob, record.is_active
+            )
+    return None
+
+def country_table_frame(records, today):
+    """Return routed records (route_record values) as a frame of the country-table columns.
+
+    Age and Days_Since_Last_Consulted are derived for all records at once, against today.
+    """
+    import pandas as pd
+    df = pd.DataFrame.from_records(records, columns=range(10))
+    df[10], df[11] = derive_metrics(df[8], df[3], today)
+    return df
+
+def with_derived_metrics(records, today):
+    """Return routed records as country-table rows, with the derived columns as Python ints or None."""
+    ages, days = (values.to_numpy(dtype=object, na_value=None) for values in derive_metrics(
+        [record[8] for record in records], [record[3] for record in records], today))
+    return [record + (age, day) for record, age, day in zip(records, ages, days)]
+
+def fill_country_tables_python(conn, today=None):
     # Fill country-specific tables with customer data based on their last consulted date.
+    import psycopg2.extras
     cursor = conn.cursor(cursor_factory=psycopg2.extras.NamedTupleCursor)
-    today = date.today()
+    today = resolve_reference_date(today)
 
-    # Get the last processed id to determine which records need processing
-    cursor.execute('SELECT COALESCE(MAX(id), 0) FROM staging WHERE processed = TRUE')
-    last_processed_id = cursor.fetchone()[0]
+    # Get the stage watermark to determine which records need processing
+    last_processed_id = get_watermark(cursor, COUNTRY_TABLES_STAGE)
 
     # Fetch new records from the staging table that haven't been processed yet
-    cursor.execute('SELECT * FROM staging WHERE id > %s AND processed = FALSE', (last_processed_id,))
+    cursor.execute(NEW_RECORDS_SQL, (last_processed_id,))
     new_records = cursor.fetchall()
 
     # Dictionary to hold data for bulk inserts into country-specific tables
     country_data = {}
 
     for record in new_records:
-        # Calculate age and days since last consulted
-        age = (today - record.dob).days // 365 if record.dob else None
-        days_since_last_consulted = (today - record.last_consulted_date).days if record.last_consulted_date else None
-
-        # Get the country code and associated country name
-        country_code = record.country
-        if country_code and country_code is not None:
-            country_code = country_code.strip()
-            country = get_country_name(country_code)
-            if country != "Unknown Country":
-                table_name = f"table_{country}"  # Use lowercase for table names
-                
-                # Prepare data for bulk insertion into the appropriate country table
-                if table_name not in country_data:
-                    country_data[table_name] = []
-
-                # Append record to the corresponding country's data list
-                country_data[table_name].append(
-                    (record.customer_name, record.customer_id, record.open_date, record.last_consulted_date,
-                     record.vaccination_id, record.dr_name, record.state, record.country, record.dob, record.is_active, age, days_since_last_consulted)
-                )
+        routed = route_record(record)
+        if routed:
+            # Append record to the corresponding country's data list
+            table_name, values = routed
+            country_data.setdefault(table_name, []).append(values)
 
     # Insert all records into their respective country tables
     for table_name, records in country_data.items():
-        cursor.executemany(f'''INSERT INTO {table_name} (Customer_Name, Customer_Id, Open_Date, Last_Consulted_Date, Vaccination_Id, Dr_Name, State, Country, DOB, Is_Active, Age, Days_Since_Last_Consulted) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)''', records)
+        cursor.executemany(f'''INSERT INTO {table_name} ({COUNTRY_TABLE_COLUMNS}) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)''', with_derived_metrics(records, today))
+
+    instrumentation.count(rows_in=len(new_records), rows_out=sum(len(records) for records in country_data.values()))
 
     # Mark all processed rows at once for efficiency
     processed_ids = [record.id for record in new_records]
     if processed_ids:
         cursor.execute('UPDATE staging SET processed = TRUE WHERE id = ANY(%s)', (processed_ids,))
+        set_watermark(cursor, COUNTRY_TABLES_STAGE, max(processed_ids))
 
     conn.commit()  # Commit all changes to the database
 
+def copy_country_rows(cursor, table_name, records, today):
+    """Write routed country rows (route_record values) into a country table with one binary COPY."""
+    # Values are already typed, so they are sent as they were read from staging
+    rows = encode_binary_rows(country_table_frame(records, today), COUNTRY_TABLE_BINARY_TYPES, empty_as_null=False)
+    cursor.copy_expert(f'COPY {table_name} ({COUNTRY_TABLE_COLUMNS}) FROM STDIN WITH (FORMAT binary)',
+                       BytesIO(wrap_binary_copy(rows)))
+
+def flush_country_buffers(cursor, country_data, first_id, last_id, today):
+    """Write every buffered country row with a binary COPY and mark the id range processed."""
+    for table_name, records in country_data.items():
+        if records:
+            instrumentation.count(rows_out=len(records))
+            copy_country_rows(cursor, table_name, records, today)
+            records.clear()
+
+    # The range (first_id, last_id] is contiguous because staging is read in id order
+    cursor.execute('UPDATE staging SET processed = TRUE WHERE id > %s AND id <= %s AND processed = FALSE',
+                   (first_id, last_id))
+    instrumentation.count(rows_in=cursor.rowcount)
+    set_watermark(cursor, COUNTRY_TABLES_STAGE, last_id)
+
+def fill_country_tables_streaming(conn, today=None, itersize=DEFAULT_ITERSIZE, flush_size=DEFAULT_FLUSH_SIZE):
+    """Route unprocessed staging rows in Python with flat memory use.
+
+    Rows are read in pages of itersize rows by keyset pagination on id, each page
+    resuming after the last id read, and buffered per country table. Whenever
+    flush_size rows are buffered, all buffers are written with binary COPY, the id
+    range read so far is marked processed and the three are committed together. No
+    cursor is held across a commit. An interrupted load keeps its flushed ranges, and
+    the next load resumes after the last one; only the unflushed rows are lost.
+    """
+    import psycopg2.extras
+    cursor = conn.cursor()
+    reader = conn.cursor(cursor_factory=psycopg2.extras.NamedTupleCursor)
+    today = resolve_reference_date(today)
+
+    # Get the stage watermark to determine which records need processing
+    last_processed_id = get_watermark(cursor, COUNTRY_TABLES_STAGE)
+
+    country_data = {}
+    buffered = 0
+    last_flushed_id = last_read_id = last_processed_id
+
+    while True:
+        # Read the next page of new records in id order instead of fetching the whole backlog
+        reader.execute(f'{NEW_RECORDS_SQL} ORDER BY id LIMIT %s', (last_read_id, itersize))
+        page = reader.fetchall()
+        for record in page:
+            last_read_id = record.id
+            routed = route_record(record)
+            if routed:
+                table_name, values = routed
+                country_data.setdefault(table_name, []).append(values)
+                buffered += 1
+
+            if buffered >= flush_size:
+                flush_country_buffers(cursor, country_data, last_flushed_id, last_read_id, today)
+                conn.commit()  # Make the flushed range durable
+                last_flushed_id, buffered = last_read_id, 0
+        if len(page) < itersize:
+            break
+
+    # Flush what is left, including a trailing run of rows with unknown countries
+    if last_read_id > last_flushed_id:
+        flush_country_buffers(cursor, country_data, last_flushed_id, last_read_id, today)
+
+    conn.commit()  # Commit all changes to the database
+
+@instrumentation.stage
 def load_customer_current_country(conn):
     # """Load the current_country table to store the most recent country for each customer."""
     cursor = conn.cursor()
     
-    # Insert or update current country information based on the most recent consultation date
+    # Insert or update current country information based on the most recent consultation date;
+    # of two visits on the same day the later staging row wins, also across runs.
+    # A stored visit that is newer than every new row is kept.
+    # Only staging rows past the stage watermark are ranked, and the watermark is advanced
+    # in the same statement, so the run time depends on the new rows rather than the history.
     cursor.execute('''
-    WITH ranked_customers AS (
+    WITH watermark AS (
+    SELECT
+        COALESCE(MAX(Last_Staging_Id), 0) AS last_id
+    FROM
+        etl_watermarks
+    WHERE
+        Stage = %(stage)s
+    ),
+    new_rows AS (
+    SELECT
+        s.id,
+        s.Customer_Id,
+        s.Customer_Name,
+        s.Country,
+        s.Last_Consulted_Date
+    FROM
+        staging s, watermark w
+    WHERE
+        s.id > w.last_id
+    AND
+        s.processed = FALSE
+    ),
+    ranked_customers AS (
     SELECT
         Customer_Id,
         Customer_Name,
@@ -67,17 +425,16 @@ def load_customer_current_country(conn):
         Last_Consulted_Date,
         ROW_NUMBER() OVER (
             PARTITION BY Customer_Id 
-            ORDER BY Last_Consulted_Date DESC NULLS LAST
+            ORDER BY Last_Consulted_Date DESC NULLS LAST, id DESC
         ) AS rn
     FROM
-        staging
+        new_rows
     WHERE
-        processed = FALSE
-    AND
         Last_Consulted_Date IS NOT NULL
     AND 
         Country IS NOT NULL
-    )
+    ),
+    upserted AS (
     INSERT INTO current_country (Customer_Id, Customer_Name, Country, Last_Consulted_Date)
     SELECT
         Customer_Id,
@@ -92,18 +449,49 @@ def load_customer_current_country(conn):
     DO UPDATE SET
         Customer_Name = EXCLUDED.Customer_Name,
         Country = EXCLUDED.Country,
-        Last_Consulted_Date = EXCLUDED.Last_Consulted_Date;
-    ''')
+        Last_Consulted_Date = EXCLUDED.Last_Consulted_Date
+    WHERE current_country.Last_Consulted_Date IS NULL
+    OR EXCLUDED.Last_Consulted_Date >= current_country.Last_Consulted_Date
+    )
+    INSERT INTO etl_watermarks (Stage, Last_Staging_Id, Updated_At)
+    SELECT %(stage)s, MAX(id), NOW() FROM new_rows HAVING MAX(id) IS NOT NULL
+    ON CONFLICT (Stage)
+    DO UPDATE SET
+        Last_Staging_Id = EXCLUDED.Last_Staging_Id,
+        Updated_At = EXCLUDED.Updated_At;
+    ''', {"stage": CURRENT_COUNTRY_STAGE})
 
     conn.commit()
 
-def main(): 
-    """Main function to execute the data loading process."""
+@instrumentation.stage
+def main(engine="sql", workers=DEFAULT_WORKERS, keep_batches=None, archive_batches=False, country_summary=False,
+         check_summary=False, reference_date=None, refresh_metrics=False):
+    """Main function to execute the data loading process.
+
+    With keep_batches set, fully processed staging batches beyond the newest
+    keep_batches are rotated out once the load has committed. country_summary=True
+    merges the newly loaded rows into country_summary; check_summary=True also
+    compares it with a full recompute. Age and Days_Since_Last_Consulted are derived
+    against reference_date (today by default), pinned once for the whole run;
+    refresh_metrics=True also brings the rows of earlier runs up to it.
+    """
     conn = get_connection()  # Get a database connection from the pool
+    reference_date = resolve_reference_date(reference_date)
 
     try:
         load_customer_current_country(conn) # Load customer data into current country table
-        fill_country_tables(conn)  # Load customer data into country tables
+        fill_country_tables(conn, engine, today=reference_date, workers=workers)  # Load customer data into country tables
+
+        if refresh_metrics:
+            refreshed = refresh_derived_metrics(conn, reference_date)
+            print(f"------Refreshed derived metrics of {sum(refreshed.values())} rows")
+
+        if country_summary or check_summary:
+            maintain_country_summary(conn, check=check_summary)
+
+        if keep_batches is not None:
+            rotated = rotate_staging_partitions(conn, keep_batches, archive=archive_batches)
+            print(f"------Rotated staging batches: {rotated}")
     except Exception as e:
         print(f"An error occurred: {e}")  # Log any errors
         conn.rollback()  # Rollback any changes in case of errors
@@ -0,0 +1,233 @@
+import glob
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from multiprocessing import Manager
+from etl_scripts import instrumentation
+from etl_scripts.copy_stream import CopyStream, DEFAULT_MAX_PENDING
+from etl_scripts.validate_data import (
+    DEFAULT_CHUNKSIZE, get_connection, release_connection, iter_cleaned_chunks, used_categories,
+    staging_copy_sql, encode_staging_rows, prepare_staging, prepare_load_tables
+)
+from etl_scripts.binary_copy import COPY_BINARY_HEADER, COPY_BINARY_TRAILER
+from etl_scripts.staging_partitions import finish_bulk_staging_batch
+
+# Default number of pooled connections running COPY at the same time
+DEFAULT_COPY_CONNECTIONS = 4
+
+# Files picked up when the input is a directory
+INPUT_PATTERN = "*.txt"
+
+# Seconds a COPY thread waits for a chunk before checking that its worker is still running
+CHUNK_POLL_SECONDS = 1
+
+def resolve_input_files(path):
+    """Return the sorted input files named by a file path, a directory or a glob pattern."""
+    if os.path.isdir(path):
+        files = glob.glob(os.path.join(path, INPUT_PATTERN))
+    else:
+        files = glob.glob(path)
+    files = sorted(f for f in files if os.path.isfile(f))
+    if not files:
+        raise FileNotFoundError(f"No input files match {path}")
+    return files
+
+def split_byte_ranges(file_path, parts):
+    """Split the data rows of a file into up to parts byte ranges aligned on line boundaries.
+
+    The header line is left out of every range; returns a list of (start, end) offsets.
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        f.readline()
+        boundaries = [f.tell()]
+        data_start = boundaries[0]
+        for i in range(1, parts):
+            # Step back one byte so an offset already at a line start stays there
+            f.seek(max(data_start + (size - data_start) * i // parts - 1, data_start))
+            f.readline()
+            boundaries.append(max(boundaries[-1], f.tell()))
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+def plan_parts(files, split_parts=1):
+    """Return the (label, file_path, byte_range) work items for the input files.
+
+    byte_range is None when a file is validated whole.
+    """
+    parts = []
+    for file_path in files:
+        if split_parts > 1:
+            for start, end in split_byte_ranges(file_path, split_parts):
+                parts.append((f"{file_path}[{start}:{end}]", file_path, (start, end)))
+        else:
+            parts.append((file_path, file_path, None))
+    return parts
+
+def validate_part(file_path, byte_range, chunksize, chunks, copy_format="csv"):
+    """Validate a file, or one byte range of it, and queue its rows encoded for COPY.
+
+    The file is pipe-delimited text, or a complete binary COPY stream with
+    copy_format="binary". Runs in a worker process; every encoded chunk is put on the
+    bounded chunks queue and None ends it, also when validation fails.
+    Returns (rows_read, rows_loaded, unique_countries).
+    """
+    try:
+        if byte_range is None:
+            source = file_path
+        else:
+            # Every range is parsed with the file's header line in front of it
+            start, end = byte_range
+            with open(file_path, 'rb') as f:
+                header = f.readline()
+                f.seek(start)
+                source = BytesIO(header + f.read(end - start))
+
+        rows_read, rows_loaded, unique_countries = 0, 0, set()
+        binary = copy_format == "binary"
+        if binary:
+            chunks.put(COPY_BINARY_HEADER)
+        for chunk_rows, valid_data in iter_cleaned_chunks(source, chunksize):
+            rows_read += chunk_rows
+            rows_loaded += len(valid_data)
+            unique_countries.update(used_categories(valid_data['Country']))
+            chunks.put(encode_staging_rows(valid_data, copy_format))
+        if binary:
+            chunks.put(COPY_BINARY_TRAILER)
+        return rows_read, rows_loaded, unique_countries
+    finally:
+        chunks.put(None)
+
+def queued_chunks(chunks, validation):
+    """Yield the encoded chunks of one part until its worker ends the queue.
+
+    Stops as well when the worker is gone without ending it, e.g. a killed process.
+    """
+    while True:
+        finished = validation.done()
+        try:
+            chunk = chunks.get(timeout=CHUNK_POLL_SECONDS)
+        except queue.Empty:
+            if finished:
+                return
+            continue
+        if chunk is None:
+            return
+        yield chunk
+
+def copy_part_to_staging(chunks, validation, table, acquire, release, copy_format="csv"):
+    """COPY one part into staging on its own connection while its worker validates it.
+
+    The part is committed only once its validation succeeded; otherwise the COPY is
+    rolled back. Whatever COPY left unread is drained so the worker never stays blocked.
+    """
+    batches = queued_chunks(chunks, validation)
+    try:
+        conn = acquire()
+        try:
+            with CopyStream(batches) as stream:
+                conn.cursor().copy_expert(staging_copy_sql(table, copy_format=copy_format), stream)
+            validation.result()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            release(conn)
+    finally:
+        for _ in batches:
+            pass
+
+@instrumentation.stage
+def ingest_files(files, table='staging', workers=None, copy_connections=DEFAULT_COPY_CONNECTIONS,
+                 split_parts=1, chunksize=DEFAULT_CHUNKSIZE, acquire=None, release=None, copy_format="csv"):
+    """Validate input files in parallel worker processes and COPY them into staging.
+
+    Validation is CPU-bound, so each file (or each of split_parts byte ranges of a
+    file) is cleaned in its own process. Its encoded chunks are streamed through a
+    bounded queue into COPY on one of at most copy_connections connections while the
+    part is still being validated, so nothing is staged on disk. Every part is
+    committed on its own: a bad file is reported without holding back the others.
+    Returns one result dict per part, in input order, with source, rows_read,
+    rows_loaded, countries and error (None on success).
+    acquire/release default to the module connection pool. copy_format="binary" encodes
+    and COPYs the parts as binary streams instead of pipe-delimited text.
+    """
+    acquire = acquire or get_connection
+    release = release or release_connection
+    parts = plan_parts(files, split_parts)
+    results = [{"source": label, "rows_read": 0, "rows_loaded": 0, "countries": set(), "error": None}
+               for label, _, _ in parts]
+
+    with Manager() as manager, \
+            ProcessPoolExecutor(max_workers=workers) as processes, \
+            ThreadPoolExecutor(max_workers=copy_connections) as copiers:
+        # Both pools start parts in input order, so every running worker has a reader
+        in_flight = []
+        for _, file_path, byte_range in parts:
+            chunks = manager.Queue(maxsize=DEFAULT_MAX_PENDING)
+            validation = processes.submit(validate_part, file_path, byte_range, chunksize, chunks, copy_format)
+            copy = copiers.submit(copy_part_to_staging, chunks, validation, table, acquire, release, copy_format)
+            in_flight.append((validation, copy))
+
+        for result, (validation, copy) in zip(results, in_flight):
+            try:
+                rows_read, rows_loaded, countries = validation.result()
+            except Exception as e:
+                result["error"] = f"validation failed: {e}"
+                continue
+            result.update(rows_read=rows_read, rows_loaded=rows_loaded, countries=countries)
+            try:
+                copy.result()
+            except Exception as e:
+                result.update(rows_loaded=0, error=f"COPY failed: {e}")
+
+    # Validation ran in other processes, so its counts are taken from the results
+    rows_in = sum(result["rows_read"] for result in results)
+    rows_out = sum(result["rows_loaded"] for result in results)
+    instrumentation.count(rows_in=rows_in, rows_out=rows_out, rows_rejected=rows_in - rows_out,
+                          bytes_read=sum(os.path.getsize(file_path) for file_path in files))
+    return results
+
+@instrumentation.stage
+def main(input_path, workers=None, copy_connections=DEFAULT_COPY_CONNECTIONS, split_parts=1,
+         chunksize=None, partitioned=False, bulk_load=None, storage="tables", copy_format="csv"):
+    """Run the validation stage over every file matching input_path, validating them in parallel.
+
+    input_path is a file, a directory of *.txt extracts or a glob pattern. All files
+    go into one staging batch. Returns the per-part results.
+    """
+    results = []
+    conn = get_connection()  # Get a database connection from the pool
+    try:
+        files = resolve_input_files(input_path)
+        print(f"------Ingesting {len(files)} file(s) from {input_path}")
+
+        # Create staging table with indexes, and this run's batch partition if partitioned
+        batch_id, staging_table = prepare_staging(conn, input_path, partitioned, bulk_load)
+
+        results = ingest_files(files, staging_table, workers=workers, copy_connections=copy_connections,
+                               split_parts=split_parts, chunksize=chunksize or DEFAULT_CHUNKSIZE,
+                               copy_format=copy_format)
+        for result in results:
+            if result["error"]:
+                print(f"------{result['source']}: {result['error']}")
+            else:
+                print(f"------{result['source']}: loaded {result['rows_loaded']} of {result['rows_read']} rows")
+
+        # Index, analyze and attach the bulk-loaded batch
+        if bulk_load:
+            finish_bulk_staging_batch(conn, batch_id, bulk_load)
+
+        # Create the tables the load stage writes to
+        unique_countries = set().union(*(result["countries"] for result in results))
+        prepare_load_tables(conn, unique_countries, storage)
+    except Exception as e:
+        print(f"An error occurred: {e}")  # Log any errors
+        conn.rollback()  # Rollback any changes in case of errors
+    finally:
+        release_connection(conn)  # Release the connection back to the pool
+
+    print("------Data Validation Completed Successfully.")
+    return results
@@ -0,0 +1,275 @@
+import queue
+import threading
+from io import BytesIO
+from time import perf_counter
+from etl_scripts import instrumentation
+from etl_scripts.validate_data import (
+    DEFAULT_CHUNKSIZE, READ_DTYPES, get_connection, release_connection, clean_chunk, new_vocabularies,
+    unify_categories, used_categories, staging_copy_sql, encode_staging_rows, prepare_staging, prepare_load_tables,
+    create_country_tables, input_size
+)
+from etl_scripts.binary_copy import wrap_binary_copy
+from etl_scripts.validation_rules import RejectWriter
+from etl_scripts.change_detection import load_fingerprint_index
+from etl_scripts.load_data import fill_country_tables, load_customer_current_country
+from etl_scripts.country_summary import maintain_country_summary
+from etl_scripts.derived_metrics import resolve_reference_date, refresh_derived_metrics
+from etl_scripts.staging_partitions import rotate_staging_partitions
+
+# Default number of items buffered between two stages
+DEFAULT_QUEUE_DEPTH = 2
+
+# Seconds between checks for a failed stage while waiting on a queue
+_POLL_INTERVAL = 0.1
+
+# Marker passed down the queues once a stage has no more items
+_END = object()
+
+class _Cancelled(Exception):
+    """Raised inside a stage thread when another stage has failed."""
+
+def _new_stats():
+    return {"items": 0, "busy_seconds": 0.0, "starved_seconds": 0.0, "blocked_seconds": 0.0}
+
+def _put(outbox, item, failed, stats):
+    """Queue an item for the next stage, counting the time spent blocked by backpressure."""
+    start = perf_counter()
+    while True:
+        if failed.is_set():
+            raise _Cancelled()
+        try:
+            outbox.put(item, timeout=_POLL_INTERVAL)
+            break
+        except queue.Full:
+            continue
+    stats["blocked_seconds"] += perf_counter() - start
+
+def _get(inbox, failed, stats):
+    """Take the next item from the previous stage, counting the time spent waiting for it."""
+    start = perf_counter()
+    while True:
+        if failed.is_set():
+            raise _Cancelled()
+        try:
+            item = inbox.get(timeout=_POLL_INTERVAL)
+            break
+        except queue.Empty:
+            continue
+    stats["starved_seconds"] += perf_counter() - start
+    return item
+
+def _run_source(items, outbox, stats, errors, failed, frame):
+    """Pull items from an iterable, timing each next() as busy time."""
+    items = iter(items)
+    with instrumentation.bind_frame(frame):
+        try:
+            while True:
+                start = perf_counter()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                finally:
+                    stats["busy_seconds"] += perf_counter() - start
+                stats["items"] += 1
+                _put(outbox, item, failed, stats)
+            _put(outbox, _END, failed, stats)
+        except _Cancelled:
+            pass
+        except BaseException as e:
+            errors.append(("source", e))
+            failed.set()
+
+def _run_stage(name, work, inbox, outbox, stats, errors, failed, frame):
+    """Apply work to every item of inbox and pass non-None results on to outbox."""
+    with instrumentation.bind_frame(frame):
+        try:
+            while True:
+                item = _get(inbox, failed, stats)
+                if item is _END:
+                    break
+                start = perf_counter()
+                result = work(item)
+                stats["busy_seconds"] += perf_counter() - start
+                stats["items"] += 1
+                if outbox is not None and result is not None:
+                    _put(outbox, result, failed, stats)
+            if outbox is not None:
+                _put(outbox, _END, failed, stats)
+        except _Cancelled:
+            pass
+        except BaseException as e:
+            errors.append((name, e))
+            failed.set()
+
+def run_pipeline(source_name, source, stages, queue_depth=DEFAULT_QUEUE_DEPTH):
+    """Run a source iterable and a chain of (name, work) stages concurrently, one thread each.
+
+    Stages are joined by queues holding at most queue_depth items, so a fast stage
+    blocks instead of buffering unbounded work for a slow one. If any stage raises,
+    the others stop at their next queue operation and the first error is re-raised.
+    Returns {stage_name: stats} with items, busy_seconds, starved_seconds (waiting
+    for input), blocked_seconds (waiting for room downstream) and utilisation
+    (busy time over the pipeline's wall time).
+    """
+    if queue_depth < 1:
+        raise ValueError("queue_depth must be at least 1")
+
+    failed = threading.Event()
+    errors = []
+    # Counts made by the stage threads belong to the caller's instrumented stage
+    frame = instrumentation.current_frame()
+    stats = {source_name: _new_stats()}
+    queues = [queue.Queue(maxsize=queue_depth) for _ in stages]
+    threads = [threading.Thread(target=_run_source, name=f"pipeline-{source_name}", daemon=True,
+                                args=(source, queues[0], stats[source_name], errors, failed, frame))]
+    for index, (name, work) in enumerate(stages):
+        stats[name] = _new_stats()
+        outbox = queues[index + 1] if index + 1 < len(queues) else None
+        threads.append(threading.Thread(target=_run_stage, name=f"pipeline-{name}", daemon=True,
+                                        args=(name, work, queues[index], outbox, stats[name], errors, failed,
+                                              frame)))
+
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_seconds = perf_counter() - start
+
+    if errors:
+        name, error = errors[0]
+        raise RuntimeError(f"Pipeline stage '{name}' failed: {error}") from error
+
+    for stage_stats in stats.values():
+        stage_stats["utilisation"] = stage_stats["busy_seconds"] / wall_seconds if wall_seconds else 0.0
+    return stats
+
+@instrumentation.stage
+def run_etl_pipeline(load_conn, route_conn, file_path, table='staging', chunksize=DEFAULT_CHUNKSIZE,
+                     queue_depth=DEFAULT_QUEUE_DEPTH, engine="sql", storage="tables", today=None,
+                     change_index=None, copy_format="csv", rejects=None):
+    """Validate, load and route an input file with every stage running concurrently.
+
+    read -> validate -> encode -> load -> route: chunk N+1 is parsed while chunk N is
+    COPYed, and the rows of earlier chunks are routed into the country tables on a
+    second connection while later chunks are still being loaded. Each chunk is COPYed
+    and committed on its own, so the routing stage sees it; routing is incremental
+    (watermarks and processed flags), so a failed run can be finished by a normal
+    load. With a change_index only new or changed rows are loaded, and each chunk's
+    fingerprints are inserted in the transaction that commits its COPY, so a failed
+    run leaves no committed row without its fingerprint.
+    copy_format="binary" encodes each chunk as a complete binary COPY stream. Rows
+    failing a validation rule are written to rejects (a RejectWriter) when given.
+    Returns the per-stage stats of run_pipeline.
+    """
+    import pandas as pd
+    vocabularies = new_vocabularies()
+    known_countries = set()
+
+    # current_country only ranks unprocessed rows, so a chunk must not become visible
+    # between it and the country-table fill that marks rows processed. COPY still
+    # streams while rows are routed; only its commit waits for the routing step.
+    route_lock = threading.Lock()
+
+    def validate(chunk):
+        valid_data = unify_categories(clean_chunk(chunk, rejects), vocabularies)
+        # Each chunk's fingerprints travel with it, as validate runs ahead of load
+        return change_index.changed_rows(valid_data) if change_index is not None else (valid_data, None)
+
+    def encode(validated):
+        valid_data, fingerprints = validated
+        countries = used_categories(valid_data['Country'])
+        if copy_format == "binary":
+            # Every chunk is a COPY of its own, so it carries the header and trailer
+            rows = encode_staging_rows(valid_data, copy_format)
+            return countries, wrap_binary_copy(rows) if rows else b"", fingerprints
+        return countries, encode_staging_rows(valid_data).encode("utf-8"), fingerprints
+
+    def load(encoded):
+        countries, data, fingerprints = encoded
+        # Country tables must exist before the routing stage can see their rows
+        if storage == "tables" and not countries <= known_countries:
+            create_country_tables(load_conn, countries - known_countries)
+            known_countries.update(countries)
+        if data:
+            load_conn.cursor().copy_expert(staging_copy_sql(table, copy_format=copy_format), BytesIO(data))
+        if fingerprints is not None:
+            change_index.insert(load_conn, fingerprints)
+        with route_lock:
+            load_conn.commit()
+        return True
+
+    def route(_):
+        with route_lock:
+            load_customer_current_country(route_conn)
+            fill_country_tables(route_conn, engine, today=today)
+
+    instrumentation.count(bytes_read=input_size(file_path))
+    reader = pd.read_csv(file_path, delimiter='|', dtype=READ_DTYPES, chunksize=chunksize)
+    with reader:
+        stats = run_pipeline("read", reader, [
+            ("validate", validate),
+            ("encode", encode),
+            ("load", load),
+            ("route", route),
+        ], queue_depth)
+
+    return stats
+
+def print_stage_report(stats):
+    """Print one utilisation line per pipeline stage."""
+    for name, stage_stats in stats.items():
+        print(f"------{name}: {stage_stats['utilisation']:.0%} busy over {stage_stats['items']} items, "
+              f"waited {stage_stats['starved_seconds']:.2f}s for input, "
+              f"blocked {stage_stats['blocked_seconds']:.2f}s on output")
+
+@instrumentation.stage
+def main(file_path='data/customer_data.txt', chunksize=None, queue_depth=DEFAULT_QUEUE_DEPTH, engine="sql",
+         partitioned=False, storage="tables", keep_batches=None, archive_batches=False, skip_unchanged=False,
+         copy_format="csv", reject_file=None, country_summary=False, check_summary=False, reference_date=None,
+         refresh_metrics=False):
+    """Run validation and loading as one pipelined pass over the input file.
+
+    country_summary/check_summary update and audit country_summary once every
+    chunk is routed, as in load_data.main. Every chunk is routed against the same
+    reference_date, and refresh_metrics=True then refreshes the earlier rows.
+    Returns the per-stage stats, or None if the run failed.
+    """
+    stats = None
+    load_conn = get_connection()  # Get the loading and routing connections from the pool
+    route_conn = get_connection()
+    reference_date = resolve_reference_date(reference_date)
+    try:
+        # Create staging and the load tables up front; country tables follow the data
+        _, staging_table = prepare_staging(load_conn, file_path, partitioned)
+        prepare_load_tables(load_conn, [], storage)
+        change_index = load_fingerprint_index(load_conn) if skip_unchanged else None
+
+        stats = run_etl_pipeline(load_conn, route_conn, file_path, staging_table,
+                                 chunksize=chunksize or DEFAULT_CHUNKSIZE, queue_depth=queue_depth,
+                                 engine=engine, storage=storage, today=reference_date, change_index=change_index,
+                                 copy_format=copy_format,
+                                 rejects=RejectWriter(reject_file) if reject_file else None)
+        print_stage_report(stats)
+
+        if refresh_metrics:
+            refreshed = refresh_derived_metrics(route_conn, reference_date)
+            print(f"------Refreshed derived metrics of {sum(refreshed.values())} rows")
+
+        if country_summary or check_summary:
+            maintain_country_summary(route_conn, check=check_summary)
+
+        if keep_batches is not None:
+            rotated = rotate_staging_partitions(route_conn, keep_batches, archive=archive_batches)
+            print(f"------Rotated staging batches: {rotated}")
+    except Exception as e:
+        print(f"An error occurred: {e}")  # Log any errors
+        load_conn.rollback()  # Rollback any changes in case of errors
+        route_conn.rollback()
+    finally:
+        release_connection(load_conn)  # Release the connections back to the pool
+        release_connection(route_conn)
+
+    print("------Pipelined ETL completed.")
+    return stats
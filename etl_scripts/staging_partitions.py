@@ -0,0 +1,171 @@
+from etl_scripts import instrumentation
+
+# Schema that receives detached staging partitions when they are archived instead of dropped
+STAGING_ARCHIVE_SCHEMA = "staging_archive"
+
+# Durability of a bulk-loaded batch: "logged" survives crashes once attached,
+# "unlogged" skips WAL entirely but is truncated by crash recovery and not replicated
+BULK_LOAD_MODES = ("logged", "unlogged")
+
+def partition_name(batch_id):
+    """Return the name of the staging partition holding one load batch."""
+    return f"staging_b{batch_id}"
+
+def create_partitioned_staging_table(conn):
+    """Create staging as a table LIST-partitioned by load batch, plus the batch registry."""
+    cursor = conn.cursor()
+    # Registry of load batches; rotated batches keep their row for auditing
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS staging_batches (
+        Batch_Id SERIAL PRIMARY KEY,
+        Source VARCHAR(1024),
+        Loaded_At TIMESTAMP NOT NULL DEFAULT NOW(),
+        Rotated_At TIMESTAMP
+    )
+    ''')
+
+    # Same columns as the regular staging table, partitioned by the batch that loaded them
+    cursor.execute('''CREATE TABLE IF NOT EXISTS staging (
+        id SERIAL,
+        Batch_Id INTEGER NOT NULL,
+        Customer_Name VARCHAR(255) NOT NULL,
+        Customer_Id VARCHAR(18) NOT NULL,
+        Open_Date DATE NOT NULL,
+        Last_Consulted_Date DATE,
+        Vaccination_Id CHAR(5),
+        Dr_Name VARCHAR(255),
+        State CHAR(5),
+        Country CHAR(5),
+        DOB DATE,
+        Is_Active CHAR(1),
+        processed BOOLEAN DEFAULT FALSE,
+        PRIMARY KEY (Batch_Id, id)
+    ) PARTITION BY LIST (Batch_Id)''')
+
+    # Refuse to run against a staging table created by the non-partitioned mode
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('staging')")
+    if cursor.fetchone()[0] != 'p':
+        raise ValueError("staging already exists as a regular table; partitioned staging needs a new staging table")
+
+    # Indexes on the parent are created on every partition
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_last_consulted_date ON staging (Last_Consulted_Date);''')
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_staging_unprocessed ON staging (id) WHERE processed = FALSE;''')
+
+    conn.commit()
+
+def register_staging_batch(cursor, source):
+    """Insert a batch into the registry and return its id and partition name."""
+    cursor.execute('INSERT INTO staging_batches (Source) VALUES (%s) RETURNING Batch_Id', (source,))
+    batch_id = cursor.fetchone()[0]
+    return batch_id, partition_name(batch_id)
+
+def start_staging_batch(conn, source):
+    """Register a new load batch and create its partition; returns (batch_id, partition_table)."""
+    cursor = conn.cursor()
+    batch_id, table_name = register_staging_batch(cursor, source)
+
+    # COPY goes straight into the partition, which fills in its own Batch_Id
+    cursor.execute(f'CREATE TABLE {table_name} PARTITION OF staging FOR VALUES IN ({batch_id})')
+    cursor.execute(f'ALTER TABLE {table_name} ALTER COLUMN Batch_Id SET DEFAULT {batch_id}')
+
+    conn.commit()
+    return batch_id, table_name
+
+def start_bulk_staging_batch(conn, source):
+    """Create a detached UNLOGGED table for a new batch, with no indexes yet.
+
+    COPY into this table writes no WAL and maintains no indexes. Call
+    finish_bulk_staging_batch afterwards to index it and attach it to staging.
+    Returns (batch_id, table_name).
+    """
+    cursor = conn.cursor()
+    batch_id, table_name = register_staging_batch(cursor, source)
+
+    # Same columns and defaults as staging, with the batch constraint attach will need
+    cursor.execute(f'CREATE UNLOGGED TABLE {table_name} (LIKE staging INCLUDING DEFAULTS)')
+    cursor.execute(f'ALTER TABLE {table_name} ALTER COLUMN Batch_Id SET DEFAULT {batch_id}')
+    cursor.execute(f'ALTER TABLE {table_name} ADD CONSTRAINT {table_name}_batch CHECK (Batch_Id = {batch_id})')
+
+    conn.commit()
+    return batch_id, table_name
+
+@instrumentation.stage
+def finish_bulk_staging_batch(conn, batch_id, mode="logged"):
+    """Index, analyze and attach a bulk-loaded batch table as a staging partition.
+
+    Indexes are built once over the loaded rows instead of being maintained per row.
+    In "logged" mode the table is switched to LOGGED first, so the batch is crash-safe
+    once this commits; in "unlogged" mode it stays UNLOGGED and its rows are lost if
+    the server crashes. The CHECK constraint lets ATTACH skip its validation scan.
+    """
+    if mode not in BULK_LOAD_MODES:
+        raise ValueError(f"Unknown bulk load mode: {mode}")
+
+    cursor = conn.cursor()
+    table_name = partition_name(batch_id)
+
+    # Rewrite the heap with WAL before the indexes exist, so they are not rewritten too
+    if mode == "logged":
+        cursor.execute(f'ALTER TABLE {table_name} SET LOGGED')
+
+    # Build the indexes matching the partitioned parent in one pass each
+    cursor.execute(f'ALTER TABLE {table_name} ADD PRIMARY KEY (Batch_Id, id)')
+    cursor.execute(f'CREATE INDEX {table_name}_last_consulted_date ON {table_name} (Last_Consulted_Date)')
+    cursor.execute(f'CREATE INDEX {table_name}_unprocessed ON {table_name} (id) WHERE processed = FALSE')
+    cursor.execute(f'ANALYZE {table_name}')
+
+    cursor.execute(f'ALTER TABLE staging ATTACH PARTITION {table_name} FOR VALUES IN ({batch_id})')
+    conn.commit()
+
+@instrumentation.stage
+def rotate_staging_partitions(conn, keep_batches, archive=False):
+    """Drop (or archive) fully processed staging partitions beyond the newest keep_batches.
+
+    Each rotation is a single metadata operation on one partition rather than a
+    DELETE followed by VACUUM. Batches that still have unprocessed rows are always kept,
+    and so are bulk batches whose table was never attached because their load failed;
+    those are left for inspection. With archive=True partitions are detached into the staging_archive schema instead
+    of being dropped. Returns the rotated batch ids.
+    """
+    if keep_batches < 0:
+        raise ValueError("keep_batches must not be negative")
+
+    cursor = conn.cursor()
+    cursor.execute('''
+    SELECT Batch_Id FROM staging_batches
+    WHERE Rotated_At IS NULL
+    ORDER BY Batch_Id DESC
+    OFFSET %s
+    ''', (keep_batches,))
+    candidates = [row[0] for row in cursor.fetchall()]
+
+    rotated = []
+    for batch_id in sorted(candidates):
+        table_name = partition_name(batch_id)
+
+        # A bulk batch is registered before its load, so its table may be missing or detached
+        cursor.execute('''
+        SELECT EXISTS (
+            SELECT 1 FROM pg_inherits
+            WHERE inhrelid = to_regclass(%s) AND inhparent = 'staging'::regclass
+        )
+        ''', (table_name,))
+        if not cursor.fetchone()[0]:
+            continue
+
+        # The partial index on unprocessed rows makes this check cheap
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {table_name} WHERE processed = FALSE)')
+        if cursor.fetchone()[0]:
+            continue
+
+        if archive:
+            cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {STAGING_ARCHIVE_SCHEMA}')
+            cursor.execute(f'ALTER TABLE staging DETACH PARTITION {table_name}')
+            cursor.execute(f'ALTER TABLE {table_name} SET SCHEMA {STAGING_ARCHIVE_SCHEMA}')
+        else:
+            cursor.execute(f'DROP TABLE {table_name}')
+        cursor.execute('UPDATE staging_batches SET Rotated_At = NOW() WHERE Batch_Id = %s', (batch_id,))
+        rotated.append(batch_id)
+
+    conn.commit()
+    return rotated
@@ -1,26 +1,114 @@
-import pandas as pd
+import os
+import threading
+from collections import defaultdict
 from psycopg2 import pool
-from data import country_codes, get_country_name
-
-# Database connection pooling
-db_params = {
-    "host": "localhost",
-    "port": 5432,
-    "database": "my_database",
-    "user": "admin",
-    "password": "admin"
+from data import country_codes, country_map, get_country_name
+from etl_scripts import instrumentation
+from etl_scripts.copy_stream import CopyStream, COPY_READ_SIZE, DEFAULT_MAX_PENDING
+from etl_scripts.binary_copy import COPY_BINARY_HEADER, COPY_BINARY_TRAILER, encode_binary_rows, iter_binary_copy
+from etl_scripts.change_detection import load_fingerprint_index
+from etl_scripts.latest_visits import LatestVisits
+from etl_scripts.validation_rules import RejectWriter, apply_rules
+from etl_scripts.customer_partitions import create_customers_table, ensure_country_partitions
+from etl_scripts.staging_partitions import (
+    create_partitioned_staging_table, start_staging_batch, start_bulk_staging_batch, finish_bulk_staging_batch
+)
+
+# Database connection settings, read from the standard libpq environment variables;
+# the defaults match the local Docker container from the README
+DB_ENV_DEFAULTS = {
+    "host": ("PGHOST", "localhost"),
+    "port": ("PGPORT", "5432"),
+    "database": ("PGDATABASE", "my_database"),
+    "user": ("PGUSER", "admin"),
+    "password": ("PGPASSWORD", "admin"),
 }
 
-# Create a connection pool for efficient DB connection management
-db_pool = pool.SimpleConnectionPool(1, 20, **db_params)
+# Size of the connection pool, from ETL_DB_POOL_MIN / ETL_DB_POOL_MAX
+DEFAULT_POOL_MIN = 1
+DEFAULT_POOL_MAX = 20
+
+def connection_params(environ=None):
+    """Return the psycopg2.connect() keyword arguments configured in the environment."""
+    environ = os.environ if environ is None else environ
+    return {key: environ.get(variable, default) for key, (variable, default) in DB_ENV_DEFAULTS.items()}
+
+db_params = connection_params()
+
+# Thread-safe connection pool, created by the first get_connection() call so that
+# importing the package never opens a connection
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the shared connection pool, creating it on first use."""
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                # Pooled connections count their statements for the run report
+                _db_pool = pool.ThreadedConnectionPool(
+                    int(os.environ.get("ETL_DB_POOL_MIN", DEFAULT_POOL_MIN)),
+                    int(os.environ.get("ETL_DB_POOL_MAX", DEFAULT_POOL_MAX)),
+                    connection_factory=instrumentation.InstrumentedConnection, **db_params
+                )
+    return _db_pool
+
+def close_pool():
+    """Close every pooled connection; the next get_connection() creates a new pool."""
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is not None:
+            _db_pool.closeall()
+            _db_pool = None
+
+# Low-cardinality columns kept as categoricals (dictionary-encoded) from read time to COPY
+CATEGORICAL_COLUMNS = ['Country', 'State', 'Vaccination_Id', 'Dr_Name', 'Is_Active']
+
+# Read every column as text, except the categorical ones
+READ_DTYPES = defaultdict(lambda: str, {col: 'category' for col in CATEGORICAL_COLUMNS})
+
+# Default number of rows per chunk when streaming the input file
+DEFAULT_CHUNKSIZE = 100_000
+
+# Columns loaded into staging by COPY, in file order
+STAGING_COLUMNS = 'Customer_Name, Customer_Id, Open_Date, Last_Consulted_Date, Vaccination_Id, Dr_Name, State, Country, DOB, Is_Active'
+
+# Binary COPY type of every staging column, in STAGING_COLUMNS order
+STAGING_BINARY_TYPES = ['text', 'text', 'date', 'date', 'text', 'text', 'text', 'text', 'date', 'text']
+
+# Where the whole-file mode writes the cleaned rows for a CSV COPY
+CLEANED_FILE_PATH = 'data/cleaned_customer_data.csv'
+
+def staging_copy_sql(table='staging', header=False, copy_format="csv"):
+    """Return the COPY statement loading cleaned rows into a staging table.
+
+    copy_format "csv" reads pipe-delimited text, "binary" reads the stream written
+    by encode_staging_rows (framed by the binary header and trailer).
+    """
+    if copy_format == "binary":
+        options = "FORMAT binary"
+    else:
+        options = "FORMAT CSV, DELIMITER '|', HEADER" if header else "FORMAT CSV, DELIMITER '|'"
+    return f'COPY {table} ({STAGING_COLUMNS}) FROM STDIN WITH ({options})'
+
+def encode_staging_rows(valid_data, copy_format="csv"):
+    """Encode cleaned rows for a staging COPY, without the binary header and trailer.
+
+    Binary rows are written from the typed columns, so dates are sent as day numbers
+    instead of being formatted by pandas and parsed again by PostgreSQL.
+    """
+    if copy_format == "binary":
+        return encode_binary_rows(valid_data, STAGING_BINARY_TYPES)
+    return valid_data.to_csv(sep='|', index=False, header=False)
 
 def get_connection():
     """Get a connection from the pool."""
-    return db_pool.getconn()
+    return get_pool().getconn()
 
 def release_connection(conn):
     """Release a connection back to the pool."""
-    db_pool.putconn(conn)
+    get_pool().putconn(conn)
 
 def validate_header(df):
     """Validate if the DataFrame contains the expected header columns."""
@@ -33,10 +121,15 @@ def validate_header(df):
     if header != expected_header:
         raise ValueError("Invalid header")
 
-def preprocess_data(file_path):
-    """Preprocess the input CSV file, clean data, and handle invalid/missing values."""
-    # Read CSV into a pandas DataFrame
-    df = pd.read_csv(file_path, delimiter='|', dtype={'Customer_Id': str})
+def clean_chunk(df, rejects=None):
+    """Validate and clean one DataFrame of raw customer records.
+
+    Rows are checked against validation_rules.VALIDATION_RULES in one vectorised
+    pass. Rows failing any rule are written with their reason codes to rejects
+    (a RejectWriter) when given.
+    """
+    import pandas as pd
+    rows_in = len(df)
 
     # Drop unnecessary columns like 'Unnamed: 0' and 'H' (if they exist)
     columns_to_drop = [col for col in ['Unnamed: 0', 'H'] if col in df.columns]
@@ -45,51 +138,190 @@ def preprocess_data(file_path):
     # Validate if the header is correct
     validate_header(df)
 
-    # Define the mandatory columns
-    mandatory_columns = ['Customer_Name', 'Customer_Id', 'Open_Date']
+    # Make sure the low-cardinality columns are dictionary-encoded
+    for col in CATEGORICAL_COLUMNS:
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
 
-    # Keep rows where mandatory columns are present
-    valid_data = df.dropna(subset=mandatory_columns)  
-    
-    # Ensure Customer_Id length does not exceed 18 characters
-    valid_data = valid_data[valid_data['Customer_Id'].str.len() <= 18]
-
-    # Reformat and convert 'DOB' from DDMMYYYY to YYYYMMDD, and then to datetime
-    valid_data['DOB'] = (
-        valid_data['DOB'].str.slice(4, 8) +  # Year (YYYY)
-        valid_data['DOB'].str.slice(2, 4) +  # Month (MM)
-        valid_data['DOB'].str.slice(0, 2)    # Day (DD)
-    )
+    # Evaluate every rule at once: rejected rows are dropped, invalid optional dates become NaT
+    valid_data, reported = apply_rules(df)
+    if rejects is not None:
+        rejects.write(reported)
 
-    # Convert 'Open_Date','Last_Consulted_Date', 'DOB' to datetime
-    date_columns = ['Open_Date', 'Last_Consulted_Date', 'DOB']
-    valid_data[date_columns] = valid_data[date_columns].apply(pd.to_datetime, format='%Y%m%d', errors='coerce')
+    instrumentation.count(rows_in=rows_in, rows_out=len(valid_data), rows_rejected=rows_in - len(valid_data))
+    return valid_data
 
-    #Drop rows with invalid dates
-    valid_data = valid_data.dropna(subset=['Open_Date'])
+def input_size(file_path):
+    """Return the size in bytes of an input given by path for the run report.
 
-    # Replace empty strings with None, and handle NaT values
-    valid_data.replace("", None, inplace=True)  # Convert empty strings to None
-    valid_data = valid_data.where(valid_data.notna(), None)  # Convert NaT (and any other NaN) to None
+    Returns 0 for file objects, for paths pandas reads but the OS cannot stat, and
+    when no stage is being recorded, so uninstrumented runs never stat the input.
+    """
+    if instrumentation.current_frame() is None or not isinstance(file_path, (str, os.PathLike)):
+        return 0
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
 
-    #Covert the datatype from object to datetime
-    valid_data['Open_Date'] = valid_data['Open_Date'].astype('datetime64[ns]')
-    valid_data['Last_Consulted_Date'] = valid_data['Last_Consulted_Date'].astype('datetime64[ns]')
-    valid_data['DOB'] = valid_data['DOB'].astype('datetime64[ns]')
+@instrumentation.stage
+def preprocess_data(file_path, change_index=None, latest_visits=None, cleaned_file_path=CLEANED_FILE_PATH,
+                    rejects=None):
+    """Preprocess the input CSV file, clean data, and handle invalid/missing values.
+
+    With a change_index (FingerprintIndex) only new or changed rows are kept. The
+    kept rows are also folded into latest_visits (LatestVisits) when given. With
+    cleaned_file_path=None no cleaned file is written and None is returned as its path.
+    Rows failing a validation rule are written to rejects (a RejectWriter) when given.
+    """
+    import pandas as pd
+    instrumentation.count(bytes_read=input_size(file_path))
+    # Read CSV into a pandas DataFrame, keeping dates as text for the date parser
+    df = pd.read_csv(file_path, delimiter='|', dtype=READ_DTYPES)
+
+    # Validate and clean the whole file in one pass
+    valid_data = clean_chunk(df, rejects)
+
+    # Drop rows that were already loaded with the same values
+    if change_index is not None:
+        valid_data = change_index.filter_changed(valid_data)
+
+    # Track each customer's latest visit while the data is in memory
+    if latest_visits is not None:
+        latest_visits.add(valid_data)
 
     # Save the cleaned and formatted data to a new CSV file for use with the COPY command
-    cleaned_file_path = 'data/cleaned_customer_data.csv'
-    valid_data.to_csv(cleaned_file_path, sep='|', index=False)
+    if cleaned_file_path is not None:
+        valid_data.to_csv(cleaned_file_path, sep='|', index=False)
     
     return valid_data, cleaned_file_path, valid_data['Country'].unique()  # Return cleaned data path and unique countries
 
-def copy_data_to_staging(conn, cleaned_file_path):
+def new_vocabularies():
+    """Return the shared category vocabularies, with Country seeded from country_map."""
+    import pandas as pd
+    vocabularies = {col: pd.Index([], dtype=object) for col in CATEGORICAL_COLUMNS}
+    vocabularies['Country'] = pd.Index(list(country_map), dtype=object)
+    return vocabularies
+
+def unify_categories(df, vocabularies):
+    """Re-encode the categorical columns of a chunk against vocabularies shared by every chunk.
+
+    New values are appended to the vocabulary, so a value keeps the same integer
+    code in every chunk and chunks can be compared or grouped by code.
+    """
+    import pandas as pd
+    for col in CATEGORICAL_COLUMNS:
+        categories = df[col].cat.categories
+        vocabulary = vocabularies[col]
+        new_values = categories[~categories.isin(vocabulary)]
+        if len(new_values):
+            vocabulary = vocabularies[col] = vocabulary.append(pd.Index(new_values, dtype=object))
+        df[col] = df[col].cat.set_categories(vocabulary)
+    return df
+
+def used_categories(series):
+    """Return the distinct non-null values of a column, read from its category table when encoded."""
+    import pandas as pd
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = pd.unique(series.cat.codes.to_numpy())
+        return set(series.cat.categories.take(codes[codes >= 0]))
+    return set(series.dropna().unique())
+
+def iter_cleaned_chunks(file_path, chunksize=DEFAULT_CHUNKSIZE, vocabularies=None, rejects=None):
+    """Read the input file in row chunks and yield (rows_read, cleaned_chunk) pairs."""
+    import pandas as pd
+    # Read dates and ids as text so type inference cannot differ between chunks
+    # (e.g. a chunk where every DOB is numeric would otherwise lose leading zeros)
+    vocabularies = new_vocabularies() if vocabularies is None else vocabularies
+    instrumentation.count(bytes_read=input_size(file_path))
+    reader = pd.read_csv(file_path, delimiter='|', dtype=READ_DTYPES, chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            yield len(chunk), unify_categories(clean_chunk(chunk, rejects), vocabularies)
+
+@instrumentation.stage
+def copy_data_to_staging(conn, cleaned_file_path, table='staging'):
     with open(cleaned_file_path, 'r') as f:
         cursor = conn.cursor()
         # Use the COPY command to load data efficiently into PostgreSQL
-        cursor.copy_expert('COPY staging (Customer_Name, Customer_Id, Open_Date, Last_Consulted_Date, Vaccination_Id, Dr_Name, State, Country, DOB, Is_Active) FROM STDIN WITH (FORMAT CSV, DELIMITER \'|\', HEADER)', f)
+        cursor.copy_expert(staging_copy_sql(table, header=True), f)
+    instrumentation.count(bytes_read=input_size(cleaned_file_path), rows_in=cursor.rowcount, rows_out=cursor.rowcount)
     conn.commit()
 
+@instrumentation.stage
+def copy_frame_to_staging(conn, valid_data, table='staging', max_pending=DEFAULT_MAX_PENDING):
+    """Load a cleaned DataFrame into staging with a binary COPY, without an intermediate file.
+
+    Blocks of rows are encoded on the CopyStream producer thread while COPY sends
+    the previous ones.
+    """
+    cursor = conn.cursor()
+    with CopyStream(iter_binary_copy(valid_data, STAGING_BINARY_TYPES), max_pending=max_pending) as stream:
+        cursor.copy_expert(staging_copy_sql(table, copy_format="binary"), stream, size=COPY_READ_SIZE)
+    instrumentation.count(rows_in=len(valid_data), rows_out=cursor.rowcount)
+    conn.commit()
+
+@instrumentation.stage
+def stream_data_to_staging(conn, file_path, chunksize=DEFAULT_CHUNKSIZE, debug_file_path=None,
+                           max_pending=DEFAULT_MAX_PENDING, table='staging', change_index=None,
+                           latest_visits=None, copy_format="csv", rejects=None, save_state=True):
+    """Validate the input file chunk by chunk and pipe the cleaned rows into a single COPY.
+
+    Chunks are parsed and encoded on a producer thread while COPY sends the previous
+    ones, and no intermediate file is written unless debug_file_path is given. Peak
+    memory is bounded by a few chunks regardless of the file size, and the load runs
+    in a single transaction, so a failure leaves staging untouched. With a
+    change_index only new or changed rows are loaded, and their fingerprints are
+    saved in the same transaction. With latest_visits the latest visit of every
+    customer is upserted into current_country in the same transaction too.
+    copy_format="binary" sends typed binary rows instead of CSV text; the debug file
+    then holds the same binary stream. Rows failing a validation rule are written to
+    rejects (a RejectWriter) when given. save_state=False leaves saving change_index
+    and latest_visits to the caller, for a bulk batch that is only attached later.
+    Returns (rows_read, rows_loaded, unique_countries).
+    """
+    cursor = conn.cursor()
+    stats = {"rows_read": 0, "rows_loaded": 0}
+    unique_countries = set()
+
+    binary = copy_format == "binary"
+
+    def chunk_batches():
+        if binary:
+            yield COPY_BINARY_HEADER
+        for chunk_rows, valid_data in iter_cleaned_chunks(file_path, chunksize, rejects=rejects):
+            if change_index is not None:
+                valid_data = change_index.filter_changed(valid_data)
+            if latest_visits is not None:
+                latest_visits.add(valid_data)
+            stats["rows_read"] += chunk_rows
+            stats["rows_loaded"] += len(valid_data)
+            unique_countries.update(used_categories(valid_data['Country']))
+            yield encode_staging_rows(valid_data, copy_format)
+        if binary:
+            yield COPY_BINARY_TRAILER
+
+    def encoded_batches():
+        # Runs on the producer thread of the CopyStream
+        debug_file = open(debug_file_path, 'wb' if binary else 'w') if debug_file_path else None
+        try:
+            for batch in chunk_batches():
+                if debug_file:
+                    debug_file.write(batch)
+                yield batch
+        finally:
+            if debug_file:
+                debug_file.close()
+
+    # Use the COPY command to load the piped batches efficiently into PostgreSQL
+    with CopyStream(encoded_batches(), max_pending=max_pending) as stream:
+        cursor.copy_expert(staging_copy_sql(table, copy_format=copy_format), stream, size=COPY_READ_SIZE)
+
+    if save_state:
+        save_run_state(conn, change_index, latest_visits)
+    conn.commit()
+    return stats["rows_read"], stats["rows_loaded"], unique_countries
+
 def create_staging_table_with_indexes(conn):
     """Create the staging table and add indexes for performance optimization."""
     cursor = conn.cursor()
@@ -111,16 +343,31 @@ def create_staging_table_with_indexes(conn):
 
     # Create indexes for performance on frequently queried columns
     cursor.execute('''CREATE INDEX IF NOT EXISTS idx_last_consulted_date ON staging (Last_Consulted_Date);''')
+
+    # Partial index over the unprocessed rows only, matching the incremental load predicates
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_staging_unprocessed ON staging (id) WHERE processed = FALSE;''')
     
     conn.commit()
 
+def create_watermark_table(conn):
+    """Create the table holding the last staging id committed by each load stage."""
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS etl_watermarks (
+        Stage VARCHAR(64) PRIMARY KEY,
+        Last_Staging_Id BIGINT NOT NULL,
+        Updated_At TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    ''')
+    conn.commit()
+
 def create_country_tables(conn, countries):
     # """Create country-specific tables based on the unique country codes."""
     cursor = conn.cursor()
     for country_code in countries:
         if country_code in country_codes:
             country_name = get_country_name(country_code)
-            table_name = f"Table_{country_name}"
+            table_name = f"table_{country_name}"  # Same lowercase name the loads use
             cursor.execute(f'''
             CREATE TABLE IF NOT EXISTS {table_name} (
                 id SERIAL PRIMARY KEY,
@@ -140,6 +387,26 @@ def create_country_tables(conn, countries):
             ''')
     conn.commit()
 
+def create_country_map_table(conn):
+    """Create the country_map lookup table and sync it with data.country_names.country_map."""
+    import psycopg2.extras
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS country_map (
+        Country_Code VARCHAR(5) PRIMARY KEY,
+        Country_Name VARCHAR(255) NOT NULL
+    )
+    ''')
+
+    # Upsert every mapping so codes added to country_map are routed on the next load
+    psycopg2.extras.execute_values(
+        cursor,
+        '''INSERT INTO country_map (Country_Code, Country_Name) VALUES %s
+        ON CONFLICT (Country_Code) DO UPDATE SET Country_Name = EXCLUDED.Country_Name''',
+        list(country_map.items())
+    )
+    conn.commit()
+
 def create_customer_current_country(conn):
     # """Create the current_country table to store the most recent country for each customer."""
     cursor = conn.cursor()
@@ -155,25 +422,132 @@ def create_customer_current_country(conn):
     ''')
     conn.commit()
 
-def main():
-    conn = get_connection()  # Get a database connection from the pool
-    try:
-        file_path = 'data/customer_data.txt'
-        
-        # Preprocess data and get valid cleaned file path and unique country list
-        valid_df, cleaned_file_path, unique_countries = preprocess_data(file_path)
-        
-        # Create staging table with indexes
+@instrumentation.stage
+def prepare_staging(conn, source, partitioned=False, bulk_load=None):
+    """Create staging and, when partitioned, this run's batch; returns (batch_id, staging_table).
+
+    batch_id is None for the regular staging table.
+    """
+    if bulk_load:
+        create_partitioned_staging_table(conn)
+        batch_id, staging_table = start_bulk_staging_batch(conn, source)
+        print(f"------Bulk loading batch {batch_id} into {staging_table} ({bulk_load})")
+    elif partitioned:
+        create_partitioned_staging_table(conn)
+        batch_id, staging_table = start_staging_batch(conn, source)
+        print(f"------Loading batch {batch_id} into {staging_table}")
+    else:
         create_staging_table_with_indexes(conn)
-        
-        # Load valid data into the staging table
-        copy_data_to_staging(conn, cleaned_file_path)
+        batch_id, staging_table = None, 'staging'
+    return batch_id, staging_table
+
+@instrumentation.stage
+def prepare_load_tables(conn, unique_countries, storage="tables"):
+    """Create the tables the load stage writes to, for the countries seen in the valid data."""
+    # Push the country-code mapping into the database for the set-based load
+    create_country_map_table(conn)
 
+    if storage == "partitioned":
+        # One partition per country in country_map; DDL only runs for new countries
+        create_customers_table(conn)
+        added = ensure_country_partitions(conn)
+        if added:
+            print(f"------Added customer partitions: {added}")
+    else:
         # Create country-specific tables based on the unique countries in the valid data
         create_country_tables(conn, unique_countries)
 
-        # Update the current_country table with the most recent country data for each customer
-        create_customer_current_country(conn)
+    # Track how far each load stage has consumed staging
+    create_watermark_table(conn)
+
+    # Update the current_country table with the most recent country data for each customer
+    create_customer_current_country(conn)
+
+@instrumentation.stage
+def save_run_state(conn, change_index=None, latest_visits=None):
+    """Write this run's new fingerprints and current_country winners, without committing.
+
+    Call it in the transaction that makes the run's rows visible in staging, so the
+    two are committed or lost together.
+    """
+    if change_index is not None:
+        change_index.save(conn)
+    if latest_visits is not None:
+        latest_visits.save(conn)
+
+def main(file_path='data/customer_data.txt', chunksize=None, debug_file_path=None, partitioned=False,
+         bulk_load=None, storage="tables", skip_unchanged=False, current_country_in_validation=False,
+         copy_format="csv", reject_file=None):
+    """Run the validation stage; a chunksize streams the file instead of loading it whole.
+
+    With partitioned=True staging is partitioned by load batch and this run's rows
+    are loaded into a new batch partition. bulk_load ("logged" or "unlogged") loads
+    the batch into a detached UNLOGGED table, builds its indexes after COPY and then
+    attaches it; it implies partitioned staging. storage="partitioned" keeps customers
+    in one table LIST-partitioned by country instead of separate country tables.
+    skip_unchanged=True only loads rows whose fingerprint is not in row_fingerprints yet.
+    current_country_in_validation=True finds each customer's latest visit while the
+    file is validated and upserts only the winners, instead of ranking staging later.
+    copy_format="binary" loads staging with a binary COPY of the typed columns; the
+    whole-file mode then writes no cleaned CSV file. With a reject_file every row
+    failing a validation rule is written there with its reason codes.
+    """
+    conn = get_connection()  # Get a database connection from the pool
+    try:
+        # Create staging table with indexes, and this run's batch partition if partitioned
+        batch_id, staging_table = prepare_staging(conn, file_path, partitioned, bulk_load)
+
+        # Fingerprints of the rows loaded by earlier runs
+        change_index = load_fingerprint_index(conn) if skip_unchanged else None
+
+        # Running latest visit per customer, checked against the stored backlog first
+        latest_visits = None
+        if current_country_in_validation:
+            latest_visits = LatestVisits()
+            latest_visits.begin(conn)
+
+        # Rows failing the validation rules, with their reason codes
+        rejects = RejectWriter(reject_file) if reject_file else None
+
+        if chunksize:
+            # Validate and load the file chunk by chunk with bounded memory
+            rows_read, rows_loaded, unique_countries = stream_data_to_staging(
+                conn, file_path, chunksize, debug_file_path=debug_file_path, table=staging_table,
+                change_index=change_index, latest_visits=latest_visits, copy_format=copy_format, rejects=rejects,
+                save_state=not bulk_load)
+            print(f"------Streamed {rows_loaded} of {rows_read} rows into staging")
+        else:
+            # Preprocess data and get valid cleaned file path and unique country list
+            cleaned_file_path = None if copy_format == "binary" else CLEANED_FILE_PATH
+            valid_df, cleaned_file_path, unique_countries = preprocess_data(
+                file_path, change_index, latest_visits, cleaned_file_path, rejects)
+            if change_index is not None:
+                print(f"------{len(valid_df)} new or changed rows")
+            # Saved in the transaction that COPY commits
+            if not bulk_load:
+                save_run_state(conn, change_index, latest_visits)
+
+            # Load valid data into the staging table
+            if copy_format == "binary":
+                copy_frame_to_staging(conn, valid_df, table=staging_table)
+            else:
+                copy_data_to_staging(conn, cleaned_file_path, table=staging_table)
+
+        # Index, analyze and attach the bulk-loaded batch; its rows only reach staging
+        # then, so the fingerprints and winners are committed with the attach
+        if bulk_load:
+            save_run_state(conn, change_index, latest_visits)
+            finish_bulk_staging_batch(conn, batch_id, bulk_load)
+
+        # The new rows are in staging, so the load stage need not rank them
+        if latest_visits is not None:
+            latest_visits.advance_watermark(conn)
+
+        if rejects is not None:
+            print(f"------{rejects.rows} rows reported to {reject_file}")
+
+        # Create the tables the load stage writes to
+        prepare_load_tables(conn, unique_countries, storage)
     except Exception as e:
         print(f"An error occurred: {e}")  # Log any errors
         conn.rollback()  # Rollback any changes in case of errors
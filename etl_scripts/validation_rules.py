@@ -0,0 +1,168 @@
+import threading
+from collections import namedtuple
+from data import country_codes
+
+# What happens to a row that fails a rule
+REJECT = "reject"  # the row is not loaded
+NULLIFY = "null"   # the failing value is loaded as NULL
+FLAG = "flag"      # the row is loaded unchanged and only reported
+RULE_ACTIONS = (REJECT, NULLIFY, FLAG)
+
+# One declarative check on one column; argument depends on the kind: the maximum
+# length, the date_parsing layout ("YYYYMMDD" or "DDMMYYYY") or the allowed values
+Rule = namedtuple("Rule", ["code", "kind", "column", "argument", "action"])
+
+# Rules applied to every input row, in reason-code order. Lengths match the staging
+# columns, so a value that would make the whole COPY fail rejects only its row.
+VALIDATION_RULES = [
+    Rule("CUSTOMER_NAME_MISSING", "not_null", "Customer_Name", None, REJECT),
+    Rule("CUSTOMER_ID_MISSING", "not_null", "Customer_Id", None, REJECT),
+    Rule("OPEN_DATE_MISSING", "not_null", "Open_Date", None, REJECT),
+    Rule("CUSTOMER_NAME_TOO_LONG", "max_length", "Customer_Name", 255, REJECT),
+    Rule("CUSTOMER_ID_TOO_LONG", "max_length", "Customer_Id", 18, REJECT),
+    Rule("VACCINATION_ID_TOO_LONG", "max_length", "Vaccination_Id", 5, REJECT),
+    Rule("DR_NAME_TOO_LONG", "max_length", "Dr_Name", 255, REJECT),
+    Rule("STATE_TOO_LONG", "max_length", "State", 5, REJECT),
+    Rule("COUNTRY_TOO_LONG", "max_length", "Country", 5, REJECT),
+    Rule("IS_ACTIVE_TOO_LONG", "max_length", "Is_Active", 1, REJECT),
+    Rule("OPEN_DATE_INVALID", "date_format", "Open_Date", "YYYYMMDD", REJECT),
+    Rule("LAST_CONSULTED_DATE_INVALID", "date_format", "Last_Consulted_Date", "YYYYMMDD", NULLIFY),
+    Rule("DOB_INVALID", "date_format", "DOB", "DDMMYYYY", NULLIFY),
+    # Visits from other countries stay in staging and current_country, so they are only reported
+    Rule("COUNTRY_NOT_ALLOWED", "allowed_values", "Country", country_codes, FLAG),
+]
+
+# Columns of the reject file: the raw input values, whether the row was loaded and why it was reported
+REJECT_COLUMNS = ['Customer_Name', 'Customer_Id', 'Open_Date', 'Last_Consulted_Date', 'Vaccination_Id',
+                  'Dr_Name', 'State', 'Country', 'DOB', 'Is_Active', 'Loaded', 'Reason_Codes']
+
+def _as_mask(result):
+    """Return a check result as a writable numpy bool array, with missing results passing."""
+    import numpy as np
+    return np.array(result.to_numpy(dtype=bool, na_value=False) if hasattr(result, "to_numpy") else result, dtype=bool)
+
+def _value_check(values, check, missing):
+    """Apply check to a column and return the failures per row.
+
+    Categorical columns are checked once per category. Missing values fail when
+    missing is True, whatever check returns for them.
+    """
+    import numpy as np
+    import pandas as pd
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        per_category = np.append(_as_mask(check(pd.Series(values.cat.categories))), missing)
+        codes = values.cat.codes.to_numpy()
+        return per_category[np.where(codes < 0, len(per_category) - 1, codes)]
+    failed = _as_mask(check(values))
+    failed[values.isna().to_numpy()] = missing
+    return failed
+
+def _not_null(values, argument):
+    return _value_check(values, lambda values: values == "", True), None
+
+def _too_long(values, limit):
+    failed = _as_mask(values.str.len() > limit)
+    # PostgreSQL truncates excess trailing spaces instead of failing, so they do not
+    # count; only the few long values are stripped and measured again
+    if failed.any():
+        failed[failed] = _as_mask(values[failed].str.rstrip(' ').str.len() > limit)
+    return failed
+
+def _max_length(values, argument):
+    return _value_check(values, lambda values: _too_long(values, argument), False), None
+
+def _allowed_values(values, argument):
+    return _value_check(values, lambda values: ~values.isin(list(argument)), False), None
+
+def _date_format(values, argument):
+    from etl_scripts.date_parsing import parse_fixed_width_dates
+    # The parsed dates replace the text column, with NaT for invalid values
+    dates, invalid = parse_fixed_width_dates(values, argument)
+    return invalid, dates
+
+# Vectorised check of every rule kind: returns (failed, converted column or None)
+RULE_CHECKS = {
+    "not_null": _not_null,
+    "max_length": _max_length,
+    "allowed_values": _allowed_values,
+    "date_format": _date_format,
+}
+
+def apply_rules(df, rules=VALIDATION_RULES):
+    """Evaluate every rule over df in one vectorised pass.
+
+    Each rule sets one bit of a per-row failure mask, so the rows are filtered
+    once, whatever the number of rules. Returns (valid_data, rejects): the rows
+    that pass every REJECT rule, with date columns parsed and NULLIFY failures
+    cleared, and the raw values of every row that failed any rule with its
+    REJECT_COLUMNS Loaded flag and ';'-separated reason codes.
+    """
+    import numpy as np
+    if len(rules) > 64:
+        raise ValueError(f"At most 64 rules fit in the failure mask, got {len(rules)}")
+    unknown = {rule.kind for rule in rules} - set(RULE_CHECKS)
+    if unknown:
+        raise ValueError(f"Unknown rule kinds: {sorted(unknown)}")
+    unknown = {rule.action for rule in rules} - set(RULE_ACTIONS)
+    if unknown:
+        raise ValueError(f"Unknown rule actions: {sorted(unknown)}")
+
+    failures = np.zeros(len(df), dtype=np.uint64)
+    reject_bits = np.uint64(0)
+    converted = {}
+    nullified = {}
+    for bit, rule in enumerate(rules):
+        # Every rule sees the raw input column
+        failed, values = RULE_CHECKS[rule.kind](df[rule.column], rule.argument)
+        failures |= failed.astype(np.uint64) << np.uint64(bit)
+        if values is not None:
+            converted[rule.column] = values
+        if rule.action == REJECT:
+            reject_bits |= np.uint64(1) << np.uint64(bit)
+        elif rule.action == NULLIFY:
+            nullified[rule.column] = nullified.get(rule.column, False) | failed
+
+    # Convert and clear on a shallow copy, so df keeps the raw values for the reject output
+    checked = df.copy(deep=False)
+    for column, values in converted.items():
+        checked[column] = values
+    for column, failed in nullified.items():
+        if failed.any():
+            checked[column] = checked[column].mask(failed)
+
+    rejected = (failures & reject_bits) != 0
+    valid_data = checked[~rejected] if rejected.any() else checked
+
+    reported = failures != 0
+    rejects = df.loc[reported, REJECT_COLUMNS[:-2]].copy()
+    if len(rejects):
+        # Rows share few distinct failure masks, so each mask is turned into codes once
+        masks, inverse = np.unique(failures[reported], return_inverse=True)
+        codes = np.array([';'.join(rule.code for bit, rule in enumerate(rules) if int(mask) >> bit & 1)
+                          for mask in masks], dtype=object)
+        rejects['Loaded'] = np.where(rejected[reported], 'N', 'Y')
+        rejects['Reason_Codes'] = codes[inverse]
+    else:
+        rejects = rejects.reindex(columns=REJECT_COLUMNS)
+    return valid_data, rejects
+
+class RejectWriter:
+    """Appends reported rows and their reason codes to a pipe-delimited reject file.
+
+    The file is truncated and given its header when the writer is created. write()
+    may be called from several threads; every chunk is written with one to_csv call.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._lock = threading.Lock()
+        with open(path, 'w') as f:
+            f.write('|'.join(REJECT_COLUMNS) + '\n')
+
+    def write(self, rejects):
+        if not len(rejects):
+            return
+        with self._lock:
+            rejects.to_csv(self.path, sep='|', index=False, header=False, mode='a')
+            self.rows += len(rejects)
@@ -1,13 +1,130 @@
-from etl_scripts import validate_main, load_main
+import argparse
+import os
+from datetime import date
+from etl_scripts import (
+    validate_main, ingest_main, load_main, pipeline_main, instrumented_run, LOAD_ENGINES, BULK_LOAD_MODES,
+    DEFAULT_QUEUE_DEPTH, COPY_FORMATS
+)
+
+def parse_args():
+    """Parse command line options for the ETL run."""
+    parser = argparse.ArgumentParser(description="Validate customer data and load it into PostgreSQL.")
+    parser.add_argument("--input", default="data/customer_data.txt",
+                        help="Pipe-delimited input file, or a directory or glob of files validated in parallel")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Stream the input in chunks of this many rows instead of loading it whole")
+    parser.add_argument("--debug-cleaned-file", default=None,
+                        help="With --chunksize, also write the cleaned rows piped into COPY to this file")
+    parser.add_argument("--ingest-workers", type=int, default=None,
+                        help="Worker processes validating input files in parallel (default: one per CPU)")
+    parser.add_argument("--split-parts", type=int, default=1,
+                        help="Split each input file into this many line-aligned byte ranges validated in parallel")
+    parser.add_argument("--copy-connections", type=int, default=4,
+                        help="Pooled connections running COPY at the same time during parallel ingestion")
+    parser.add_argument("--storage", choices=("tables", "partitioned"), default="tables",
+                        help="Keep customers in separate country tables (default) or in one table "
+                             "LIST-partitioned by country whose partitions are the country tables")
+    parser.add_argument("--load-engine", choices=LOAD_ENGINES, default=None,
+                        help="Route staging rows with set-based SQL (default) or the Python fallback; "
+                             "defaults to 'partitioned' with --storage partitioned")
+    parser.add_argument("--load-workers", type=int, default=8,
+                        help="Worker threads for --load-engine parallel")
+    parser.add_argument("--keep-batches", type=int, default=None,
+                        help="Partition staging by load batch and keep only this many batches after loading")
+    parser.add_argument("--archive-batches", action="store_true",
+                        help="With --keep-batches, detach old batches into the staging_archive schema instead of dropping them")
+    parser.add_argument("--bulk-load", choices=BULK_LOAD_MODES, default=None,
+                        help="Load the batch into an UNLOGGED table and build indexes after COPY. "
+                             "'logged' makes the batch crash-safe before attaching it; 'unlogged' keeps it "
+                             "unlogged, so it is lost if the server crashes")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Run read, validate, encode, load and route concurrently over bounded queues "
+                             "and report per-stage utilisation")
+    parser.add_argument("--queue-depth", type=int, default=DEFAULT_QUEUE_DEPTH,
+                        help="With --pipeline, chunks buffered between two stages")
+    parser.add_argument("--skip-unchanged", action="store_true",
+                        help="Only load rows that are new or changed since earlier runs, using the row "
+                             "fingerprints kept in the row_fingerprints table")
+    parser.add_argument("--current-country-in-validation", action="store_true",
+                        help="Find each customer's latest visit while validating and upsert only the "
+                             "winners that are newer than current_country, instead of ranking staging")
+    parser.add_argument("--copy-format", choices=COPY_FORMATS, default="csv",
+                        help="Send cleaned rows to staging as pipe-delimited text (default) or as binary "
+                             "COPY tuples encoded straight from the typed columns")
+    parser.add_argument("--reference-date", type=date.fromisoformat, default=None,
+                        help="Date (YYYY-MM-DD) that Age and Days_Since_Last_Consulted are computed against "
+                             "(default: the day the run starts)")
+    parser.add_argument("--refresh-derived-metrics", action="store_true",
+                        help="After loading, recompute Age and Days_Since_Last_Consulted of rows already in the "
+                             "country tables, updating only the rows whose values change")
+    parser.add_argument("--country-summary", action="store_true",
+                        help="After loading, merge the new country-table rows into the country_summary table")
+    parser.add_argument("--check-country-summary", action="store_true",
+                        help="Also compare country_summary with a full recompute over the country tables")
+    parser.add_argument("--reject-file", default=None,
+                        help="Write every row failing a validation rule to this pipe-delimited file, with "
+                             "whether it was loaded and its reason codes")
+    parser.add_argument("--metrics-report", default=None,
+                        help="Write per-stage wall/CPU time, row and byte counts, DB round trips and "
+                             "peak memory of the run to this JSON file")
+    parser.add_argument("--prometheus-textfile", default=None,
+                        help="Write the same metrics to this file for the node_exporter textfile collector")
+    args = parser.parse_args()
+    if args.skip_unchanged and not args.pipeline and (
+            not os.path.isfile(args.input) or args.ingest_workers or args.split_parts > 1):
+        parser.error("--skip-unchanged is not supported with parallel ingestion")
+    if args.skip_unchanged and args.bulk_load == "unlogged":
+        # Crash recovery empties an unlogged batch but keeps its fingerprints, so a reload would skip its rows
+        parser.error("--skip-unchanged is not supported with --bulk-load unlogged")
+    if args.current_country_in_validation and (
+            args.pipeline or not os.path.isfile(args.input) or args.ingest_workers or args.split_parts > 1):
+        parser.error("--current-country-in-validation is not supported with --pipeline or parallel ingestion")
+    if args.reject_file and not args.pipeline and (
+            not os.path.isfile(args.input) or args.ingest_workers or args.split_parts > 1):
+        parser.error("--reject-file is not supported with parallel ingestion")
+    if args.pipeline and args.bulk_load:
+        parser.error("--bulk-load is not supported with --pipeline")
+    if args.debug_cleaned_file and (
+            args.pipeline or not os.path.isfile(args.input) or args.ingest_workers or args.split_parts > 1):
+        parser.error("--debug-cleaned-file is not supported with --pipeline or parallel ingestion")
+    if args.load_engine is None:
+        args.load_engine = "partitioned" if args.storage == "partitioned" else "sql"
+    return args
 
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        print("*Starting ETL process*")
-        print("------Starting Data Validation")
-        validate_main()
+        with instrumented_run("etl", report_path=args.metrics_report, prometheus_path=args.prometheus_textfile):
+            print("*Starting ETL process*")
+            if args.pipeline:
+                print("------Starting Pipelined Validation and Loading")
+                pipeline_main(args.input, chunksize=args.chunksize, queue_depth=args.queue_depth,
+                              engine=args.load_engine, partitioned=args.keep_batches is not None,
+                              storage=args.storage, keep_batches=args.keep_batches,
+                              archive_batches=args.archive_batches, skip_unchanged=args.skip_unchanged,
+                              copy_format=args.copy_format, reject_file=args.reject_file,
+                              country_summary=args.country_summary, check_summary=args.check_country_summary,
+                              reference_date=args.reference_date, refresh_metrics=args.refresh_derived_metrics)
+            else:
+                print("------Starting Data Validation")
+                if not os.path.isfile(args.input) or args.ingest_workers or args.split_parts > 1:
+                    # Several files, or one file split by byte range, validated in worker processes
+                    ingest_main(args.input, workers=args.ingest_workers, copy_connections=args.copy_connections,
+                                split_parts=args.split_parts, chunksize=args.chunksize,
+                                partitioned=args.keep_batches is not None, bulk_load=args.bulk_load,
+                                storage=args.storage, copy_format=args.copy_format)
+                else:
+                    validate_main(args.input, chunksize=args.chunksize, debug_file_path=args.debug_cleaned_file,
+                                  partitioned=args.keep_batches is not None, bulk_load=args.bulk_load,
+                                  storage=args.storage, skip_unchanged=args.skip_unchanged,
+                                  current_country_in_validation=args.current_country_in_validation,
+                                  copy_format=args.copy_format, reject_file=args.reject_file)
         
-        print("------Starting Data Loading")
-        load_main()
+                print("------Starting Data Loading")
+                load_main(args.load_engine, workers=args.load_workers,
+                          keep_batches=args.keep_batches, archive_batches=args.archive_batches,
+                          country_summary=args.country_summary, check_summary=args.check_country_summary,
+                          reference_date=args.reference_date, refresh_metrics=args.refresh_derived_metrics)
 
     except Exception as e:
         print(f"An error occurred during the testing process: {e}")
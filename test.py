@@ -1,12 +1,41 @@
 import unittest
-from test import TestValidateData, TestLoadData
+from test import (
+    TestValidateData, TestConnectionPool, TestLoadData, TestLoadDataDatabase, TestCopyStream, TestDateParsing,
+    TestStagingPartitions, TestCustomerPartitions, TestParallelIngest, TestParallelIngestDatabase, TestPipeline,
+    TestPipelineDatabase, TestGenerateData, TestInstrumentation, TestChangeDetection,
+    TestChangeDetectionDatabase, TestLatestVisits, TestLatestVisitsDatabase, TestBinaryCopy, TestBinaryCopyDatabase,
+    TestValidationRules, TestCountrySummary, TestCountrySummaryDatabase, TestDerivedMetrics, TestDerivedMetricsDatabase
+)
 
 # Create a test suite that loads all tests from the imported test cases
 def suite():
     test_suite = unittest.TestSuite()
     # Add tests from each test case
     test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestValidateData))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestConnectionPool))
     test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestLoadData))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestLoadDataDatabase))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCopyStream))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestDateParsing))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestStagingPartitions))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCustomerPartitions))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestParallelIngest))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestParallelIngestDatabase))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPipeline))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestPipelineDatabase))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestGenerateData))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestInstrumentation))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestChangeDetection))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestChangeDetectionDatabase))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestLatestVisits))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestLatestVisitsDatabase))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestBinaryCopy))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestBinaryCopyDatabase))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestValidationRules))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCountrySummary))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCountrySummaryDatabase))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestDerivedMetrics))
+    test_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestDerivedMetricsDatabase))
     return test_suite
 
 if __name__ == "__main__":
@@ -1,7 +1,72 @@
 from .test_validate_data import (
-    TestValidateData
+    TestValidateData,
+    TestConnectionPool
 )
 
 from .test_load_data import (
-    TestLoadData
+    TestLoadData,
+    TestLoadDataDatabase
+)
+
+from .test_copy_stream import (
+    TestCopyStream
+)
+
+from .test_date_parsing import (
+    TestDateParsing
+)
+
+from .test_staging_partitions import (
+    TestStagingPartitions
+)
+
+from .test_customer_partitions import (
+    TestCustomerPartitions
+)
+
+from .test_parallel_ingest import (
+    TestParallelIngest,
+    TestParallelIngestDatabase
+)
+
+from .test_pipeline import (
+    TestPipeline,
+    TestPipelineDatabase
+)
+
+from .test_generate_data import (
+    TestGenerateData
+)
+
+from .test_instrumentation import (
+    TestInstrumentation
+)
+
+from .test_change_detection import (
+    TestChangeDetection,
+    TestChangeDetectionDatabase
+)
+
+from .test_binary_copy import (
+    TestBinaryCopy,
+    TestBinaryCopyDatabase
+)
+
+from .test_validation_rules import (
+    TestValidationRules
+)
+
+from .test_latest_visits import (
+    TestLatestVisits,
+    TestLatestVisitsDatabase
+)
+
+from .test_country_summary import (
+    TestCountrySummary,
+    TestCountrySummaryDatabase
+)
+
+from .test_derived_metrics import (
+    TestDerivedMetrics,
+    TestDerivedMetricsDatabase
 )
@@ -0,0 +1,41 @@
+import os
+import unittest
+import psycopg2
+from etl_scripts.validate_data import db_params
+
+def connect_test_schema():
+    """Open a connection working inside a throwaway schema, or skip when no database is reachable."""
+    try:
+        conn = psycopg2.connect(connect_timeout=3, **db_params)
+    except psycopg2.OperationalError as e:
+        raise unittest.SkipTest(f"PostgreSQL is not available: {e}")
+
+    # Keep test tables away from the real ones by working in a private schema
+    schema = f"etl_test_{os.getpid()}"
+    cursor = conn.cursor()
+    cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {schema}")
+    cursor.execute(f"SET search_path TO {schema}")
+    conn.commit()
+    return conn, schema
+
+def connect_to_schema(schema):
+    """Open an extra connection that works inside an existing test schema."""
+    conn = psycopg2.connect(connect_timeout=3, **db_params)
+    conn.cursor().execute(f"SET search_path TO {schema}")
+    conn.commit()
+    return conn
+
+def drop_test_schema(conn, schema):
+    """Drop the throwaway schema and close the connection."""
+    conn.rollback()
+    conn.cursor().execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    conn.commit()
+    conn.close()
+
+def fetch_table(conn, table_name, order_by):
+    """Return every row of a table as a list of tuples, without the surrogate id."""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT * FROM {table_name} ORDER BY {order_by}")
+    columns = [col.name for col in cursor.description]
+    return [tuple(value for col, value in zip(columns, row) if col != "id") for row in cursor.fetchall()]
@@ -0,0 +1,97 @@
+import struct
+import unittest
+from datetime import date
+from io import StringIO
+import pandas as pd
+from etl_scripts import (
+    encode_binary_rows, iter_binary_copy, stream_data_to_staging, copy_frame_to_staging, clean_chunk,
+    create_staging_table_with_indexes, create_country_tables
+)
+from etl_scripts.binary_copy import COPY_BINARY_HEADER, COPY_BINARY_TRAILER
+from etl_scripts.load_data import copy_country_rows
+from etl_scripts.validate_data import READ_DTYPES
+from test.db_utils import connect_test_schema, drop_test_schema, fetch_table
+from test.test_load_data import SAMPLE_DATA
+
+def field(value):
+    return struct.pack("!i", len(value)) + value
+
+NULL = struct.pack("!i", -1)
+
+class TestBinaryCopy(unittest.TestCase):
+    def test_encodes_typed_fields(self):
+        df = pd.DataFrame({'name': ['Ann', None, ''], 'day': [date(2000, 1, 2), None, date(1999, 12, 31)],
+                           'age': [33, None, -1]})
+        expected = b"".join([
+            struct.pack("!h", 3) + field(b"Ann") + field(struct.pack("!i", 1)) + field(struct.pack("!i", 33)),
+            struct.pack("!h", 3) + NULL + NULL + NULL,
+            # Empty strings load as NULL, like an empty CSV field
+            struct.pack("!h", 3) + NULL + field(struct.pack("!i", -1)) + field(struct.pack("!i", -1)),
+        ])
+        self.assertEqual(encode_binary_rows(df, ['text', 'date', 'int4']), expected)
+
+    def test_empty_strings_can_be_kept(self):
+        df = pd.DataFrame({'name': ['', 'Zoë']})
+        self.assertEqual(encode_binary_rows(df, ['text'], empty_as_null=False),
+                         struct.pack("!h", 1) + field(b"") + struct.pack("!h", 1) + field("Zoë".encode()))
+
+    def test_categorical_and_text_columns_encode_alike(self):
+        df = clean_chunk(pd.read_csv(StringIO(SAMPLE_DATA), delimiter='|', dtype=READ_DTYPES))
+        types = ['text', 'text', 'date', 'date', 'text', 'text', 'text', 'text', 'date', 'text']
+        as_text = df.astype({col: object for col in ['Country', 'State', 'Vaccination_Id', 'Dr_Name', 'Is_Active']})
+        self.assertEqual(encode_binary_rows(df, types), encode_binary_rows(as_text, types))
+
+    def test_blocks_make_one_stream(self):
+        df = pd.DataFrame({'name': [f"C{n}" for n in range(10)]})
+        blocks = list(iter_binary_copy(df, ['text'], block_rows=3))
+        self.assertEqual(len(blocks), 6)
+        self.assertEqual(b"".join(blocks), COPY_BINARY_HEADER + encode_binary_rows(df, ['text']) + COPY_BINARY_TRAILER)
+
+    def test_rejects_unknown_types(self):
+        with self.assertRaises(ValueError):
+            encode_binary_rows(pd.DataFrame({'flag': [True]}), ['bool'])
+
+class TestBinaryCopyDatabase(unittest.TestCase):
+    """Checks that text and binary COPY load the same rows into a real PostgreSQL schema."""
+
+    def setUp(self):
+        self.conn, self.schema = connect_test_schema()
+        create_staging_table_with_indexes(self.conn)
+
+    def tearDown(self):
+        drop_test_schema(self.conn, self.schema)
+
+    def reload(self, load):
+        self.conn.cursor().execute("TRUNCATE staging")
+        self.conn.commit()
+        load()
+        return fetch_table(self.conn, "staging", "id")
+
+    def test_text_and_binary_staging_loads_match(self):
+        expected = self.reload(lambda: stream_data_to_staging(self.conn, StringIO(SAMPLE_DATA), chunksize=2))
+        self.assertEqual(len(expected), 6)
+
+        streamed = self.reload(lambda: stream_data_to_staging(self.conn, StringIO(SAMPLE_DATA), chunksize=2,
+                                                              copy_format="binary"))
+        self.assertEqual(streamed, expected)
+
+        cleaned = clean_chunk(pd.read_csv(StringIO(SAMPLE_DATA), delimiter='|', dtype=READ_DTYPES))
+        whole = self.reload(lambda: copy_frame_to_staging(self.conn, cleaned))
+        self.assertEqual(whole, expected)
+
+    def test_country_rows_round_trip(self):
+        create_country_tables(self.conn, ['AU'])
+        records = [
+            ('Emily', '100007', date(2010, 10, 12), date(2022, 10, 1), 'MVD  ', '', 'QLD  ', 'AU   ',
+             date(1992, 11, 11), 'A'),
+            ('Noah', '100009', date(2010, 10, 12), None, None, None, None, 'AU   ', None, None),
+        ]
+        copy_country_rows(self.conn.cursor(), "table_australia", records, date(2022, 10, 11))
+        self.conn.commit()
+        # Age and Days_Since_Last_Consulted are derived against the reference date
+        self.assertEqual(fetch_table(self.conn, "table_australia", "Customer_Id"),
+                         [(record[1], record[0]) + record[2:] + derived
+                          for record, derived in zip(records, [(29, 10), (None, None)])])
+
+if __name__ == '__main__':
+    unittest.main()
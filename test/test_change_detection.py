@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+from io import StringIO
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+from etl_scripts import (
+    FingerprintIndex, load_fingerprint_index, row_fingerprints, stream_data_to_staging, clean_chunk,
+    create_staging_table_with_indexes
+)
+from etl_scripts.validate_data import READ_DTYPES, main as validate_main
+from test.db_utils import connect_test_schema, drop_test_schema
+from test.test_load_data import SAMPLE_DATA
+
+def cleaned_sample(data=SAMPLE_DATA):
+    return clean_chunk(pd.read_csv(StringIO(data), delimiter='|', dtype=READ_DTYPES))
+
+class TestChangeDetection(unittest.TestCase):
+    def test_fingerprints_depend_on_values_only(self):
+        df = cleaned_sample()
+        as_text = df.astype({'Country': object, 'State': object, 'Is_Active': object})
+        np.testing.assert_array_equal(row_fingerprints(df), row_fingerprints(as_text))
+        # Every row of the sample differs in some column
+        self.assertEqual(len(set(row_fingerprints(df))), len(df))
+
+    def test_filters_rows_already_in_the_index(self):
+        df = cleaned_sample()
+        index = FingerprintIndex(row_fingerprints(df.iloc[:4]))
+
+        changed = df.copy()
+        changed.loc[changed.index[0], 'Customer_Name'] = 'Emilia'
+        kept = index.filter_changed(changed)
+
+        # Row 0 has a new name, rows 4 and 5 were never loaded
+        self.assertEqual(kept['Customer_Id'].tolist(), ['100007', '100010', '100011'])
+
+    def test_empty_index_keeps_every_row(self):
+        df = cleaned_sample()
+        index = FingerprintIndex(np.array([], dtype=np.int64))
+        self.assertEqual(len(index.filter_changed(df)), len(df))
+
+class TestChangeDetectionDatabase(unittest.TestCase):
+    """Loads repeated snapshots against a real PostgreSQL schema when one is reachable."""
+
+    def setUp(self):
+        self.conn, self.schema = connect_test_schema()
+        create_staging_table_with_indexes(self.conn)
+
+    def tearDown(self):
+        drop_test_schema(self.conn, self.schema)
+
+    def load_snapshot(self, data):
+        index = load_fingerprint_index(self.conn)
+        _, rows_loaded, _ = stream_data_to_staging(self.conn, StringIO(data), chunksize=2, change_index=index)
+        return rows_loaded
+
+    def test_repeated_snapshots_only_load_changes(self):
+        self.assertEqual(self.load_snapshot(SAMPLE_DATA), 6)
+        self.assertEqual(self.load_snapshot(SAMPLE_DATA), 0)
+
+        # One visit changes its doctor
+        changed = SAMPLE_DATA.replace("|D|Emily|100007|20101012|20221001|MVD|Sam|",
+                                      "|D|Emily|100007|20101012|20221001|MVD|Kim|")
+        self.assertEqual(self.load_snapshot(changed), 1)
+
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM staging")
+        self.assertEqual(cursor.fetchone()[0], 7)
+        cursor.execute("SELECT COUNT(*) FROM row_fingerprints")
+        self.assertEqual(cursor.fetchone()[0], 7)
+        self.assertEqual(len(load_fingerprint_index(self.conn)), 7)
+
+    def test_failed_bulk_attach_keeps_no_fingerprints(self):
+        # Bulk batches need partitioned staging
+        cursor = self.conn.cursor()
+        cursor.execute("DROP TABLE staging")
+        self.conn.commit()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = os.path.join(tmp_dir, "customer_data.txt")
+            with open(input_path, 'w') as f:
+                f.write(SAMPLE_DATA)
+            with patch('etl_scripts.validate_data.get_connection', return_value=self.conn), \
+                    patch('etl_scripts.validate_data.release_connection'), \
+                    patch('etl_scripts.validate_data.finish_bulk_staging_batch',
+                          side_effect=RuntimeError("attach failed")):
+                validate_main(input_path, chunksize=2, bulk_load="logged", skip_unchanged=True)
+
+        # The rows never reached staging, so a rerun must load them again
+        self.assertEqual(len(load_fingerprint_index(self.conn)), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+from etl_scripts.copy_stream import CopyStream
+
+class TestCopyStream(unittest.TestCase):
+
+    def test_read_in_small_pieces(self):
+        batches = ["a|1\n", "", "b|2\nc|3\n"]
+        with CopyStream(iter(batches), max_pending=1) as stream:
+            pieces = []
+            while True:
+                piece = stream.read(3)
+                if not piece:
+                    break
+                pieces.append(piece)
+
+        # Every piece respects the requested size and the content is unchanged
+        self.assertTrue(all(len(piece) <= 3 for piece in pieces))
+        self.assertEqual(b''.join(pieces), b"a|1\nb|2\nc|3\n")
+
+    def test_producer_error_is_raised(self):
+        def failing_batches():
+            yield "a|1\n"
+            raise ValueError("bad chunk")
+
+        with self.assertRaises(ValueError):
+            with CopyStream(failing_batches()) as stream:
+                stream.read()
+
+    def test_consumer_error_stops_producer(self):
+        def endless_batches():
+            while True:
+                yield "a|1\n"
+
+        # A COPY failure must not leave the producer blocked on a full queue
+        with self.assertRaises(RuntimeError):
+            with CopyStream(endless_batches(), max_pending=1) as stream:
+                stream.read(2)
+                raise RuntimeError("COPY failed")
@@ -0,0 +1,85 @@
+import unittest
+from datetime import date
+from io import StringIO
+from etl_scripts import (
+    update_country_summary, check_country_summary, rebuild_country_summary, fill_country_tables,
+    stream_data_to_staging, load_customer_current_country,
+    create_staging_table_with_indexes, create_country_tables, create_country_map_table, create_watermark_table,
+    create_customer_current_country
+)
+from etl_scripts.country_summary import age_band_condition, SUMMARY_COLUMNS
+from data import country_codes
+from test.db_utils import connect_test_schema, drop_test_schema
+from test.test_load_data import SAMPLE_DATA
+
+MORE_DATA = (
+    "|H|Customer_Name|Customer_Id|Open_Date|Last_Consulted_Date|Vaccination_Id|Dr_Name|State|Country|DOB|Is_Active\n"
+    "|D|Mia|100012|20101012|20240101|MVD|Sam|QLD|AU|01012010|A\n"
+    "|D|Ava|100013|20101012|20240201|MVD|Paul|FL|USA|01011950|I\n"
+)
+
+class TestCountrySummary(unittest.TestCase):
+    def test_age_band_conditions(self):
+        self.assertEqual(age_band_condition(None, 18), "Age < 18")
+        self.assertEqual(age_band_condition(18, 35), "Age >= 18 AND Age < 35")
+        self.assertEqual(age_band_condition(65, None), "Age >= 65")
+
+class TestCountrySummaryDatabase(unittest.TestCase):
+    """Checks the incrementally merged summary against a full recompute on a real PostgreSQL schema."""
+
+    def setUp(self):
+        self.conn, self.schema = connect_test_schema()
+        create_staging_table_with_indexes(self.conn)
+        create_country_tables(self.conn, country_codes)
+        create_country_map_table(self.conn)
+        create_watermark_table(self.conn)
+        create_customer_current_country(self.conn)
+
+    def tearDown(self):
+        drop_test_schema(self.conn, self.schema)
+
+    def load(self, data):
+        stream_data_to_staging(self.conn, StringIO(data), chunksize=2)
+        load_customer_current_country(self.conn)
+        fill_country_tables(self.conn, today=date(2024, 2, 29))
+
+    def summary(self):
+        cursor = self.conn.cursor()
+        cursor.execute(f'SELECT Country_Name, {", ".join(SUMMARY_COLUMNS)} FROM country_summary ORDER BY Country_Name')
+        return {row[0]: dict(zip(SUMMARY_COLUMNS, row[1:])) for row in cursor.fetchall()}
+
+    def test_only_new_rows_are_merged(self):
+        self.load(SAMPLE_DATA)
+        self.assertEqual(update_country_summary(self.conn), {'Australia': 1, 'India': 2, 'United_States': 2})
+        self.assertEqual(check_country_summary(self.conn), [])
+        usa = self.summary()['United_States']
+        self.assertEqual((usa['Customer_Rows'], usa['Active_Rows'], usa['Age_18_34'], usa['Age_Unknown']),
+                         (2, 1, 1, 1))
+
+        # Nothing new: the summary stays as it is
+        self.assertEqual(update_country_summary(self.conn), {})
+
+        self.load(MORE_DATA)
+        self.assertEqual(update_country_summary(self.conn), {'Australia': 1, 'United_States': 1})
+        self.assertEqual(check_country_summary(self.conn), [])
+        summary = self.summary()
+        self.assertEqual((summary['Australia']['Customer_Rows'], summary['Australia']['Age_Under_18']), (2, 1))
+        self.assertEqual((summary['United_States']['Active_Rows'], summary['United_States']['Age_65_Plus']), (1, 1))
+        self.assertEqual(summary['India']['Customer_Rows'], 2)
+
+    def test_check_finds_drift_and_rebuild_fixes_it(self):
+        self.load(SAMPLE_DATA)
+        update_country_summary(self.conn)
+        cursor = self.conn.cursor()
+        cursor.execute("UPDATE country_summary SET Active_Rows = 5 WHERE Country_Name = 'India'")
+        self.conn.commit()
+
+        self.assertEqual(check_country_summary(self.conn), [('India', 'Active_Rows', 5, 2)])
+        rebuild_country_summary(self.conn)
+        self.assertEqual(check_country_summary(self.conn), [])
+
+        cursor.execute("SELECT Avg_Days_Since_Last_Consulted FROM country_summary WHERE Country_Name = 'Australia'")
+        self.assertEqual(cursor.fetchone()[0], (date(2024, 2, 29) - date(2022, 10, 1)).days)
+
+if __name__ == '__main__':
+    unittest.main()
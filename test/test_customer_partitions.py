@@ -0,0 +1,112 @@
+import unittest
+from datetime import date
+from io import StringIO
+from etl_scripts import (
+    create_customers_table, ensure_country_partitions, fill_country_tables,
+    stream_data_to_staging, create_staging_table_with_indexes, create_country_tables, create_country_map_table,
+    create_watermark_table
+)
+from data import country_codes, country_map, get_country_name
+from test.db_utils import connect_test_schema, drop_test_schema, fetch_table
+from test.test_load_data import SAMPLE_DATA
+
+class TestCustomerPartitions(unittest.TestCase):
+    """Runs the country-partitioned customers storage against a real PostgreSQL schema when one is reachable."""
+
+    def setUp(self):
+        self.conn, self.schema = connect_test_schema()
+        create_staging_table_with_indexes(self.conn)
+        create_country_map_table(self.conn)
+        create_watermark_table(self.conn)
+        stream_data_to_staging(self.conn, StringIO(SAMPLE_DATA), chunksize=2)
+
+    def tearDown(self):
+        drop_test_schema(self.conn, self.schema)
+
+    def partitions(self):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'customers'::regclass ORDER BY c.relname
+        """)
+        return [row[0] for row in cursor.fetchall()]
+
+    def snapshot_country_tables(self):
+        return {code: fetch_table(self.conn, f"table_{get_country_name(code)}", "Customer_Id") for code in country_codes}
+
+    def test_partitioned_engine_matches_country_tables(self):
+        today = date(2024, 2, 29)
+        create_country_tables(self.conn, country_codes)
+        fill_country_tables(self.conn, engine="python", today=today)
+        expected = self.snapshot_country_tables()
+
+        # Start over with the partitioned storage and load through the parent
+        cursor = self.conn.cursor()
+        for code in country_codes:
+            cursor.execute(f"DROP TABLE table_{get_country_name(code)}")
+        cursor.execute("UPDATE staging SET processed = FALSE")
+        cursor.execute("DELETE FROM etl_watermarks")
+        self.conn.commit()
+
+        create_customers_table(self.conn)
+        ensure_country_partitions(self.conn)
+        fill_country_tables(self.conn, engine="partitioned", today=today)
+
+        self.assertEqual(self.snapshot_country_tables(), expected)
+        self.assertEqual(len(fetch_table(self.conn, "customers", "Customer_Id")), 5)
+
+    def test_new_countries_get_partitions(self):
+        create_customers_table(self.conn)
+        added = ensure_country_partitions(self.conn)
+        self.assertEqual(sorted(added), sorted(f"table_{name}" for name in country_map.values()))
+
+        # A second run finds nothing to do
+        self.assertEqual(ensure_country_partitions(self.conn), [])
+
+        # A country added to the mapping gets its partition on the next run
+        cursor = self.conn.cursor()
+        cursor.execute("INSERT INTO country_map (Country_Code, Country_Name) VALUES ('NZ', 'New_Zealand')")
+        self.conn.commit()
+        self.assertEqual(ensure_country_partitions(self.conn), ["table_New_Zealand"])
+        self.assertIn("table_new_zealand", self.partitions())
+
+    def test_existing_country_tables_are_attached(self):
+        today = date(2024, 2, 29)
+        create_country_tables(self.conn, country_codes)
+        fill_country_tables(self.conn, engine="sql", today=today)
+        before = self.snapshot_country_tables()
+
+        create_customers_table(self.conn)
+        ensure_country_partitions(self.conn)
+        self.assertEqual(self.partitions(), sorted(f"table_{name}".lower() for name in country_map.values()))
+        self.assertEqual(self.snapshot_country_tables(), before)
+
+        # New rows through the parent get ids past those of the attached rows
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT MAX(id) FROM customers")
+        attached_max_id = cursor.fetchone()[0]
+        cursor.execute("UPDATE staging SET processed = FALSE")
+        cursor.execute("DELETE FROM etl_watermarks")
+        self.conn.commit()
+        fill_country_tables(self.conn, engine="partitioned", today=today)
+        cursor.execute("SELECT COUNT(*) FROM customers WHERE id > %s", (attached_max_id,))
+        self.assertEqual(cursor.fetchone()[0], 5)
+
+    def test_per_country_queries_prune_partitions(self):
+        create_customers_table(self.conn)
+        ensure_country_partitions(self.conn)
+        cursor = self.conn.cursor()
+        cursor.execute("EXPLAIN SELECT * FROM customers WHERE Country = 'IND'")
+        plan = "\n".join(row[0] for row in cursor.fetchall())
+        self.assertIn("table_india", plan)
+        self.assertNotIn("table_usa", plan)
+
+    def test_rejects_regular_customers_table(self):
+        cursor = self.conn.cursor()
+        cursor.execute("CREATE TABLE customers (id SERIAL PRIMARY KEY)")
+        self.conn.commit()
+        with self.assertRaises(ValueError):
+            create_customers_table(self.conn)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import numpy as np
+import pandas as pd
+from etl_scripts.date_parsing import parse_fixed_width_dates, YYYYMMDD, DDMMYYYY
+
+def legacy_parse(values, layout):
+    """Parse dates the way preprocess_data did before the vectorized parser."""
+    values = pd.Series(values, dtype=object)
+    if layout == DDMMYYYY:
+        values = values.str.slice(4, 8) + values.str.slice(2, 4) + values.str.slice(0, 2)
+    parsed = pd.to_datetime(values, format='%Y%m%d', errors='coerce').to_numpy(dtype='datetime64[D]')
+    # Dates outside the datetime64[ns] range are coerced to NaT as well
+    in_range = (parsed >= np.datetime64('1677-09-22')) & (parsed <= np.datetime64('2262-04-11'))
+    return np.where(in_range, parsed, np.datetime64('NaT')).astype('datetime64[ns]')
+
+class TestDateParsing(unittest.TestCase):
+
+    def setUp(self):
+        # Regular values, impossible dates, irregular widths and missing values
+        self.values = ['20101012', '20000229', '19000229', '20100230', '20101312', '20101000',
+                       '00000101', '99991231', '2010112', '201011', '20101012 ', '2010-10-12',
+                       'abcdefgh', 'é2010101', '2010101212345678', '', None, np.nan]
+
+    def test_matches_legacy_parsing(self):
+        for layout in (YYYYMMDD, DDMMYYYY):
+            dates, invalid = parse_fixed_width_dates(pd.Series(self.values, dtype=object), layout)
+            self.assertEqual(dates.dtype, np.dtype('datetime64[ns]'))
+            np.testing.assert_array_equal(dates, legacy_parse(self.values, layout))
+
+            # Missing values are NaT but only present values are flagged invalid
+            present = np.array([isinstance(value, str) and value != '' for value in self.values])
+            np.testing.assert_array_equal(invalid, np.isnat(dates) & present)
+
+    def test_random_dates_match_legacy_parsing(self):
+        rng = np.random.default_rng(7)
+        rows = 20000
+        values = [f'{a:02d}{b:02d}{c:04d}' for a, b, c in zip(rng.integers(0, 33, rows),
+                                                               rng.integers(0, 14, rows),
+                                                               rng.integers(1500, 2400, rows))]
+        dates, _ = parse_fixed_width_dates(pd.Series(values), DDMMYYYY)
+        np.testing.assert_array_equal(dates, legacy_parse(values, DDMMYYYY))
+
+    def test_unknown_layout(self):
+        with self.assertRaises(ValueError):
+            parse_fixed_width_dates(pd.Series(['20101012']), 'MMDDYYYY')
@@ -0,0 +1,88 @@
+import unittest
+from datetime import date
+from io import StringIO
+import numpy as np
+from etl_scripts import (
+    derive_metrics, refresh_derived_metrics, update_country_summary, check_country_summary, fill_country_tables,
+    stream_data_to_staging, load_customer_current_country,
+    create_staging_table_with_indexes, create_country_tables, create_country_map_table, create_watermark_table,
+    create_customer_current_country
+)
+from etl_scripts.derived_metrics import age_sql, days_since_sql
+from data import country_codes
+from test.db_utils import connect_test_schema, drop_test_schema, fetch_table
+from test.test_load_data import SAMPLE_DATA
+
+# (date of birth, reference date, age) around birthdays and February 29th
+AGE_CASES = [
+    (date(1992, 11, 11), date(2022, 11, 10), 29),
+    (date(1992, 11, 11), date(2022, 11, 11), 30),
+    (date(2000, 2, 29), date(2023, 2, 28), 22),
+    (date(2000, 2, 29), date(2023, 3, 1), 23),
+    (date(2000, 2, 29), date(2024, 2, 29), 24),
+    (date(2000, 3, 1), date(2024, 2, 29), 23),
+    (date(1900, 1, 1), date(2024, 1, 1), 124),
+]
+
+class TestDerivedMetrics(unittest.TestCase):
+    def test_age_is_counted_in_calendar_years(self):
+        for dob, reference, age in AGE_CASES:
+            ages, _ = derive_metrics([dob], [None], reference)
+            self.assertEqual(ages[0], age, (dob, reference))
+
+    def test_whole_columns_with_missing_dates(self):
+        dobs = np.array(['1992-11-11', 'NaT', '2000-02-29'], dtype='datetime64[ns]')
+        visits = [date(2022, 10, 1), date(2024, 2, 29), None]
+        ages, days = derive_metrics(dobs, visits, date(2024, 2, 29))
+        self.assertEqual(ages.tolist()[::2], [31, 24])
+        self.assertTrue(ages.isna()[1])
+        self.assertEqual(days.tolist()[:2], [(date(2024, 2, 29) - date(2022, 10, 1)).days, 0])
+        self.assertTrue(days.isna()[2])
+
+class TestDerivedMetricsDatabase(unittest.TestCase):
+    """Checks the SQL derivation and the refresh on a real PostgreSQL schema."""
+
+    def setUp(self):
+        self.conn, self.schema = connect_test_schema()
+        create_staging_table_with_indexes(self.conn)
+        create_country_tables(self.conn, country_codes)
+        create_country_map_table(self.conn)
+        create_watermark_table(self.conn)
+        create_customer_current_country(self.conn)
+
+    def tearDown(self):
+        drop_test_schema(self.conn, self.schema)
+
+    def test_sql_matches_derive_metrics(self):
+        cursor = self.conn.cursor()
+        for dob, reference, age in AGE_CASES:
+            cursor.execute(f'SELECT {age_sql("%(reference)s::DATE", "%(dob)s::DATE")}, '
+                           f'{days_since_sql("%(reference)s::DATE", "%(dob)s::DATE")}',
+                           {"reference": reference, "dob": dob})
+            self.assertEqual(cursor.fetchone(), (age, (reference - dob).days), (dob, reference))
+
+    def load(self, today):
+        stream_data_to_staging(self.conn, StringIO(SAMPLE_DATA), chunksize=2)
+        load_customer_current_country(self.conn)
+        fill_country_tables(self.conn, today=today)
+
+    def test_refresh_updates_only_changed_rows(self):
+        self.load(date(2024, 2, 28))
+        update_country_summary(self.conn)
+
+        # Days move for every row with a consultation; Lily (born 29 February) turns 24 on the 29th
+        refreshed = refresh_derived_metrics(self.conn, date(2024, 2, 29))
+        self.assertEqual(refreshed, {'Australia': 1, 'India': 2, 'United_States': 1})
+        self.assertEqual(refresh_derived_metrics(self.conn, date(2024, 2, 29)), {})
+        self.assertEqual(check_country_summary(self.conn), [])
+
+        # A refresh ends up with the rows a load on that day writes
+        refreshed_rows = fetch_table(self.conn, "table_india", "Customer_Id")
+        self.conn.cursor().execute('TRUNCATE table_india, staging, etl_watermarks')
+        self.conn.commit()
+        self.load(date(2024, 2, 29))
+        self.assertEqual(fetch_table(self.conn, "table_india", "Customer_Id"), refreshed_rows)
+        self.assertIn(24, [row[-2] for row in refreshed_rows])
+
+if __name__ == '__main__':
+    unittest.main()
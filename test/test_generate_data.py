@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from benchmarks.generate_data import generate_customer_file, HEADER
+from etl_scripts.validate_data import clean_chunk, READ_DTYPES
+from data import country_codes
+
+class TestGenerateData(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def generate(self, name, rows, **kwargs):
+        path = os.path.join(self.tmp_dir.name, name)
+        return path, generate_customer_file(path, rows, **kwargs)
+
+    def test_same_seed_gives_same_file(self):
+        first, _ = self.generate("first.txt", 2000, seed=7, block_rows=500)
+        second, _ = self.generate("second.txt", 2000, seed=7, block_rows=500)
+        other, _ = self.generate("other.txt", 2000, seed=8, block_rows=500)
+        with open(first) as f1, open(second) as f2, open(other) as f3:
+            first_text, second_text, other_text = f1.read(), f2.read(), f3.read()
+        self.assertEqual(first_text, second_text)
+        self.assertNotEqual(first_text, other_text)
+        self.assertTrue(first_text.startswith(HEADER + "|D|"))
+
+    def test_validation_rejects_exactly_the_invalid_rows(self):
+        path, summary = self.generate("feed.txt", 5000, invalid_rate=0.05, visits_per_customer=4)
+        raw = pd.read_csv(path, delimiter='|', dtype=READ_DTYPES)
+        self.assertEqual(len(raw), 5000)
+
+        valid = clean_chunk(raw)
+        self.assertGreater(summary["invalid_rows"], 0)
+        self.assertEqual(len(valid), 5000 - summary["invalid_rows"])
+        self.assertEqual(summary["customers"], 1250)
+        self.assertLessEqual(valid['Customer_Id'].nunique(), 1250)
+
+        # Known countries dominate; a small share uses codes without a country table
+        countries = valid['Country'].astype(str)
+        self.assertGreater(countries.isin(country_codes).mean(), 0.95)
+
+    def test_country_skew(self):
+        path, _ = self.generate("skewed.txt", 5000, country_skew=2.0)
+        counts = pd.read_csv(path, delimiter='|', dtype=READ_DTYPES)['Country'].value_counts()
+        self.assertEqual(counts.index[0], "USA")
+        self.assertGreater(counts["USA"], 3 * counts["PHL"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import json
+import os
+import tempfile
+import unittest
+from io import StringIO
+import psycopg2
+from etl_scripts import (
+    instrumented_run, stage, count, InstrumentedConnection, stream_data_to_staging, create_staging_table_with_indexes
+)
+from etl_scripts.validate_data import db_params
+from test.db_utils import drop_test_schema
+from test.test_load_data import SAMPLE_DATA
+
+@stage
+def read_rows(rows, rejected=0):
+    count(rows_in=rows, rows_out=rows - rejected, rows_rejected=rejected, bytes_read=rows * 10)
+    return rows - rejected
+
+@stage
+def read_twice(rows):
+    # Counts belong to the innermost stage, so the outer stage only adds its own
+    count(rows_in=1)
+    return read_rows(rows) + read_rows(rows)
+
+@stage
+def fail():
+    raise ValueError("bad input")
+
+class TestInstrumentation(unittest.TestCase):
+    def test_stage_records_calls_and_counters(self):
+        with instrumented_run("test") as run:
+            self.assertEqual(read_rows(100, rejected=5), 95)
+            read_rows(10)
+
+        stage_totals = run.report()["stages"]["test_instrumentation.read_rows"]
+        self.assertEqual(stage_totals["calls"], 2)
+        self.assertEqual(stage_totals["rows_in"], 110)
+        self.assertEqual(stage_totals["rows_out"], 105)
+        self.assertEqual(stage_totals["rows_rejected"], 5)
+        self.assertEqual(stage_totals["bytes_read"], 1100)
+        self.assertGreaterEqual(stage_totals["wall_seconds"], 0.0)
+        self.assertGreater(stage_totals["peak_rss_bytes"], 0)
+        self.assertEqual(run.report()["status"], "ok")
+
+    def test_nested_stages_do_not_double_count_rows(self):
+        with instrumented_run("test") as run:
+            read_twice(3)
+
+        stages = run.report()["stages"]
+        self.assertEqual(stages["test_instrumentation.read_twice"]["rows_in"], 1)
+        self.assertEqual(stages["test_instrumentation.read_rows"]["rows_in"], 6)
+        self.assertEqual(stages["test_instrumentation.read_rows"]["calls"], 2)
+
+    def test_errors_are_recorded_and_reraised(self):
+        with instrumented_run("test") as run:
+            with self.assertRaisesRegex(ValueError, "bad input"):
+                fail()
+
+        report = run.report()
+        self.assertEqual(report["status"], "failed")
+        self.assertEqual(report["stages"]["test_instrumentation.fail"]["errors"], 1)
+        self.assertEqual(report["stages"]["test_instrumentation.fail"]["last_error"], "ValueError: bad input")
+
+    def test_stages_are_free_outside_a_run(self):
+        self.assertEqual(read_rows(5), 5)
+        with instrumented_run("test") as run:
+            pass
+        self.assertEqual(run.report()["stages"], {})
+
+    def test_writes_json_report_and_prometheus_textfile(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            report_path = os.path.join(tmp_dir, "run.json")
+            prometheus_path = os.path.join(tmp_dir, "metrics", "etl.prom")
+            with instrumented_run("nightly", report_path=report_path, prometheus_path=prometheus_path):
+                read_rows(7, rejected=2)
+
+            with open(report_path) as f:
+                report = json.load(f)
+            with open(prometheus_path) as f:
+                metrics = f.read()
+
+        self.assertEqual(report["run"], "nightly")
+        self.assertEqual(report["stages"]["test_instrumentation.read_rows"]["rows_rejected"], 2)
+        self.assertIn('etl_run_success{run="nightly"} 1', metrics)
+        self.assertIn('etl_stage_rows_in{run="nightly",stage="test_instrumentation.read_rows"} 7', metrics)
+        self.assertIn("# TYPE etl_stage_wall_seconds gauge", metrics)
+
+    def test_counts_database_round_trips_and_staging_rows(self):
+        try:
+            conn = psycopg2.connect(connect_timeout=3, connection_factory=InstrumentedConnection, **db_params)
+        except psycopg2.OperationalError as e:
+            raise unittest.SkipTest(f"PostgreSQL is not available: {e}")
+        schema = f"etl_test_{os.getpid()}"
+        cursor = conn.cursor()
+        cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {schema}")
+        cursor.execute(f"SET search_path TO {schema}")
+        conn.commit()
+        try:
+            create_staging_table_with_indexes(conn)
+            with instrumented_run("test") as run:
+                stream_data_to_staging(conn, StringIO(SAMPLE_DATA), chunksize=2)
+        finally:
+            drop_test_schema(conn, schema)
+
+        stream = run.report()["stages"]["validate_data.stream_data_to_staging"]
+        self.assertEqual(stream["rows_in"], 6)
+        self.assertEqual(stream["rows_out"], 6)
+        self.assertEqual(stream["rows_rejected"], 0)
+        # One COPY for the whole stream
+        self.assertGreaterEqual(stream["db_round_trips"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
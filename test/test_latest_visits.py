@@ -0,0 +1,116 @@
+import unittest
+from io import StringIO
+import pandas as pd
+from etl_scripts import (
+    LatestVisits, latest_per_customer, stream_data_to_staging, load_customer_current_country,
+    create_staging_table_with_indexes, create_watermark_table, create_customer_current_country
+)
+from test.db_utils import connect_test_schema, drop_test_schema, fetch_table
+from test.test_load_data import SAMPLE_DATA
+
+def visits(rows):
+    return pd.DataFrame(rows, columns=['Customer_Id', 'Customer_Name', 'Country', 'Last_Consulted_Date']).astype(
+        {'Last_Consulted_Date': 'datetime64[ns]'})
+
+class TestLatestVisits(unittest.TestCase):
+    def test_latest_visit_wins_and_later_rows_break_ties(self):
+        winners = latest_per_customer(visits([
+            ('1', 'Ann', 'USA', '2022-01-05'),
+            ('1', 'Ann', 'IND', '2023-01-05'),
+            ('2', 'Bob', 'AU', '2021-03-01'),
+            ('1', 'Ann', 'AU', '2023-01-05'),
+        ]))
+        self.assertEqual(sorted(winners[['Customer_Id', 'Country']].itertuples(index=False, name=None)),
+                         [('1', 'AU'), ('2', 'AU')])
+
+    def test_chunks_reduce_to_the_same_winners(self):
+        rows = [(str(n % 7), f"C{n}", ('USA', 'IND', 'AU')[n % 3], f"2023-01-{1 + n % 5:02d}") for n in range(60)]
+        expected = latest_per_customer(visits(rows)).sort_values('Customer_Id').reset_index(drop=True)
+
+        # A tiny compaction threshold merges the buffered winners many times
+        latest = LatestVisits(compact_rows=3)
+        for start in range(0, len(rows), 4):
+            latest.add(visits(rows[start:start + 4]))
+        actual = latest.winners().sort_values('Customer_Id').reset_index(drop=True)
+
+        pd.testing.assert_frame_equal(actual, expected)
+
+    def test_visits_without_date_or_country_are_ignored(self):
+        latest = LatestVisits()
+        latest.add(visits([('1', 'Ann', None, '2023-01-05'), ('2', 'Bob', 'AU', None)]))
+        self.assertEqual(len(latest.winners()), 0)
+
+class TestLatestVisitsDatabase(unittest.TestCase):
+    """Compares the validation-time winners with the SQL ranking on a real PostgreSQL schema."""
+
+    def setUp(self):
+        self.conn, self.schema = connect_test_schema()
+        create_staging_table_with_indexes(self.conn)
+        create_watermark_table(self.conn)
+        create_customer_current_country(self.conn)
+
+    def tearDown(self):
+        drop_test_schema(self.conn, self.schema)
+
+    def load_with_latest_visits(self, data):
+        latest = LatestVisits()
+        latest.begin(self.conn)
+        stream_data_to_staging(self.conn, StringIO(data), chunksize=2, latest_visits=latest)
+        latest.advance_watermark(self.conn)
+
+    def test_matches_sql_ranking(self):
+        stream_data_to_staging(self.conn, StringIO(SAMPLE_DATA), chunksize=2)
+        load_customer_current_country(self.conn)
+        expected = fetch_table(self.conn, "current_country", "Customer_Id")
+
+        cursor = self.conn.cursor()
+        cursor.execute("TRUNCATE staging, current_country, etl_watermarks")
+        self.conn.commit()
+        self.load_with_latest_visits(SAMPLE_DATA)
+        self.assertEqual(fetch_table(self.conn, "current_country", "Customer_Id"), expected)
+
+        # The watermark covers the new rows, so the load stage has nothing left to rank
+        cursor.execute("UPDATE current_country SET Country = 'XX'")
+        self.conn.commit()
+        load_customer_current_country(self.conn)
+        cursor.execute("SELECT DISTINCT Country FROM current_country")
+        self.assertEqual(cursor.fetchall(), [('XX',)])
+
+    def test_only_newer_visits_replace_stored_rows(self):
+        self.load_with_latest_visits(SAMPLE_DATA)
+
+        # An older visit of Emily and a newer one of Lily
+        self.load_with_latest_visits(
+            "|H|Customer_Name|Customer_Id|Open_Date|Last_Consulted_Date|Vaccination_Id|Dr_Name|State|Country|DOB|Is_Active\n"
+            "|D|Emily|100007|20101012|20200101|MVD|Sam|QLD|USA|11111992|A\n"
+            "|D|Lily|100011|20101012|20240105|MVD|Paul|MH|AU|29022000|A\n"
+        )
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT Customer_Id, Country FROM current_country WHERE Customer_Id IN ('100007', '100011') "
+                       "ORDER BY Customer_Id")
+        self.assertEqual(cursor.fetchall(), [('100007', 'AU'), ('100011', 'AU')])
+
+    def test_both_modes_keep_newer_stored_visits(self):
+        # An older visit of Emily, a same-day visit of Emma and a newer one of Lily
+        second_run = (
+            "|H|Customer_Name|Customer_Id|Open_Date|Last_Consulted_Date|Vaccination_Id|Dr_Name|State|Country|DOB|Is_Active\n"
+            "|D|Emily|100007|20101012|20200101|MVD|Sam|QLD|USA|11111992|A\n"
+            "|D|Emma|100008|20101012|20230105|MVD|Paul|FL|USA|24111995|A\n"
+            "|D|Lily|100011|20101012|20240105|MVD|Paul|MH|AU|29022000|A\n"
+        )
+        for data in (SAMPLE_DATA, second_run):
+            stream_data_to_staging(self.conn, StringIO(data), chunksize=2)
+            load_customer_current_country(self.conn)
+        expected = fetch_table(self.conn, "current_country", "Customer_Id")
+        self.assertEqual([(row[0], row[2]) for row in expected],
+                         [('100007', 'AU'), ('100008', 'USA'), ('100010', 'NYC'), ('100011', 'AU')])
+
+        cursor = self.conn.cursor()
+        cursor.execute("TRUNCATE staging, current_country, etl_watermarks")
+        self.conn.commit()
+        for data in (SAMPLE_DATA, second_run):
+            self.load_with_latest_visits(data)
+        self.assertEqual(fetch_table(self.conn, "current_country", "Customer_Id"), expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,40 @@
 import unittest
+from datetime import date
+from io import StringIO
 from unittest.mock import patch, MagicMock
-from etl_scripts import load_customer_current_country
+from etl_scripts import (
+    load_customer_current_country, fill_country_tables, fill_country_tables_streaming, fill_country_tables_parallel,
+    stream_data_to_staging,
+    create_staging_table_with_indexes, create_country_tables, create_country_map_table, create_watermark_table,
+    create_customer_current_country
+)
+from etl_scripts.load_data import (
+    get_watermark, flush_country_buffers, LAST_NEW_ID_SQL, NEW_RECORDS_SQL, COUNTRY_TABLES_STAGE, CURRENT_COUNTRY_STAGE
+)
+from data import country_codes, get_country_name
+from test.db_utils import connect_test_schema, connect_to_schema, drop_test_schema, fetch_table
+
+SAMPLE_DATA = (
+    "|H|Customer_Name|Customer_Id|Open_Date|Last_Consulted_Date|Vaccination_Id|Dr_Name|State|Country|DOB|Is_Active\n"
+    "|D|Emily|100007|20101012|20221001|MVD|Sam|QLD|AU|11111992|A\n"
+    "|D|Emma|100008|20101012|20220105|MVD|Paul|FL|USA|24111995|A\n"
+    "|D|Emma|100008|20101012|20230105|ABC|Paul|FL|IND|24111995|A\n"
+    "|D|Noah|100009|20101012||MVD|Paul|FL|USA||\n"
+    "|D|Liam|100010|20101012|20220105|MVD|Paul|NY|NYC|01011990|A\n"
+    "|D|Lily|100011|20101012|20220105|MVD|Paul|MH|IND|29022000|A\n"
+)
+
+class FailingCommit:
+    """Wraps a connection whose commit fails, as when the server goes away mid-commit."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def commit(self):
+        raise RuntimeError("commit failed")
 
 class TestLoadData(unittest.TestCase):   
     @patch('etl_scripts.load_data.get_connection')
@@ -22,3 +56,188 @@ class TestLoadData(unittest.TestCase):
 
         mock_conn.commit.assert_called_once()  # Check that commit was called
 
+class TestLoadDataDatabase(unittest.TestCase):
+    """Runs the load stage against a real PostgreSQL schema when one is reachable."""
+
+    def setUp(self):
+        self.conn, self.schema = connect_test_schema()
+        create_staging_table_with_indexes(self.conn)
+        create_country_tables(self.conn, country_codes)
+        create_country_map_table(self.conn)
+        create_watermark_table(self.conn)
+        create_customer_current_country(self.conn)
+        stream_data_to_staging(self.conn, StringIO(SAMPLE_DATA), chunksize=2)
+
+    def tearDown(self):
+        drop_test_schema(self.conn, self.schema)
+
+    def snapshot_country_tables(self):
+        return {code: fetch_table(self.conn, f"table_{get_country_name(code)}", "id") for code in country_codes}
+
+    def reset_load(self):
+        cursor = self.conn.cursor()
+        for code in country_codes:
+            cursor.execute(f"TRUNCATE table_{get_country_name(code)}")
+        cursor.execute("UPDATE staging SET processed = FALSE")
+        cursor.execute("DELETE FROM etl_watermarks")
+        self.conn.commit()
+
+    def test_sql_and_python_engines_match(self):
+        today = date(2024, 2, 29)
+        fill_country_tables(self.conn, engine="python", today=today)
+        python_tables = self.snapshot_country_tables()
+
+        self.reset_load()
+        fill_country_tables(self.conn, engine="sql", today=today)
+        sql_tables = self.snapshot_country_tables()
+
+        self.assertEqual(sql_tables, python_tables)
+        self.assertEqual(sum(len(rows) for rows in sql_tables.values()), 5)
+
+        # Every staging row is marked processed, including the unknown country
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM staging WHERE processed = FALSE")
+        self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_streaming_and_python_engines_match(self):
+        today = date(2024, 2, 29)
+        fill_country_tables(self.conn, engine="python", today=today)
+        python_tables = self.snapshot_country_tables()
+
+        # Tiny fetch and flush sizes force several round trips and partial flushes
+        self.reset_load()
+        fill_country_tables_streaming(self.conn, today=today, itersize=2, flush_size=2)
+        self.assertEqual(self.snapshot_country_tables(), python_tables)
+
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM staging WHERE processed = FALSE")
+        self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_interrupted_streaming_load_resumes_after_last_flush(self):
+        today = date(2024, 2, 29)
+        fill_country_tables(self.conn, engine="python", today=today)
+        python_tables = self.snapshot_country_tables()
+        self.reset_load()
+
+        # The third flush fails; the first two stay committed
+        flushes = []
+        def failing_flush(*args):
+            flushes.append(args)
+            if len(flushes) == 3:
+                raise RuntimeError("connection lost")
+            flush_country_buffers(*args)
+
+        with patch('etl_scripts.load_data.flush_country_buffers', side_effect=failing_flush):
+            with self.assertRaises(RuntimeError):
+                fill_country_tables_streaming(self.conn, today=today, itersize=2, flush_size=2)
+        self.conn.rollback()
+        self.assertEqual(get_watermark(self.conn.cursor(), COUNTRY_TABLES_STAGE), flushes[1][3])
+
+        fill_country_tables_streaming(self.conn, today=today, itersize=2, flush_size=2)
+        self.assertEqual(self.snapshot_country_tables(), python_tables)
+
+    def run_parallel(self, today):
+        fill_country_tables_parallel(self.conn, today=today, workers=2,
+                                     acquire=lambda: connect_to_schema(self.schema),
+                                     release=lambda conn: conn.close())
+
+    def test_parallel_and_python_engines_match(self):
+        today = date(2024, 2, 29)
+        fill_country_tables(self.conn, engine="python", today=today)
+        python_tables = self.snapshot_country_tables()
+
+        self.reset_load()
+        self.run_parallel(today)
+        self.assertEqual(self.snapshot_country_tables(), python_tables)
+
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM staging WHERE processed = FALSE")
+        self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_parallel_failure_rolls_back_every_worker(self):
+        # Without table_india one worker fails while the others succeed
+        cursor = self.conn.cursor()
+        cursor.execute("DROP TABLE table_india")
+        self.conn.commit()
+
+        with self.assertRaises(Exception):
+            self.run_parallel(date(2024, 2, 29))
+
+        cursor.execute("SELECT COUNT(*) FROM staging WHERE processed = FALSE")
+        self.assertEqual(cursor.fetchone()[0], 6)
+        for code in country_codes - {"IND"}:
+            self.assertEqual(fetch_table(self.conn, f"table_{get_country_name(code)}", "id"), [])
+
+    def test_parallel_rerun_after_failed_commit_loads_no_duplicates(self):
+        today = date(2024, 2, 29)
+        fill_country_tables(self.conn, engine="python", today=today)
+        python_tables = self.snapshot_country_tables()
+        self.reset_load()
+
+        # The second worker connection fails to commit after the first one has committed
+        acquired = []
+        def acquire():
+            conn = connect_to_schema(self.schema)
+            acquired.append(conn)
+            return FailingCommit(conn) if len(acquired) == 2 else conn
+
+        with self.assertRaises(RuntimeError):
+            fill_country_tables_parallel(self.conn, today=today, workers=2, acquire=acquire,
+                                         release=lambda conn: conn.close())
+        self.assertTrue(any(self.snapshot_country_tables().values()))
+
+        self.run_parallel(today)
+        self.assertEqual(self.snapshot_country_tables(), python_tables)
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM staging WHERE processed = FALSE")
+        self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            fill_country_tables(self.conn, engine="spark")
+
+    def test_watermarks_track_each_stage(self):
+        load_customer_current_country(self.conn)
+        fill_country_tables(self.conn, today=date(2024, 2, 29))
+
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT MAX(id) FROM staging")
+        last_id = cursor.fetchone()[0]
+        self.assertEqual(get_watermark(cursor, CURRENT_COUNTRY_STAGE), last_id)
+        self.assertEqual(get_watermark(cursor, COUNTRY_TABLES_STAGE), last_id)
+
+        # A second run with no new rows changes nothing
+        us_rows = fetch_table(self.conn, "table_united_states", "id")
+        fill_country_tables(self.conn, today=date(2024, 2, 29))
+        self.assertEqual(fetch_table(self.conn, "table_united_states", "id"), us_rows)
+
+    def explain(self, sql, params=None):
+        cursor = self.conn.cursor()
+        cursor.execute(f"EXPLAIN {sql}", params)
+        return "\n".join(row[0] for row in cursor.fetchall())
+
+    def test_incremental_queries_use_indexes(self):
+        # Build a long processed history followed by a small new batch
+        cursor = self.conn.cursor()
+        cursor.execute("UPDATE staging SET processed = TRUE")
+        cursor.execute("""
+        INSERT INTO staging (Customer_Name, Customer_Id, Open_Date, Last_Consulted_Date, Country, processed)
+        SELECT 'History', g::TEXT, DATE '2010-10-12', DATE '2020-01-01' + g % 1000, 'USA', TRUE
+        FROM generate_series(1, 50000) AS g
+        """)
+        self.conn.commit()
+        stream_data_to_staging(self.conn, StringIO(SAMPLE_DATA), chunksize=100)
+        cursor.execute("ANALYZE staging")
+        last_processed_id = get_watermark(cursor, COUNTRY_TABLES_STAGE)
+
+        for sql in (LAST_NEW_ID_SQL, NEW_RECORDS_SQL):
+            plan = self.explain(sql, (last_processed_id,))
+            self.assertNotIn("Seq Scan", plan)
+            self.assertIn("Index", plan)
+
+        # The current_country statement only reaches staging through an index as well
+        mock_conn = MagicMock()
+        load_customer_current_country(mock_conn)
+        sql, params = mock_conn.cursor.return_value.execute.call_args[0]
+        plan = self.explain(sql, params)
+        self.assertNotIn("Seq Scan on staging", plan)
@@ -0,0 +1,101 @@
+import os
+import tempfile
+import unittest
+from io import StringIO
+from etl_scripts import (
+    resolve_input_files, split_byte_ranges, ingest_files, stream_data_to_staging, create_staging_table_with_indexes
+)
+from test.db_utils import connect_test_schema, connect_to_schema, drop_test_schema, fetch_table
+from test.test_load_data import SAMPLE_DATA
+
+class TestParallelIngest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_resolve_input_files(self):
+        first = self.write_file("eu.txt", SAMPLE_DATA)
+        second = self.write_file("apac.txt", SAMPLE_DATA)
+        self.write_file("notes.md", "not an extract")
+
+        self.assertEqual(resolve_input_files(self.tmp_dir.name), [second, first])
+        self.assertEqual(resolve_input_files(os.path.join(self.tmp_dir.name, "e*.txt")), [first])
+        self.assertEqual(resolve_input_files(first), [first])
+        with self.assertRaises(FileNotFoundError):
+            resolve_input_files(os.path.join(self.tmp_dir.name, "*.csv"))
+
+    def test_byte_ranges_cover_every_line_once(self):
+        path = self.write_file("feed.txt", SAMPLE_DATA)
+        with open(path, 'rb') as f:
+            content = f.read()
+        header_end = content.index(b"\n") + 1
+
+        for parts in (1, 2, 3, 4, 50):
+            ranges = split_byte_ranges(path, parts)
+            self.assertLessEqual(len(ranges), parts)
+            self.assertEqual(ranges[0][0], header_end)
+            self.assertEqual(ranges[-1][1], len(content))
+            # Ranges are contiguous and every one ends at a line boundary
+            for (_, end), (start, _) in zip(ranges, ranges[1:]):
+                self.assertEqual(end, start)
+            for start, end in ranges:
+                self.assertTrue(content[start:end].endswith(b"\n"))
+
+class TestParallelIngestDatabase(unittest.TestCase):
+    """Runs parallel ingestion against a real PostgreSQL schema when one is reachable."""
+
+    def setUp(self):
+        self.conn, self.schema = connect_test_schema()
+        create_staging_table_with_indexes(self.conn)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def tearDown(self):
+        drop_test_schema(self.conn, self.schema)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def ingest(self, files, **kwargs):
+        return ingest_files(files, workers=2, copy_connections=2, chunksize=2,
+                            acquire=lambda: connect_to_schema(self.schema),
+                            release=lambda conn: conn.close(), **kwargs)
+
+    def staging_rows(self):
+        return sorted(fetch_table(self.conn, "staging", "id"))
+
+    def test_split_file_matches_single_stream(self):
+        stream_data_to_staging(self.conn, StringIO(SAMPLE_DATA), chunksize=2)
+        expected = self.staging_rows()
+        self.conn.cursor().execute("TRUNCATE staging")
+        self.conn.commit()
+
+        results = self.ingest([self.write_file("feed.txt", SAMPLE_DATA)], split_parts=3)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(result["error"] is None for result in results))
+        self.assertEqual(sum(result["rows_loaded"] for result in results), 6)
+        self.assertEqual(set().union(*(result["countries"] for result in results)), {"AU", "USA", "IND", "NYC"})
+        self.assertEqual(self.staging_rows(), expected)
+
+    def test_errors_are_reported_per_file(self):
+        good = self.write_file("good.txt", SAMPLE_DATA)
+        bad = self.write_file("bad.txt", "|H|Name|Id\n|D|Emily|1\n")
+
+        results = self.ingest([bad, good])
+        self.assertEqual([result["source"] for result in results], [bad, good])
+        self.assertIn("Invalid header", results[0]["error"])
+        self.assertIsNone(results[1]["error"])
+        self.assertEqual(results[1]["rows_loaded"], 6)
+        self.assertEqual(len(self.staging_rows()), 6)
+
+if __name__ == '__main__':
+    unittest.main()
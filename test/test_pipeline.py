@@ -0,0 +1,157 @@
+import time
+import unittest
+from datetime import date
+from io import StringIO
+from unittest.mock import patch
+from etl_scripts import (
+    run_pipeline, run_etl_pipeline, stream_data_to_staging, load_customer_current_country, fill_country_tables,
+    create_staging_table_with_indexes, create_country_map_table, create_country_tables, create_watermark_table,
+    create_customer_current_country, load_fingerprint_index
+)
+from data import country_codes, get_country_name
+from test.db_utils import connect_test_schema, connect_to_schema, drop_test_schema, fetch_table
+from test.test_load_data import SAMPLE_DATA
+
+class TestPipeline(unittest.TestCase):
+    def test_stages_preserve_order_and_report_stats(self):
+        seen = []
+        stats = run_pipeline("numbers", range(10), [
+            ("double", lambda n: n * 2),
+            ("collect", seen.append),
+        ], queue_depth=1)
+
+        self.assertEqual(seen, [n * 2 for n in range(10)])
+        self.assertEqual(list(stats), ["numbers", "double", "collect"])
+        for stage_stats in stats.values():
+            self.assertEqual(stage_stats["items"], 10)
+            self.assertGreaterEqual(stage_stats["utilisation"], 0.0)
+            self.assertLessEqual(stage_stats["utilisation"], 1.0)
+
+    def test_backpressure_bounds_work_in_flight(self):
+        produced = []
+        consumed = []
+        in_flight = []
+
+        def source():
+            for n in range(20):
+                produced.append(n)
+                in_flight.append(len(produced) - len(consumed))
+                yield n
+
+        def slow_sink(n):
+            time.sleep(0.005)
+            consumed.append(n)
+
+        stats = run_pipeline("source", source(), [("sink", slow_sink)], queue_depth=2)
+        # One item in the queue slots, one being handed over and one being consumed
+        self.assertLessEqual(max(in_flight), 2 + 2)
+        self.assertGreater(stats["source"]["blocked_seconds"], 0.0)
+
+    def test_stage_errors_stop_the_pipeline(self):
+        def fail_on_three(n):
+            if n == 3:
+                raise ValueError("bad item")
+            return n
+
+        seen = []
+        with self.assertRaisesRegex(RuntimeError, "'check' failed: bad item"):
+            run_pipeline("numbers", iter(range(1000)), [("check", fail_on_three), ("collect", seen.append)])
+        self.assertEqual(seen, [0, 1, 2])
+
+    def test_rejects_empty_queues(self):
+        with self.assertRaises(ValueError):
+            run_pipeline("numbers", range(3), [("noop", lambda n: n)], queue_depth=0)
+
+class TestPipelineDatabase(unittest.TestCase):
+    """Runs the pipelined ETL against a real PostgreSQL schema when one is reachable."""
+
+    def setUp(self):
+        self.conn, self.schema = connect_test_schema()
+        create_staging_table_with_indexes(self.conn)
+        create_country_map_table(self.conn)
+        create_watermark_table(self.conn)
+        create_customer_current_country(self.conn)
+
+    def tearDown(self):
+        drop_test_schema(self.conn, self.schema)
+
+    def snapshot(self):
+        tables = {"current_country": fetch_table(self.conn, "current_country", "Customer_Id")}
+        cursor = self.conn.cursor()
+        for code in country_codes:
+            table_name = f"table_{get_country_name(code)}"
+            cursor.execute("SELECT to_regclass(%s)", (table_name,))
+            if cursor.fetchone()[0]:
+                tables[table_name] = fetch_table(self.conn, table_name, "Customer_Id")
+        return tables
+
+    def test_pipeline_matches_sequential_run(self):
+        today = date(2024, 2, 29)
+        _, _, countries = stream_data_to_staging(self.conn, StringIO(SAMPLE_DATA), chunksize=2)
+        create_country_tables(self.conn, countries)
+        load_customer_current_country(self.conn)
+        fill_country_tables(self.conn, today=today)
+        expected = self.snapshot()
+
+        # Start over and run every stage concurrently, one chunk of two rows at a time
+        cursor = self.conn.cursor()
+        for table_name in expected:
+            cursor.execute(f"DROP TABLE {table_name}")
+        cursor.execute("TRUNCATE staging")
+        cursor.execute("DELETE FROM etl_watermarks")
+        self.conn.commit()
+        create_customer_current_country(self.conn)
+
+        route_conn = connect_to_schema(self.schema)
+        try:
+            stats = run_etl_pipeline(self.conn, route_conn, StringIO(SAMPLE_DATA), chunksize=2, queue_depth=1,
+                                     today=today)
+        finally:
+            route_conn.close()
+
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(list(stats), ["read", "validate", "encode", "load", "route"])
+        self.assertEqual(stats["load"]["items"], 3)
+        cursor.execute("SELECT COUNT(*) FROM staging WHERE processed = FALSE")
+        self.assertEqual(cursor.fetchone()[0], 0)
+
+    def run_skipping_unchanged(self, route):
+        route_conn = connect_to_schema(self.schema)
+        try:
+            with patch('etl_scripts.pipeline.fill_country_tables', side_effect=route):
+                run_etl_pipeline(self.conn, route_conn, StringIO(SAMPLE_DATA), chunksize=2, queue_depth=1,
+                                 today=date(2024, 2, 29), change_index=load_fingerprint_index(self.conn))
+        finally:
+            route_conn.close()
+
+    def country_rows(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM table_australia")
+        rows = cursor.fetchone()[0]
+        for table_name in ("table_united_states", "table_india"):
+            cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+            rows += cursor.fetchone()[0]
+        return rows
+
+    def test_rerun_after_failed_run_skips_routed_rows(self):
+        create_country_tables(self.conn, country_codes)
+        routed = []
+        def failing_route(conn, engine, today=None):
+            routed.append(engine)
+            if len(routed) == 2:
+                raise RuntimeError("route failed")
+            fill_country_tables(conn, engine, today=today)
+
+        with self.assertRaises(RuntimeError):
+            self.run_skipping_unchanged(failing_route)
+        self.conn.rollback()
+
+        # Committed chunks keep their fingerprints, so the rerun sends only the rest
+        self.run_skipping_unchanged(fill_country_tables)
+        self.assertEqual(self.country_rows(), 5)
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM staging")
+        self.assertEqual(cursor.fetchone()[0], 6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import unittest
+from datetime import date
+from io import StringIO
+from etl_scripts import (
+    create_partitioned_staging_table, start_staging_batch, rotate_staging_partitions,
+    start_bulk_staging_batch, finish_bulk_staging_batch,
+    stream_data_to_staging, create_country_tables, create_country_map_table, create_watermark_table,
+    create_customer_current_country, load_customer_current_country, fill_country_tables
+)
+from data import country_codes
+from test.db_utils import connect_test_schema, drop_test_schema
+from test.test_load_data import SAMPLE_DATA
+
+class TestStagingPartitions(unittest.TestCase):
+    """Runs batch partitioning and retention against a real PostgreSQL schema when one is reachable."""
+
+    def setUp(self):
+        self.conn, self.schema = connect_test_schema()
+        create_partitioned_staging_table(self.conn)
+        create_country_tables(self.conn, country_codes)
+        create_country_map_table(self.conn)
+        create_watermark_table(self.conn)
+        create_customer_current_country(self.conn)
+
+    def tearDown(self):
+        drop_test_schema(self.conn, self.schema)
+
+    def load_batch(self):
+        batch_id, table_name = start_staging_batch(self.conn, 'sample')
+        stream_data_to_staging(self.conn, StringIO(SAMPLE_DATA), chunksize=2, table=table_name)
+        return batch_id
+
+    def run_load(self):
+        load_customer_current_country(self.conn)
+        fill_country_tables(self.conn, today=date(2024, 2, 29))
+
+    def partitions(self):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'staging'::regclass ORDER BY c.relname
+        """)
+        return [row[0] for row in cursor.fetchall()]
+
+    def test_rows_are_loaded_per_batch(self):
+        first, second = self.load_batch(), self.load_batch()
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT Batch_Id, COUNT(*) FROM staging GROUP BY Batch_Id ORDER BY Batch_Id")
+        self.assertEqual(cursor.fetchall(), [(first, 6), (second, 6)])
+
+        # The incremental load works unchanged on the partitioned table
+        self.run_load()
+        cursor.execute("SELECT COUNT(*) FROM table_united_states")
+        self.assertEqual(cursor.fetchone()[0], 4)
+
+    def test_rotation_keeps_newest_and_unprocessed_batches(self):
+        first, second = self.load_batch(), self.load_batch()
+        self.run_load()
+        third = self.load_batch()
+
+        # Only the first batch is beyond the newest two
+        self.assertEqual(rotate_staging_partitions(self.conn, keep_batches=2), [first])
+        self.assertEqual(self.partitions(), [f"staging_b{second}", f"staging_b{third}"])
+
+        # The unprocessed third batch survives even when nothing is kept
+        self.assertEqual(rotate_staging_partitions(self.conn, keep_batches=0), [second])
+        self.assertEqual(self.partitions(), [f"staging_b{third}"])
+
+    def test_rotation_can_archive(self):
+        first = self.load_batch()
+        self.run_load()
+        self.load_batch()
+
+        self.assertEqual(rotate_staging_partitions(self.conn, keep_batches=1, archive=True), [first])
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM staging_archive.staging_b{first}")
+        self.assertEqual(cursor.fetchone()[0], 6)
+        cursor.execute("DROP SCHEMA staging_archive CASCADE")
+        self.conn.commit()
+
+    def test_regular_staging_table_is_rejected(self):
+        cursor = self.conn.cursor()
+        cursor.execute("DROP TABLE staging")
+        cursor.execute("CREATE TABLE staging (id SERIAL PRIMARY KEY)")
+        self.conn.commit()
+        with self.assertRaises(ValueError):
+            create_partitioned_staging_table(self.conn)
+
+    def bulk_load_batch(self, mode):
+        batch_id, table_name = start_bulk_staging_batch(self.conn, 'sample')
+        self.assertNotIn(table_name, self.partitions())
+        stream_data_to_staging(self.conn, StringIO(SAMPLE_DATA), chunksize=2, table=table_name)
+        finish_bulk_staging_batch(self.conn, batch_id, mode)
+        return batch_id, table_name
+
+    def persistence(self, relname):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT relpersistence FROM pg_class WHERE oid = to_regclass(%s)", (relname,))
+        return cursor.fetchone()[0]
+
+    def test_bulk_load_attaches_indexed_partition(self):
+        for mode, expected in (("logged", "p"), ("unlogged", "u")):
+            batch_id, table_name = self.bulk_load_batch(mode)
+            self.assertIn(table_name, self.partitions())
+            self.assertEqual(self.persistence(table_name), expected)
+
+            # The partition's indexes were attached to the parent's partitioned indexes
+            cursor = self.conn.cursor()
+            cursor.execute("""
+            SELECT COUNT(*) FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE c.relkind = 'i' AND c.relname LIKE %s
+            """, (f"{table_name}%",))
+            self.assertEqual(cursor.fetchone()[0], 3)
+
+        self.run_load()
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM staging WHERE processed = TRUE")
+        self.assertEqual(cursor.fetchone()[0], 12)
+
+    def test_rotation_skips_batch_whose_bulk_load_failed(self):
+        # The first batch is registered but its load fails before it is attached
+        _, failed_table = start_bulk_staging_batch(self.conn, 'sample')
+        loaded, _ = self.bulk_load_batch("logged")
+        self.run_load()
+        self.load_batch()
+
+        self.assertEqual(rotate_staging_partitions(self.conn, keep_batches=1, archive=True), [loaded])
+        self.assertEqual(rotate_staging_partitions(self.conn, keep_batches=0), [])
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (failed_table,))
+        self.assertTrue(cursor.fetchone()[0])
+        cursor.execute("DROP SCHEMA staging_archive CASCADE")
+        self.conn.commit()
+
+    def test_unknown_bulk_load_mode(self):
+        batch_id, _ = start_bulk_staging_batch(self.conn, 'sample')
+        with self.assertRaises(ValueError):
+            finish_bulk_staging_batch(self.conn, batch_id, "fsync-off")
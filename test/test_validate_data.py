@@ -1,8 +1,13 @@
+import os
+import subprocess
+import sys
 import unittest
 import pandas as pd
 from io import StringIO
 from unittest.mock import patch, mock_open, MagicMock, call
-from etl_scripts import preprocess_data, copy_data_to_staging, create_staging_table_with_indexes
+from etl_scripts import preprocess_data, copy_data_to_staging, create_staging_table_with_indexes, clean_chunk, stream_data_to_staging
+from etl_scripts import validate_data
+from etl_scripts.validate_data import iter_cleaned_chunks, new_vocabularies, used_categories, CATEGORICAL_COLUMNS
 
 class TestValidateData(unittest.TestCase):
 
@@ -119,3 +124,96 @@ class TestValidateData(unittest.TestCase):
 
         mock_conn.commit.assert_called_once()
 
+    def test_stream_data_to_staging(self):
+        # Mock database connection and cursor; COPY drains the piped stream
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value = mock_cursor
+        copied = []
+        mock_cursor.copy_expert.side_effect = lambda sql, stream, size: copied.append(stream.read().decode())
+
+        # Stream the sample data two rows at a time
+        raw = self.sample_data.getvalue()
+        rows_read, rows_loaded, unique_countries = stream_data_to_staging(mock_conn, StringIO(raw), chunksize=2)
+
+        # Compare against cleaning the whole file in one pass
+        full_df = clean_chunk(pd.read_csv(StringIO(raw), delimiter='|', dtype=str))
+        self.assertEqual(rows_read, 3)
+        self.assertEqual(rows_loaded, len(full_df))
+        self.assertEqual(unique_countries, set(full_df['Country'].dropna().unique()))
+
+        # A single COPY carries every chunk as headerless cleaned rows, committed once
+        mock_cursor.copy_expert.assert_called_once()
+        self.assertEqual(copied, [full_df.to_csv(sep='|', index=False, header=False)])
+        mock_conn.commit.assert_called_once()
+
+    def test_stream_data_to_staging_debug_file(self):
+        mock_conn = MagicMock()
+        mock_conn.cursor.return_value.copy_expert.side_effect = lambda sql, stream, size: stream.read()
+
+        # The cleaned rows are only written to disk when a debug path is requested
+        with patch('builtins.open', new_callable=mock_open) as mock_file:
+            stream_data_to_staging(mock_conn, StringIO(self.sample_data.getvalue()), chunksize=2,
+                                   debug_file_path='debug_cleaned.csv')
+        mock_file.assert_called_once_with('debug_cleaned.csv', 'w')
+        mock_file.return_value.close.assert_called_once()
+
+    def test_categorical_columns_share_codes_across_chunks(self):
+        vocabularies = new_vocabularies()
+        chunks = [chunk for _, chunk in iter_cleaned_chunks(StringIO(self.sample_data.getvalue()), 1, vocabularies)]
+
+        # Low-cardinality columns stay dictionary-encoded after cleaning
+        for chunk in chunks:
+            for col in CATEGORICAL_COLUMNS:
+                self.assertIsInstance(chunk[col].dtype, pd.CategoricalDtype)
+
+        # New values extend the shared vocabulary, so earlier codes never change
+        self.assertEqual(chunks[0]['Dr_Name'].cat.categories.tolist(), ['Sam'])
+        self.assertEqual(chunks[1]['Dr_Name'].cat.categories.tolist(), ['Sam', 'Paul'])
+        self.assertEqual(chunks[1]['Dr_Name'].cat.codes.iloc[0], 1)
+        self.assertTrue(chunks[0]['Country'].cat.categories.equals(chunks[1]['Country'].cat.categories))
+        self.assertEqual(used_categories(chunks[0]['Country']), {'AU'})
+        self.assertEqual(used_categories(pd.concat(chunks)['Country']), {'AU', 'USA'})
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        # Keep a pool opened by other tests out of the way
+        self.saved_pool = validate_data._db_pool
+
+    def tearDown(self):
+        validate_data._db_pool = self.saved_pool
+
+    def test_connection_params_come_from_the_environment(self):
+        params = validate_data.connection_params({"PGHOST": "db.internal", "PGPORT": "6432", "PGUSER": "etl"})
+        self.assertEqual(params, {"host": "db.internal", "port": "6432", "database": "my_database",
+                                  "user": "etl", "password": "admin"})
+
+    @patch.dict('os.environ', {"ETL_DB_POOL_MIN": "0", "ETL_DB_POOL_MAX": "4"})
+    @patch('etl_scripts.validate_data.pool.ThreadedConnectionPool')
+    def test_pool_is_created_on_first_use(self, mock_pool_class):
+        validate_data._db_pool = None
+        conn = validate_data.get_connection()
+        validate_data.release_connection(conn)
+        validate_data.get_connection()
+
+        mock_pool_class.assert_called_once()
+        self.assertEqual(mock_pool_class.call_args.args, (0, 4))
+        self.assertEqual(mock_pool_class.return_value.getconn.call_count, 2)
+        mock_pool_class.return_value.putconn.assert_called_once_with(conn)
+
+        validate_data.close_pool()
+        mock_pool_class.return_value.closeall.assert_called_once()
+        self.assertIsNone(validate_data._db_pool)
+
+    def test_import_does_not_connect_or_load_pandas(self):
+        # An unroutable database would make a connecting import hang or fail
+        code = ("import sys, etl_scripts, main; "
+                "print(etl_scripts.validate_data._db_pool, "
+                "[m for m in ('pandas', 'numpy', 'psycopg2.extras') if m in sys.modules])")
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=30,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env={"PGHOST": "192.0.2.1", "PGPORT": "1", "PATH": ""})
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "None []")
+
+if __name__ == '__main__':
+    unittest.main()
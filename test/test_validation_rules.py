@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from io import StringIO
+import pandas as pd
+from etl_scripts.validate_data import READ_DTYPES, iter_cleaned_chunks
+from etl_scripts.validation_rules import (
+    Rule, RejectWriter, apply_rules, REJECT, REJECT_COLUMNS, VALIDATION_RULES
+)
+
+HEADER = "|H|Customer_Name|Customer_Id|Open_Date|Last_Consulted_Date|Vaccination_Id|Dr_Name|State|Country|DOB|Is_Active\n"
+
+REJECT_DATA = (
+    HEADER +
+    "|D|Emily|100007|20101012|20221001|MVD|Sam|QLD|AU|11111992|A\n"
+    "|D||100008|20101312|20220105|MVD|Paul|FL|USA|24111995|A\n"
+    "|D|Noah|1000051333345678901245678784651|20101012||MVD|Paul|FL|USA||A\n"
+    "|D|Liam|100010|20101012|20220105|MVD|Paul|NY|NYC|01011990|A\n"
+    "|D|Lily|100011|20101012|20229999|MVD|Paul|MH|IND|31022000|A  \n"
+)
+
+def raw_frame(data=REJECT_DATA, categorical=True):
+    df = pd.read_csv(StringIO(data), delimiter='|', dtype=READ_DTYPES if categorical else str)
+    return df.drop(columns=['Unnamed: 0', 'H'])
+
+class TestValidationRules(unittest.TestCase):
+    def test_rows_are_reported_with_reason_codes(self):
+        valid_data, rejects = apply_rules(raw_frame())
+
+        self.assertEqual(valid_data['Customer_Id'].tolist(), ['100007', '100010', '100011'])
+        self.assertEqual(list(rejects.columns), REJECT_COLUMNS)
+        self.assertEqual(rejects[['Customer_Id', 'Loaded', 'Reason_Codes']].values.tolist(), [
+            ['100008', 'N', 'CUSTOMER_NAME_MISSING;OPEN_DATE_INVALID'],
+            ['1000051333345678901245678784651', 'N', 'CUSTOMER_ID_TOO_LONG'],
+            ['100010', 'Y', 'COUNTRY_NOT_ALLOWED'],
+            ['100011', 'Y', 'LAST_CONSULTED_DATE_INVALID;DOB_INVALID'],
+        ])
+        # The reject output keeps the raw text of the dates
+        self.assertEqual(rejects['Open_Date'].tolist(), ['20101312', '20101012', '20101012', '20101012'])
+
+    def test_invalid_optional_dates_are_loaded_as_null(self):
+        valid_data, _ = apply_rules(raw_frame())
+        lily = valid_data[valid_data['Customer_Id'] == '100011'].iloc[0]
+        self.assertTrue(pd.isna(lily['Last_Consulted_Date']))
+        self.assertTrue(pd.isna(lily['DOB']))
+        self.assertEqual(str(valid_data['Open_Date'].dtype), 'datetime64[ns]')
+
+    def test_trailing_spaces_do_not_count_towards_length(self):
+        # 'A  ' fits CHAR(1) because PostgreSQL drops the excess spaces
+        _, rejects = apply_rules(raw_frame())
+        self.assertNotIn('IS_ACTIVE_TOO_LONG', ';'.join(rejects['Reason_Codes']))
+
+    def test_categorical_and_text_columns_give_the_same_result(self):
+        valid_data, rejects = apply_rules(raw_frame())
+        text_valid, text_rejects = apply_rules(raw_frame(categorical=False))
+        self.assertEqual(valid_data.astype(str).values.tolist(), text_valid.astype(str).values.tolist())
+        self.assertEqual(rejects['Reason_Codes'].tolist(), text_rejects['Reason_Codes'].tolist())
+
+    def test_rules_are_declarative(self):
+        # Rejecting unknown countries only takes a different action on the same rule
+        rules = [rule._replace(action=REJECT) if rule.code == 'COUNTRY_NOT_ALLOWED' else rule
+                 for rule in VALIDATION_RULES]
+        valid_data, _ = apply_rules(raw_frame(), rules)
+        self.assertEqual(valid_data['Customer_Id'].tolist(), ['100007', '100011'])
+
+        with self.assertRaises(ValueError):
+            apply_rules(raw_frame(), [Rule("NAME_UPPER", "upper_case", "Customer_Name", None, REJECT)])
+
+    def test_no_failures_give_an_empty_reject_frame(self):
+        _, rejects = apply_rules(raw_frame(HEADER + "|D|Emily|100007|20101012|20221001|MVD|Sam|QLD|AU|11111992|A\n"))
+        self.assertEqual(len(rejects), 0)
+        self.assertEqual(list(rejects.columns), REJECT_COLUMNS)
+
+    def test_reject_writer_collects_every_chunk(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "rejects.txt")
+            rejects = RejectWriter(path)
+            loaded = sum(len(chunk) for _, chunk in iter_cleaned_chunks(StringIO(REJECT_DATA), 2, rejects=rejects))
+
+            self.assertEqual(loaded, 3)
+            self.assertEqual(rejects.rows, 4)
+            written = pd.read_csv(path, delimiter='|', dtype=str)
+            self.assertEqual(list(written.columns), REJECT_COLUMNS)
+            self.assertEqual(written['Loaded'].tolist(), ['N', 'N', 'Y', 'Y'])
+
+if __name__ == '__main__':
+    unittest.main()